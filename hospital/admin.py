@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import DiseaseType, Issue, Appointment, Doctor, Patient
+from .models import AlertRule, DiseaseType, Issue, Appointment, Doctor, Patient
 
 @admin.register(Doctor)
 class DoctorAdmin(admin.ModelAdmin):
@@ -48,3 +48,10 @@ class AppointmentAdmin(admin.ModelAdmin):
     def get_doctor_name(self, obj):
         return f"Dr. {obj.doctor.user.get_full_name()}"
     get_doctor_name.short_description = 'Doctor'
+
+@admin.register(AlertRule)
+class AlertRuleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'expression', 'sustained_readings', 'urgency', 'enabled', 'updated_at')
+    list_editable = ('enabled',)
+    list_filter = ('enabled', 'urgency')
+    search_fields = ('name', 'expression', 'description')
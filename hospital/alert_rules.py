@@ -0,0 +1,218 @@
+"""
+Threshold rules evaluated alongside the risk model.
+
+An AlertRule's expression is a condition over one reading, such as ``spo2 < 90`` or
+``map < 65 or (hr > 130 and sbp < 90)``. Each expression is parsed once into closures
+over NumPy arrays, so a chunk is evaluated with a few array operations per rule rather
+than per row. The columns a chunk needs are converted to float arrays once and shared
+by every rule, and a sub-condition used by several rules (``spo2 < 90`` on its own and
+inside a longer expression) is computed once per chunk.
+
+A rule fires once its condition has held for ``sustained_readings`` consecutive
+readings, with the same run detection and cooldown as model alerts.
+"""
+import ast
+import operator
+
+import numpy as np
+
+# Names usable in rule expressions and the columns they read
+RULE_VARIABLES = {
+    'hr': 'Heart Rate',
+    'rr': 'Respiratory Rate',
+    'temp': 'Body Temperature',
+    'spo2': 'Oxygen Saturation',
+    'sbp': 'Systolic Blood Pressure',
+    'dbp': 'Diastolic Blood Pressure',
+    'map': 'Derived_MAP',
+    'pulse_pressure': 'Derived_Pulse_Pressure',
+    'hrv': 'Derived_HRV',
+    'bmi': 'Derived_BMI',
+    'age': 'Age',
+}
+
+COMPARISONS = {
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+}
+
+ARITHMETIC = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+}
+
+
+# What a compiled node evaluates to: a boolean mask, or a number or array of numbers
+MASK = 'mask'
+VALUE = 'value'
+
+
+class RuleExpressionError(ValueError):
+    pass
+
+
+def compile_expression(expression):
+    """
+    Compile a rule expression into a function of (columns, memo) returning a boolean mask.
+
+    `columns` maps column names to float arrays of one chunk, and `memo` caches the masks
+    of conditions already evaluated on that chunk. Raises RuleExpressionError if the
+    expression uses anything but the names in RULE_VARIABLES, numbers, arithmetic,
+    comparisons, and/or/not.
+    """
+    try:
+        tree = ast.parse(expression.strip(), mode='eval').body
+    except SyntaxError as e:
+        raise RuleExpressionError(f"Invalid expression: {e.msg}")
+    evaluate, kind = _compile_node(tree)
+    if kind != MASK:
+        raise RuleExpressionError("The expression must be a condition, such as 'spo2 < 90'")
+    return evaluate
+
+
+def _memoized(node, evaluate):
+    key = ast.dump(node)
+
+    def cached(columns, memo):
+        mask = memo.get(key)
+        if mask is None:
+            mask = memo[key] = evaluate(columns, memo)
+        return mask
+    return cached
+
+
+def _compile_as(node, expected):
+    """Compile a node that has to evaluate to `expected`"""
+    evaluate, kind = _compile_node(node)
+    if kind != expected:
+        if expected == MASK:
+            raise RuleExpressionError(f"'{ast.unparse(node)}' is not a condition; compare it, e.g. '{ast.unparse(node)} > 0'")
+        raise RuleExpressionError(f"'{ast.unparse(node)}' is a condition where a number is needed")
+    return evaluate
+
+
+def _compile_node(node):
+    """Compile a node into (function of (columns, memo), MASK or VALUE)"""
+    if isinstance(node, ast.BoolOp):
+        parts = [_compile_as(value, MASK) for value in node.values]
+        combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        return _memoized(node, lambda columns, memo: combine.reduce([part(columns, memo) for part in parts])), MASK
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        operand = _compile_as(node.operand, MASK)
+        return _memoized(node, lambda columns, memo: ~operand(columns, memo)), MASK
+
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        operand = _compile_as(node.operand, VALUE)
+        return (lambda columns, memo: -operand(columns, memo)), VALUE
+
+    if isinstance(node, ast.Compare):
+        # Chained comparisons such as 60 < hr < 100 hold when every link does
+        operands = [_compile_as(operand, VALUE) for operand in [node.left] + node.comparators]
+        links = []
+        for op, left, right in zip(node.ops, operands, operands[1:]):
+            if type(op) not in COMPARISONS:
+                raise RuleExpressionError(f"Unsupported comparison: {type(op).__name__}")
+            links.append((COMPARISONS[type(op)], left, right))
+
+        def compare(columns, memo):
+            masks = [compare_op(left(columns, memo), right(columns, memo)) for compare_op, left, right in links]
+            mask = np.logical_and.reduce(masks) if len(masks) > 1 else masks[0]
+            # A comparison between two numbers is the same for every reading
+            return np.broadcast_to(mask, (columns.rows,))
+        return _memoized(node, compare), MASK
+
+    if isinstance(node, ast.BinOp):
+        if type(node.op) not in ARITHMETIC:
+            raise RuleExpressionError(f"Unsupported operator: {type(node.op).__name__}")
+        arithmetic_op = ARITHMETIC[type(node.op)]
+        left, right = _compile_as(node.left, VALUE), _compile_as(node.right, VALUE)
+        return (lambda columns, memo: arithmetic_op(left(columns, memo), right(columns, memo))), VALUE
+
+    if isinstance(node, ast.Name):
+        if node.id not in RULE_VARIABLES:
+            raise RuleExpressionError(
+                f"Unknown name '{node.id}'; use one of {', '.join(sorted(RULE_VARIABLES))}")
+        column = RULE_VARIABLES[node.id]
+        return (lambda columns, memo: columns[column]), VALUE
+
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        value = float(node.value)
+        return (lambda columns, memo: value), VALUE
+
+    raise RuleExpressionError(f"Unsupported syntax: {ast.unparse(node)}")
+
+
+def expression_columns(expression):
+    """Columns read by an expression"""
+    names = {node.id for node in ast.walk(ast.parse(expression.strip(), mode='eval'))
+             if isinstance(node, ast.Name)}
+    return {RULE_VARIABLES[name] for name in names if name in RULE_VARIABLES}
+
+
+class ChunkColumns(dict):
+    """A chunk's columns as float arrays, converted the first time a rule reads them"""
+
+    def __init__(self, df):
+        super().__init__()
+        self.df = df
+        self.rows = len(df)
+
+    def __missing__(self, column):
+        values = self[column] = self.df[column].to_numpy(dtype=float, na_value=np.nan)
+        return values
+
+
+class CompiledRule:
+    """An AlertRule ready to evaluate: its settings and compiled expression"""
+
+    def __init__(self, rule):
+        self.id = rule.id
+        self.name = rule.name
+        self.expression = rule.expression
+        self.urgency = rule.urgency
+        self.threshold = max(rule.sustained_readings, 1)
+        self.cooldown = rule.cooldown_seconds
+        self.evaluate = compile_expression(rule.expression)
+        self.columns = expression_columns(rule.expression)
+
+
+class RuleSet:
+    """The enabled rules, compiled once and evaluated together on each chunk"""
+
+    def __init__(self, rules):
+        self.rules = []
+        for rule in rules:
+            try:
+                self.rules.append(CompiledRule(rule))
+            except RuleExpressionError as e:
+                # Admin validates expressions, but rows can be written around it
+                print(f"Skipping alert rule {rule.name!r}: {e}")
+        self.columns = set().union(*(rule.columns for rule in self.rules))
+        self.ids = [rule.id for rule in self.rules]
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def __len__(self):
+        return len(self.rules)
+
+    def masks(self, df):
+        """(rule, mask) for every rule on a chunk, sharing columns and common conditions; rules that fail are skipped"""
+        columns = ChunkColumns(df)
+        memo = {}
+        masks = []
+        with np.errstate(all='ignore'):
+            for rule in self.rules:
+                try:
+                    masks.append((rule, np.asarray(rule.evaluate(columns, memo), dtype=bool)))
+                except Exception as e:
+                    # One broken rule must not stop the model and the other rules
+                    print(f"Error evaluating alert rule {rule.name!r}, skipping it: {e}")
+        return masks
@@ -7,3 +7,4 @@ class HospitalConfig(AppConfig):
 
     def ready(self):
         import hospital.models  # noqa
+        import hospital.signals  # noqa
@@ -0,0 +1,172 @@
+"""
+NumPy evaluator for the vitals risk pipeline.
+
+compile_pipeline() flattens the fitted sklearn pipeline (StandardScaler and
+OneHotEncoder in a ColumnTransformer, then a DecisionTreeClassifier) into plain
+arrays, which are saved as an .npz next to the pickle. CompiledVitalsModel scores
+rows from those arrays with a few vectorized passes, without importing sklearn.
+"""
+import io
+
+import numpy as np
+
+# Marks a leaf in the children arrays, as in sklearn's tree_ structure
+TREE_LEAF = -1
+
+# Rows walked down the tree together; small enough for the gathers to stay in cache
+APPLY_BLOCK_ROWS = 8192
+
+
+def compile_pipeline(pipeline, source_version=''):
+    """Extract the arrays CompiledVitalsModel needs from a fitted sklearn pipeline"""
+    preprocessor = pipeline.steps[0][1]
+    tree_model = pipeline.steps[-1][1]
+    if len(pipeline.steps) != 2:
+        raise ValueError("Expected a pipeline of a ColumnTransformer followed by a decision tree")
+
+    numeric_columns, means, scales = [], [], []
+    categorical_columns, category_values, category_column = [], [], []
+    handle_unknown = []
+    for name, transformer, columns in preprocessor.transformers_:
+        if name == 'remainder' or transformer == 'drop':
+            continue
+        kind = type(transformer).__name__
+        if kind == 'StandardScaler':
+            if categorical_columns:
+                raise ValueError("Numeric columns must come before categorical ones")
+            n = len(columns)
+            numeric_columns.extend(columns)
+            means.extend(transformer.mean_ if transformer.with_mean else np.zeros(n))
+            scales.extend(transformer.scale_ if transformer.with_std else np.ones(n))
+        elif kind == 'OneHotEncoder':
+            if transformer.drop is not None:
+                raise ValueError("OneHotEncoder with drop= is not supported")
+            for column, categories in zip(columns, transformer.categories_):
+                category_column.extend([len(categorical_columns)] * len(categories))
+                category_values.extend(str(c) for c in categories)
+                categorical_columns.append(column)
+                handle_unknown.append(transformer.handle_unknown == 'ignore')
+        else:
+            raise ValueError(f"Can't compile a {kind} step")
+
+    tree = tree_model.tree_
+    missing_go_to_left = getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count, dtype=np.uint8))
+    return {
+        'numeric_columns': np.array(numeric_columns, dtype=str),
+        'means': np.asarray(means, dtype=np.float64),
+        'scales': np.asarray(scales, dtype=np.float64),
+        'categorical_columns': np.array(categorical_columns, dtype=str),
+        'category_values': np.array(category_values, dtype=str),
+        'category_column': np.asarray(category_column, dtype=np.int64),
+        'ignore_unknown': np.asarray(handle_unknown, dtype=bool),
+        'feature': tree.feature.astype(np.int64),
+        'threshold': tree.threshold.astype(np.float64),
+        'children_left': tree.children_left.astype(np.int64),
+        'children_right': tree.children_right.astype(np.int64),
+        'missing_go_to_left': np.asarray(missing_go_to_left, dtype=bool),
+        'value': tree.value[:, 0, :].astype(np.float64),
+        'classes': np.array([str(c) for c in tree_model.classes_], dtype=str),
+        'max_depth': np.array(tree.max_depth, dtype=np.int64),
+        'source_version': np.array(source_version, dtype=str),
+    }
+
+
+def save_compiled_model(arrays, path):
+    np.savez_compressed(path, **arrays)
+
+
+class CompiledVitalsModel:
+    """Vectorized predict() over arrays produced by compile_pipeline()"""
+
+    def __init__(self, arrays):
+        self.numeric_columns = arrays['numeric_columns'].tolist()
+        self.means = arrays['means']
+        self.scales = arrays['scales']
+        self.categorical_columns = arrays['categorical_columns'].tolist()
+        self.category_values = arrays['category_values']
+        self.category_column = arrays['category_column']
+        self.ignore_unknown = arrays['ignore_unknown']
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.children_left = arrays['children_left']
+        self.children_right = arrays['children_right']
+        self.missing_go_to_left = arrays['missing_go_to_left']
+        self.classes = arrays['classes'].astype(object)
+        self.max_depth = int(arrays['max_depth'])
+        self.source_version = str(arrays['source_version'])
+        # Class with the most weight at every node; only the leaves' entries are used
+        self.node_class = np.argmax(arrays['value'], axis=1)
+        self.n_features = len(self.numeric_columns) + len(self.category_values)
+
+        # Traversal tables: leaves point back at themselves so every row can take the
+        # same number of steps, and children are interleaved as [left, right] pairs
+        leaf = self.children_left == TREE_LEAF
+        nodes = np.arange(len(leaf))
+        self.step_feature = np.where(leaf, 0, self.feature).astype(np.intp)
+        self.step_children = np.stack([
+            np.where(leaf, nodes, self.children_left),
+            np.where(leaf, nodes, self.children_right),
+        ], axis=1).ravel().astype(np.intp)
+        # x <= t for a float32 x is x <= (t rounded down to float32), so compare in float32
+        threshold32 = self.threshold.astype(np.float32)
+        rounded_up = threshold32.astype(np.float64) > self.threshold
+        threshold32[rounded_up] = np.nextafter(threshold32[rounded_up], np.float32(-np.inf))
+        self.step_threshold = threshold32
+
+    @classmethod
+    def from_bytes(cls, payload):
+        with np.load(io.BytesIO(payload), allow_pickle=False) as arrays:
+            return cls({name: arrays[name] for name in arrays.files})
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+    def transform(self, df):
+        """Scaled and one-hot encoded features, as the tree sees them (float32)"""
+        n = len(df)
+        X = np.empty((n, self.n_features), dtype=np.float64)
+        k = len(self.numeric_columns)
+        X[:, :k] = (df[self.numeric_columns].to_numpy(dtype=np.float64) - self.means) / self.scales
+
+        offset = k
+        for i, column in enumerate(self.categorical_columns):
+            values = df[column]
+            matched = np.zeros(n, dtype=bool)
+            for category in self.category_values[self.category_column == i]:
+                hit = (values == category).to_numpy(dtype=bool)
+                X[:, offset] = hit
+                matched |= hit
+                offset += 1
+            if not self.ignore_unknown[i] and not matched.all():
+                unknown = sorted({str(v) for v in values[~matched]})
+                raise ValueError(f"Found unknown categories {unknown} in column {column} during transform")
+
+        # sklearn trees cast their input to float32 before comparing with thresholds
+        return X.astype(np.float32)
+
+    def apply(self, X, block_rows=APPLY_BLOCK_ROWS):
+        """Leaf index reached by each row of transformed features"""
+        leaves = np.empty(len(X), dtype=np.intp)
+        has_missing = np.isnan(X).any()
+        for start in range(0, len(X), block_rows):
+            block = X[start:start + block_rows]
+            n = len(block)
+            # Column-major copy so each feature's values are contiguous for the gathers
+            flat = block.T.ravel()
+            rows = np.arange(n, dtype=np.intp)
+            node = np.zeros(n, dtype=np.intp)
+            for _ in range(self.max_depth):
+                values = flat[self.step_feature[node] * n + rows]
+                go_right = values > self.step_threshold[node]
+                if has_missing:
+                    missing = np.isnan(values)
+                    go_right[missing] = ~self.missing_go_to_left[node[missing]]
+                node = self.step_children[2 * node + go_right]
+            leaves[start:start + n] = node
+        return leaves
+
+    def predict(self, df):
+        """Risk category for each row of a DataFrame with the pipeline's input columns"""
+        return self.classes[self.node_class[self.apply(self.transform(df))]]
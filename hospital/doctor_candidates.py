@@ -0,0 +1,114 @@
+"""
+Doctors ranked for each disease type, stored in DoctorCandidate.
+
+A doctor is a candidate for a disease type when their specialization is the type's
+recommended specialization (match 2) or one matched by a keyword of its name or
+description (match 1). Rows copy the doctor's specialization, experience and number of
+scheduled appointments, and the table's index follows the ranking, so the
+recommendations page reads a disease type's candidates in order from one index range.
+
+Signals keep the rows current: a saved doctor is re-ranked for every disease type, a
+saved disease type re-ranks its doctors, and an appointment change updates its
+doctor's count. DoctorProfile changes reach the table through the Doctor they are
+synced to. Migration 0011 fills the table for existing doctors, and
+`manage.py rebuild_doctor_candidates` rebuilds everything after bulk changes that
+bypass signals.
+
+The recommendations page lists the doctors with the recommended specialization;
+keyword matches rank candidates for other uses.
+"""
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .doctor_index import keyword_specializations
+from .models import Appointment, DiseaseType, Doctor, DoctorCandidate
+
+RECOMMENDED_MATCH = 2
+KEYWORD_MATCH = 1
+
+
+def disease_type_specializations(disease_type):
+    """(recommended specialization, keyword specializations) of a disease type"""
+    keywords = set(keyword_specializations(disease_type.name, disease_type.description))
+    return disease_type.recommended_specialization or '', keywords
+
+
+def specialization_match(specializations, specialization):
+    """How well a specialization fits a disease type's disease_type_specializations"""
+    recommended, keywords = specializations
+    if recommended and specialization == recommended:
+        return RECOMMENDED_MATCH
+    if specialization in keywords:
+        return KEYWORD_MATCH
+    return 0
+
+
+def candidate_row(disease_type, doctor, match, scheduled_appointments):
+    return DoctorCandidate(
+        disease_type=disease_type,
+        doctor=doctor,
+        specialization_match=match,
+        specialization=doctor.specialization,
+        years_of_experience=doctor.years_of_experience,
+        scheduled_appointments=scheduled_appointments,
+    )
+
+
+def scheduled_appointments(doctor_id):
+    return Appointment.objects.filter(doctor_id=doctor_id, status='scheduled').count()
+
+
+def refresh_doctor_candidates(doctor):
+    """Re-rank a saved doctor for every disease type"""
+    # Saves that leave the specialization and experience alone don't change the ranking
+    stored = set(DoctorCandidate.objects.filter(doctor=doctor).values_list('specialization', 'years_of_experience'))
+    if stored == {(doctor.specialization, doctor.years_of_experience)}:
+        return
+
+    load = scheduled_appointments(doctor.id)
+    rows = []
+    for disease_type in DiseaseType.objects.all():
+        match = specialization_match(disease_type_specializations(disease_type), doctor.specialization)
+        if match:
+            rows.append(candidate_row(disease_type, doctor, match, load))
+    with transaction.atomic():
+        DoctorCandidate.objects.filter(doctor=doctor).delete()
+        DoctorCandidate.objects.bulk_create(rows)
+
+
+def refresh_disease_type_candidates(disease_type):
+    """Re-rank every doctor for a saved disease type"""
+    specializations = disease_type_specializations(disease_type)
+    recommended, keywords = specializations
+    doctors = Doctor.objects.filter(specialization__in={recommended, *keywords} - {''}).annotate(
+        scheduled=Count('appointments', filter=Q(appointments__status='scheduled')))
+    rows = [candidate_row(disease_type, doctor, specialization_match(specializations, doctor.specialization),
+                          doctor.scheduled)
+            for doctor in doctors]
+    with transaction.atomic():
+        DoctorCandidate.objects.filter(disease_type=disease_type).delete()
+        DoctorCandidate.objects.bulk_create(rows)
+
+
+def refresh_scheduled_appointments(doctor_id):
+    """Update a doctor's scheduled appointment count after one of their appointments changed"""
+    count = scheduled_appointments(doctor_id)
+    DoctorCandidate.objects.filter(doctor_id=doctor_id).exclude(scheduled_appointments=count).update(
+        scheduled_appointments=count)
+
+
+def rebuild_doctor_candidates(batch_size=1000):
+    """Rank every doctor for every disease type from scratch; returns the number of rows"""
+    disease_types = [(disease_type, disease_type_specializations(disease_type))
+                     for disease_type in DiseaseType.objects.all()]
+    doctors = Doctor.objects.annotate(scheduled=Count('appointments', filter=Q(appointments__status='scheduled')))
+    rows = []
+    for doctor in doctors.iterator(chunk_size=batch_size):
+        for disease_type, specializations in disease_types:
+            match = specialization_match(specializations, doctor.specialization)
+            if match:
+                rows.append(candidate_row(disease_type, doctor, match, doctor.scheduled))
+    with transaction.atomic():
+        DoctorCandidate.objects.all().delete()
+        DoctorCandidate.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
@@ -0,0 +1,238 @@
+"""
+Keyword matching and a specialization index for the simulated doctor recommendations.
+
+The keywords of SPECIALIZATION_MAP are compiled once, at import, into an Aho-Corasick
+automaton, so an issue's type and description are scanned in one pass each however
+many keywords there are. Matches are substrings, as with the `in` checks they replace.
+
+DoctorIndex keeps every doctor in memory, listed per specialization by experience.
+The best doctors for a set of specializations are then merged from the heads of those
+lists, so a recommendation reads a handful of entries whatever the size of the roster.
+Doctor and User signals keep the index current in this process once their transaction
+commits; changes made elsewhere (other processes, QuerySet.update) are picked up by a
+full reload every DOCTOR_INDEX_RELOAD_SECONDS.
+"""
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import deque
+from itertools import islice
+
+from django.conf import settings
+
+from .models import Doctor
+
+# Map common health issues to likely specializations
+SPECIALIZATION_MAP = {
+    'fever': ['General Medicine', 'Internal Medicine'],
+    'cold': ['General Medicine', 'ENT'],
+    'flu': ['General Medicine', 'Internal Medicine'],
+    'headache': ['Neurology', 'General Medicine'],
+    'migraine': ['Neurology'],
+    'back pain': ['Orthopedics', 'Neurology', 'Physical Therapy'],
+    'skin': ['Dermatology'],
+    'rash': ['Dermatology', 'Allergy'],
+    'stomach': ['Gastroenterology', 'General Medicine'],
+    'digestive': ['Gastroenterology'],
+    'heart': ['Cardiology'],
+    'blood pressure': ['Cardiology', 'Internal Medicine'],
+    'breathing': ['Pulmonology', 'Respiratory Medicine'],
+    'respiratory': ['Pulmonology', 'Respiratory Medicine'],
+    'eye': ['Ophthalmology'],
+    'ear': ['ENT', 'Otolaryngology'],
+    'throat': ['ENT', 'Otolaryngology'],
+    'joint': ['Orthopedics', 'Rheumatology'],
+    'bone': ['Orthopedics'],
+    'diabetes': ['Endocrinology', 'Internal Medicine'],
+    'thyroid': ['Endocrinology'],
+    'anxiety': ['Psychiatry', 'Psychology'],
+    'depression': ['Psychiatry', 'Psychology'],
+    'sleep': ['Neurology', 'Psychiatry', 'Sleep Medicine'],
+    'insomnia': ['Neurology', 'Psychiatry', 'Sleep Medicine'],
+    'kidney': ['Nephrology', 'Urology'],
+    'urinary': ['Urology', 'Nephrology'],
+    'pregnancy': ['Obstetrics', 'Gynecology', 'OB/GYN'],
+    'women': ['Gynecology', 'OB/GYN'],
+    'child': ['Pediatrics'],
+    'cancer': ['Oncology'],
+    'surgery': ['General Surgery'],
+    'allergy': ['Allergy and Immunology', 'Dermatology'],
+    'dental': ['Dentistry'],
+    'teeth': ['Dentistry'],
+    'checkup': ['General Medicine', 'Family Medicine'],
+    'general': ['General Medicine', 'Family Medicine']
+}
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton finding which of a fixed set of keywords occur in a text"""
+
+    def __init__(self, keywords):
+        # State 0 is the root; goto[state] maps a character to the next state
+        self.goto = [{}]
+        self.fail = [0]
+        self.outputs = [set()]
+        for keyword in keywords:
+            state = 0
+            for char in keyword:
+                if char not in self.goto[state]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.outputs.append(set())
+                    self.goto[state][char] = len(self.goto) - 1
+                state = self.goto[state][char]
+            self.outputs[state].add(keyword)
+
+        # Failure links breadth-first: the longest proper suffix that is also a prefix
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self.goto[state].items():
+                queue.append(child)
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.outputs[child] |= self.outputs[self.fail[child]]
+
+    def find(self, text):
+        """The keywords occurring anywhere in `text`"""
+        found = set()
+        state = 0
+        for char in text:
+            while state and char not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(char, 0)
+            if self.outputs[state]:
+                found |= self.outputs[state]
+        return found
+
+
+keyword_matcher = KeywordMatcher(SPECIALIZATION_MAP)
+
+
+def keyword_specializations(issue_type, description):
+    """Specializations whose SPECIALIZATION_MAP keywords appear in an issue's type or description"""
+    keywords = keyword_matcher.find((issue_type or '').lower()) | keyword_matcher.find((description or '').lower())
+    # Unique, in the order of SPECIALIZATION_MAP
+    matching_specializations = {}
+    for key, specializations in SPECIALIZATION_MAP.items():
+        if key in keywords:
+            matching_specializations.update(dict.fromkeys(specializations))
+    return list(matching_specializations)
+
+
+def doctor_entry(doctor):
+    """The fields recommendations use of a doctor, as sent to Gemini"""
+    return {
+        'id': doctor.id,
+        'name': f"Dr. {doctor.user.get_full_name()}",
+        'specialization': doctor.specialization,
+        'years_of_experience': doctor.years_of_experience,
+        'bio': doctor.bio or "",
+    }
+
+
+class DoctorIndex:
+    """Doctors by specialization, each list ordered by experience, most first"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self._entries = {}
+        self._user_doctors = {}
+        # Sorted lists of (-years_of_experience, doctor id)
+        self._by_specialization = {}
+        self._everyone = []
+
+    def _ensure_loaded(self):
+        reload_seconds = getattr(settings, 'DOCTOR_INDEX_RELOAD_SECONDS', 300)
+        if self._loaded_at is not None and time.monotonic() - self._loaded_at < reload_seconds:
+            return
+        doctors = list(Doctor.objects.select_related('user'))
+        with self._lock:
+            self._entries, self._user_doctors = {}, {}
+            self._by_specialization, self._everyone = {}, []
+            for doctor in doctors:
+                self._add(doctor)
+            for keys in self._by_specialization.values():
+                keys.sort()
+            self._everyone.sort()
+            self._loaded_at = time.monotonic()
+        print(f"Loaded {len(doctors)} doctors into the recommendation index")
+
+    def _add(self, doctor, sort=False):
+        entry = doctor_entry(doctor)
+        key = (-entry['years_of_experience'], entry['id'])
+        self._entries[doctor.id] = entry
+        self._user_doctors[doctor.user_id] = doctor.id
+        keys = self._by_specialization.setdefault(entry['specialization'], [])
+        if sort:
+            insort(keys, key)
+            insort(self._everyone, key)
+        else:
+            keys.append(key)
+            self._everyone.append(key)
+
+    def _remove(self, doctor_id):
+        entry = self._entries.pop(doctor_id, None)
+        if entry is None:
+            return
+        key = (-entry['years_of_experience'], doctor_id)
+        specialization_keys = self._by_specialization[entry['specialization']]
+        for keys in (specialization_keys, self._everyone):
+            i = bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                del keys[i]
+        if not specialization_keys:
+            del self._by_specialization[entry['specialization']]
+
+    def update(self, doctor):
+        """Add or re-file a doctor after it was saved"""
+        if self._loaded_at is None:
+            return
+        with self._lock:
+            self._remove(doctor.id)
+            self._add(doctor, sort=True)
+
+    def remove(self, doctor_id):
+        """Drop a deleted doctor"""
+        if self._loaded_at is None:
+            return
+        with self._lock:
+            self._remove(doctor_id)
+
+    def rename(self, user):
+        """Refresh the name of the doctor a user is, after the user was saved"""
+        with self._lock:
+            entry = self._entries.get(self._user_doctors.get(user.id))
+            if entry is not None:
+                entry['name'] = f"Dr. {user.get_full_name()}"
+
+    def top(self, specializations=None, limit=3):
+        """
+        The `limit` most experienced doctors in any of `specializations`, or of all
+        doctors if it is None, as doctor_entry dicts.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            if specializations is None:
+                keys = self._everyone[:limit]
+            else:
+                lists = [self._by_specialization[s] for s in set(specializations) if s in self._by_specialization]
+                keys = list(islice(heapq.merge(*lists), limit))
+            return [dict(self._entries[doctor_id]) for _, doctor_id in keys]
+
+    def specializations(self):
+        """Every specialization some doctor has, sorted"""
+        self._ensure_loaded()
+        with self._lock:
+            return sorted(self._by_specialization)
+
+    def __len__(self):
+        self._ensure_loaded()
+        return len(self._entries)
+
+
+doctor_index = DoctorIndex()
@@ -0,0 +1,65 @@
+"""
+Largest-Triangle-Three-Buckets downsampling for plotted vital signs.
+
+LTTB keeps the first and last points and one point per bucket in between: the one
+forming the largest triangle with the point kept in the previous bucket and the
+average of the next bucket. Sharp features such as SpO2 dips and heart rate spikes
+make large triangles, so they survive even heavy downsampling.
+"""
+import numpy as np
+
+
+def lttb_indices(x, y, threshold):
+    """
+    Indices of the points LTTB keeps when reducing (x, y) to `threshold` points.
+
+    `x` must be increasing. All indices are returned when there are fewer than
+    `threshold` points or `threshold` is below 3.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    # threshold - 2 buckets over the interior points; bucket i is [starts[i], ends[i])
+    edges = np.arange(threshold - 1, dtype=np.intp) * (n - 2) // (threshold - 2) + 1
+    starts, ends = edges[:-1], edges[1:]
+
+    # Average of every bucket from prefix sums; bucket i looks ahead to bucket i + 1,
+    # and the last bucket to the final point
+    sum_x = np.concatenate(([0.0], np.cumsum(x)))
+    sum_y = np.concatenate(([0.0], np.cumsum(y)))
+    sizes = ends - starts
+    next_x = np.append(((sum_x[ends] - sum_x[starts]) / sizes)[1:], x[-1])
+    next_y = np.append(((sum_y[ends] - sum_y[starts]) / sizes)[1:], y[-1])
+
+    selected = np.empty(threshold, dtype=np.intp)
+    selected[0], selected[-1] = 0, n - 1
+    # Each bucket depends on the point kept in the previous one, so walk them in order
+    a = 0
+    for i, (start, end) in enumerate(zip(starts.tolist(), ends.tolist())):
+        ax, ay = x[a], y[a]
+        area = np.abs((ax - next_x[i]) * (y[start:end] - ay) - (ax - x[start:end]) * (next_y[i] - ay))
+        a = start + int(area.argmax())
+        selected[i + 1] = a
+    return selected
+
+
+def lttb_series(timestamps, values, threshold):
+    """
+    Downsample one plotted series with LTTB.
+
+    Missing values are dropped first. The series' lowest and highest readings are
+    always kept as well, so at most two points more than `threshold` are returned.
+    Returns the kept (timestamps, values).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    keep = ~np.isnan(values)
+    timestamps, values = timestamps[keep], values[keep]
+    # Seconds since the first reading keep float64 precision for the triangle areas
+    x = (timestamps - timestamps[0]) / np.timedelta64(1, 's') if len(timestamps) else timestamps
+    indices = lttb_indices(x, values, threshold)
+    if len(indices) < len(values):
+        indices = np.union1d(indices, [values.argmin(), values.argmax()])
+    return timestamps[indices], values[indices]
@@ -24,11 +24,11 @@ class IssueForm(forms.ModelForm):
         widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3, 'placeholder': 'List your symptoms'}),
         required=False
     )
-    device_data = forms.BooleanField(
+    device_data = forms.FileField(
         required=False,
-        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
-        label="Link my health device data",
-        help_text="Link data from your health monitoring device for the doctor to view"
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv'}),
+        label="Health device data",
+        help_text="Upload a CSV export from your health monitoring device for the doctor to view"
     )
     
     class Meta:
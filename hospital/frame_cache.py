@@ -0,0 +1,117 @@
+"""
+Process-local LRU caches for vital signs visualization.
+
+Keys are (source, version, ...) tuples. Parsed frames use the source's mtime and
+size as the version, so a rewritten or appended file is parsed again instead of
+served stale, and storing a new version of a source drops the older ones. Entries
+are evicted least recently used first once their combined size exceeds the budget.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .vitals_store import MANIFEST_NAME, is_vitals_dataset, read_manifest
+
+# Rough in-memory bytes per CSV byte and per stored value, used to skip caching
+# sources that would not fit before parsing them
+CSV_MEMORY_FACTOR = 1.5
+BYTES_PER_VALUE = 16
+
+
+def source_key(path):
+    """(path, (mtime_ns, size)) of a CSV file, or of a dataset's manifest"""
+    path = os.path.abspath(path)
+    stat = os.stat(os.path.join(path, MANIFEST_NAME) if is_vitals_dataset(path) else path)
+    return (path, (stat.st_mtime_ns, stat.st_size))
+
+
+def frame_bytes(df):
+    """Memory used by a frame, or by a cached object that reports its own `nbytes`"""
+    if hasattr(df, 'nbytes'):
+        return df.nbytes
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def estimated_frame_bytes(path):
+    """Guess a source's parsed size without reading it"""
+    if is_vitals_dataset(path):
+        manifest = read_manifest(path)
+        return manifest['rows'] * (len(manifest['columns']) + 1) * BYTES_PER_VALUE
+    return int(os.path.getsize(path) * CSV_MEMORY_FACTOR)
+
+
+class SizedLRUCache:
+    """LRU with a memory budget in bytes and hit/miss/eviction counters"""
+
+    def __init__(self, max_bytes=None, sizeof=frame_bytes, budget_setting='VITALS_FRAME_CACHE_BYTES',
+                 default_max_bytes=256 * 1024 * 1024):
+        self._max_bytes = max_bytes
+        self._sizeof = sizeof
+        self._budget_setting = budget_setting
+        self._default_max_bytes = default_max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is not None:
+            return self._max_bytes
+        return getattr(settings, self._budget_setting, self._default_max_bytes)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """Cache `value` unless it alone is over budget; entries for older versions of the source are dropped"""
+        size = self._sizeof(value)
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            for stale in [k for k in self._entries if k[0] == key[0] and k[1] != key[1]]:
+                self._remove(stale)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+        return True
+
+    def _remove(self, key):
+        value, size = self._entries.pop(key)
+        self.current_bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+frame_cache = SizedLRUCache()
@@ -0,0 +1,192 @@
+import hashlib
+import io
+import os
+
+import pandas as pd
+from django.utils import timezone
+
+from .models import VitalSignsIngestion
+from .vitals_store import iter_vitals_chunks, manifest_hash, read_manifest, MANIFEST_NAME
+
+# Bytes read at a time when hashing device files
+HASH_BLOCK_SIZE = 1024 * 1024
+
+class DeviceFileReader(io.RawIOBase):
+    """
+    Binary stream of a CSV header followed by the rest of an open device file.
+    
+    Bytes taken from the file are added to `digest` as they are read, so the file's
+    content hash is built while pandas parses it instead of in a separate pass.
+    """
+    
+    def __init__(self, f, header, digest):
+        self._file = f
+        self._pending = header
+        self.digest = digest
+        self.body_bytes = 0
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        if self._pending:
+            n = min(len(buffer), len(self._pending))
+            buffer[:n] = self._pending[:n]
+            self._pending = self._pending[n:]
+            return n
+        n = self._file.readinto(buffer)
+        if n:
+            self.digest.update(memoryview(buffer)[:n])
+            self.body_bytes += n
+        return n
+
+class DeviceStream:
+    """Readings of a device file from `start_offset` on, parsed `chunk_rows` rows at a time"""
+    
+    def __init__(self, file_path, header, start_offset, digest, file_mtime, chunk_rows):
+        self.file_path = file_path
+        self.header = header
+        self.start_offset = start_offset
+        self.file_size = start_offset
+        self.file_mtime = file_mtime
+        self.chunk_rows = chunk_rows
+        self._digest = digest
+    
+    @property
+    def content_hash(self):
+        """SHA-256 of the file up to file_size; complete once chunks() is exhausted"""
+        return self._digest.hexdigest()
+    
+    def chunks(self):
+        """Yield DataFrames of at most chunk_rows readings; memory stays bounded by the chunk size"""
+        with open(self.file_path, 'rb') as f:
+            f.seek(self.start_offset)
+            raw = DeviceFileReader(f, self.header, self._digest)
+            reader = pd.read_csv(io.BufferedReader(raw, HASH_BLOCK_SIZE), chunksize=self.chunk_rows)
+            with reader:
+                for chunk in reader:
+                    if len(chunk):
+                        yield chunk
+            self.file_size = self.start_offset + raw.body_bytes
+
+class DatasetStream:
+    """Readings of a Parquet vitals dataset from `start_row` on, `chunk_rows` rows at a time"""
+    
+    def __init__(self, dataset_path, manifest, start_row, file_mtime, chunk_rows):
+        self.file_path = dataset_path
+        self.start_row = start_row
+        # Datasets are tracked by row count rather than bytes
+        self.file_size = manifest['rows']
+        self.file_mtime = file_mtime
+        self.chunk_rows = chunk_rows
+        self.content_hash = manifest['content_hash']
+    
+    def chunks(self):
+        yield from iter_vitals_chunks(self.file_path, self.chunk_rows, self.start_row)
+
+def get_ingestion_ledger(issue, file_path, start_time=None):
+    """Return the ledger entry for an issue's device file, creating it on first sight"""
+    ledger, created = VitalSignsIngestion.objects.get_or_create(
+        issue=issue,
+        file_path=os.path.abspath(file_path),
+        defaults={'start_time': start_time or timezone.now()}
+    )
+    return ledger
+
+def reset_ingestion_ledger(ledger):
+    """Forget how far a file was processed so it is scored again from the first row"""
+    ledger.content_hash = ''
+    ledger.file_size = 0
+    ledger.rows_processed = 0
+    ledger.run_length = 0
+    ledger.last_alert_row = None
+    ledger.heart_rate_tail = []
+    ledger.rule_state = {}
+
+def open_device_stream(ledger, file_path, chunk_rows):
+    """
+    Return a DeviceStream of the readings added since the ledger's last run, or None.
+    
+    A file whose size and mtime match the ledger is skipped without being read. Otherwise
+    the already-processed prefix is re-hashed: if it still matches, only the bytes after it
+    are parsed. If it doesn't, the file was rewritten and the ledger is reset so every row
+    is streamed again.
+    """
+    stat = os.stat(file_path)
+    if ledger.content_hash and stat.st_size == ledger.file_size and stat.st_mtime == ledger.file_mtime:
+        return None
+    
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        header = f.readline()
+        f.seek(0)
+        
+        prefix_matches = False
+        if ledger.content_hash and stat.st_size >= ledger.file_size:
+            remaining = ledger.file_size
+            while remaining > 0:
+                block = f.read(min(HASH_BLOCK_SIZE, remaining))
+                if not block:
+                    break
+                digest.update(block)
+                remaining -= len(block)
+            prefix_matches = digest.hexdigest() == ledger.content_hash
+    
+    if prefix_matches:
+        if stat.st_size == ledger.file_size:
+            # Touched but not extended: remember the new mtime so the next check is cheap
+            ledger.file_mtime = stat.st_mtime
+            ledger.save(update_fields=['file_mtime', 'updated_at'])
+            return None
+        start_offset = ledger.file_size
+    else:
+        if ledger.content_hash:
+            print(f"{file_path} changed since it was last processed, scoring it again from the start")
+        reset_ingestion_ledger(ledger)
+        digest = hashlib.sha256(header)
+        start_offset = len(header)
+    
+    return DeviceStream(file_path, header, start_offset, digest, stat.st_mtime, chunk_rows)
+
+def open_dataset_stream(ledger, dataset_path, chunk_rows):
+    """
+    Return a DatasetStream of the readings appended since the ledger's last run, or None.
+    
+    Datasets only grow by appending parts, so the ledger's hash is compared against the
+    hash of the manifest's leading parts that cover the rows already processed.
+    """
+    manifest = read_manifest(dataset_path)
+    file_mtime = os.stat(os.path.join(dataset_path, MANIFEST_NAME)).st_mtime
+    if ledger.content_hash and manifest['content_hash'] == ledger.content_hash:
+        return None
+    
+    prefix, covered = [], 0
+    for part in manifest['parts']:
+        if covered >= ledger.rows_processed:
+            break
+        prefix.append(part)
+        covered += part['rows']
+    
+    if ledger.content_hash and covered == ledger.rows_processed and manifest_hash(prefix) == ledger.content_hash:
+        start_row = ledger.rows_processed
+    else:
+        if ledger.content_hash:
+            print(f"{dataset_path} changed since it was last processed, scoring it again from the start")
+        reset_ingestion_ledger(ledger)
+        start_row = 0
+    
+    return DatasetStream(dataset_path, manifest, start_row, file_mtime, chunk_rows)
+
+def record_ingestion(ledger, stream, scan_state, model_version):
+    """Store how far a device file has been processed and the alert state at that point"""
+    ledger.content_hash = stream.content_hash
+    ledger.file_size = stream.file_size
+    ledger.file_mtime = stream.file_mtime
+    ledger.rows_processed = scan_state.rows_processed
+    ledger.run_length = scan_state.run_length
+    ledger.last_alert_row = scan_state.last_alert_row
+    ledger.heart_rate_tail = scan_state.heart_rate_tail
+    ledger.rule_state = scan_state.rule_state
+    if model_version:
+        ledger.model_version = model_version
+    ledger.save()
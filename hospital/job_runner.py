@@ -0,0 +1,55 @@
+"""
+Code that runs inside the vitals worker's pool processes.
+
+Pool processes are spawned and import this module before Django is set up, so it
+must not import models at module level.
+"""
+import os
+import time
+import traceback
+
+
+def init_worker_process():
+    """Process pool initializer: each child sets up Django and opens its own connections"""
+    import django
+    django.setup()
+    from .model_registry import warm_scoring_model_on_startup
+    warm_scoring_model_on_startup()
+
+def convert_job_upload(job, timings):
+    """Convert a job's raw CSV into the vitals store once and point the issue at the dataset"""
+    from django.conf import settings
+    from .models import Issue, VitalSignsJob
+    from .vitals_store import convert_csv_to_dataset, dataset_path_for_issue, is_vitals_dataset
+    
+    if is_vitals_dataset(job.file_path):
+        return job.file_path
+    
+    started = time.perf_counter()
+    issue = Issue.objects.get(id=job.issue_id)
+    dataset_path = dataset_path_for_issue(issue.id)
+    convert_csv_to_dataset(job.file_path, dataset_path, default_patient_id=issue.patient_id)
+    Issue.objects.filter(id=issue.id).update(device_data=os.path.relpath(dataset_path, settings.BASE_DIR))
+    # A retried job picks up the dataset instead of converting the upload again
+    VitalSignsJob.objects.filter(id=job.id).update(file_path=dataset_path)
+    timings['convert'] = round(time.perf_counter() - started, 4)
+    return dataset_path
+
+def run_vitals_job(job_id):
+    """Score one job's file; runs inside a pool process and returns a picklable result"""
+    from .models import VitalSignsJob
+    from .utils import process_vital_signs_data
+    
+    job = VitalSignsJob.objects.get(id=job_id)
+    timings = {}
+    started = time.perf_counter()
+    try:
+        file_path = convert_job_upload(job, timings)
+        # Alert times count from the upload, however long the job waited for a worker
+        success = process_vital_signs_data(job.issue_id, file_path, start_time=job.enqueued_at, timings=timings)
+        error = '' if success else 'Processing failed, see worker log'
+    except Exception:
+        success = False
+        error = traceback.format_exc()
+    timings['total'] = round(time.perf_counter() - started, 4)
+    return {'success': success, 'timings': timings, 'error': error}
@@ -0,0 +1,77 @@
+import os
+import socket
+import uuid
+from datetime import timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import VitalSignsJob
+
+# How long a claimed job stays reserved without a heartbeat
+DEFAULT_LEASE_SECONDS = 60
+
+# Attempts before a job whose worker keeps disappearing is marked failed
+MAX_ATTEMPTS = 3
+
+def make_worker_id():
+    """Identify this worker process in job leases"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def enqueue_vitals_job(issue, file_path):
+    """Queue a device data file for scoring and return the job"""
+    return VitalSignsJob.objects.create(issue=issue, file_path=file_path)
+
+def claim_jobs(worker_id, limit, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """
+    Claim up to `limit` queued jobs, or running jobs whose lease has expired.
+    
+    Each claim is a conditional UPDATE on the row's status and lease, so two workers
+    polling at once never get the same job, on SQLite as well as on other databases.
+    """
+    now = timezone.now()
+    claimable = VitalSignsJob.objects.filter(
+        Q(status='queued') | Q(status='running', lease_expires_at__lt=now)
+    ).order_by('enqueued_at')
+    
+    claimed = []
+    for job in claimable[:limit * 2]:
+        if len(claimed) >= limit:
+            break
+        if job.attempts >= MAX_ATTEMPTS:
+            VitalSignsJob.objects.filter(id=job.id, status=job.status, lease_expires_at=job.lease_expires_at).update(
+                status='failed', finished_at=now, error=f"Gave up after {job.attempts} attempts"
+            )
+            continue
+        updated = VitalSignsJob.objects.filter(
+            id=job.id, status=job.status, lease_expires_at=job.lease_expires_at
+        ).update(
+            status='running',
+            worker_id=worker_id,
+            attempts=job.attempts + 1,
+            lease_expires_at=now + timedelta(seconds=lease_seconds),
+            heartbeat_at=now,
+            started_at=now,
+        )
+        if updated:
+            job.refresh_from_db()
+            claimed.append(job)
+    return claimed
+
+def heartbeat(worker_id, job_ids, lease_seconds=DEFAULT_LEASE_SECONDS):
+    """Extend the leases this worker holds; returns the number still held"""
+    now = timezone.now()
+    return VitalSignsJob.objects.filter(id__in=job_ids, worker_id=worker_id, status='running').update(
+        heartbeat_at=now,
+        lease_expires_at=now + timedelta(seconds=lease_seconds),
+    )
+
+def finish_job(worker_id, job_id, result):
+    """Record the outcome of a job, unless its lease has been taken over by another worker"""
+    return VitalSignsJob.objects.filter(id=job_id, worker_id=worker_id, status='running').update(
+        status='succeeded' if result['success'] else 'failed',
+        finished_at=timezone.now(),
+        lease_expires_at=None,
+        timings=result['timings'],
+        error=result.get('error', ''),
+    )
@@ -0,0 +1,199 @@
+"""
+In-process pub/sub for server-sent live vitals and alerts.
+
+The telemetry thread publishes each scored batch of readings to ``issue:<id>``, and
+save_alerts publishes new alerts to ``issue:<id>`` and ``doctor:<id>``. Every open
+stream is a Subscriber with its own bounded queue, drained by an async generator on
+the ASGI event loop, so an idle connection costs a coroutine rather than a thread.
+
+Publishers run in other threads and hand events to the loop with
+call_soon_threadsafe. When a client reads slower than readings arrive and its queue
+is full, further readings are folded into one rollup (count, min, max and mean of each
+vital) which is sent once the client has caught up. Alerts are never folded.
+Only streams served by the publishing process see its events.
+"""
+import asyncio
+import json
+import threading
+from collections import deque
+
+from django.conf import settings
+
+from .vitals_store import ROLLUP_VITALS
+
+
+class Subscriber:
+    """One open stream: its topics and the events waiting to be sent"""
+
+    def __init__(self, topics, max_events):
+        self.topics = topics
+        self.max_events = max_events
+        self.loop = asyncio.get_running_loop()
+        self.queue = deque()
+        self.ready = asyncio.Event()
+        # Readings that arrived while the queue was full, summarised
+        self.rollup = None
+        self.closed = False
+
+    def deliver(self, kind, data):
+        """Queue an event; runs on the subscriber's event loop"""
+        if kind == 'readings' and (self.rollup is not None or len(self.queue) >= self.max_events):
+            self.rollup = merge_rollup(self.rollup, data)
+        else:
+            self.queue.append((kind, data))
+        self.ready.set()
+
+    def next_event(self):
+        """The next (kind, data) to send, or None if there is nothing waiting"""
+        if self.queue:
+            return self.queue.popleft()
+        if self.rollup is not None:
+            rollup, self.rollup = self.rollup, None
+            return 'rollup', finish_rollup(rollup)
+        self.ready.clear()
+        return None
+
+
+def merge_rollup(rollup, records):
+    """Fold a batch of reading records into a running rollup"""
+    if rollup is None:
+        rollup = {
+            'first_row': records[0]['row'], 'start': records[0]['Timestamp'], 'count': 0,
+            'vitals': {vital: [None, None, 0.0, 0] for vital in ROLLUP_VITALS},
+        }
+    for record in records:
+        for vital, stats in rollup['vitals'].items():
+            value = record.get(vital)
+            if value is None:
+                continue
+            stats[0] = value if stats[0] is None else min(stats[0], value)
+            stats[1] = value if stats[1] is None else max(stats[1], value)
+            stats[2] += value
+            stats[3] += 1
+    rollup['count'] += len(records)
+    rollup['last_row'] = records[-1]['row']
+    rollup['end'] = records[-1]['Timestamp']
+    return rollup
+
+
+def finish_rollup(rollup):
+    vitals = {
+        vital: {'min': low, 'max': high, 'mean': total / count}
+        for vital, (low, high, total, count) in rollup['vitals'].items() if count
+    }
+    return dict(rollup, vitals=vitals)
+
+
+class LiveHub:
+    """Topics and their subscribers, shared by the publishing threads and the event loop"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._topics = {}
+        self.stats = {'subscribers': 0, 'published': 0, 'rolled_up': 0}
+
+    def subscribe(self, topics):
+        subscriber = Subscriber(topics, getattr(settings, 'VITALS_STREAM_QUEUE_EVENTS', 100))
+        with self._lock:
+            for topic in topics:
+                self._topics.setdefault(topic, set()).add(subscriber)
+            self.stats['subscribers'] += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber.closed:
+                return
+            subscriber.closed = True
+            for topic in subscriber.topics:
+                subscribers = self._topics.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self._topics[topic]
+            self.stats['subscribers'] -= 1
+
+    def publish(self, topic, kind, data):
+        """Send an event to every subscriber of `topic`; callable from any thread"""
+        with self._lock:
+            subscribers = list(self._topics.get(topic, ()))
+            if subscribers:
+                self.stats['published'] += 1
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.deliver, kind, data)
+            except RuntimeError:
+                # The subscriber's loop has closed; its stream is gone
+                self.unsubscribe(subscriber)
+
+
+live_hub = LiveHub()
+
+
+def publish_readings(issue_id, records):
+    if records:
+        live_hub.publish(f'issue:{issue_id}', 'readings', records)
+
+
+def alert_event(alert):
+    return {
+        'id': alert.id,
+        'issue_id': alert.issue_id,
+        'patient_id': alert.patient_id,
+        'doctor_id': alert.doctor_id,
+        'urgency': alert.urgency,
+        'title': alert.title,
+        'message': alert.message,
+        'alert_time': alert.alert_time.isoformat(),
+        'vital_signs_data': alert.vital_signs_data,
+        'rule_id': alert.rule_id,
+    }
+
+
+def publish_alerts(alerts):
+    """Announce new alerts to their doctors' streams, and once per alert time to the issue's"""
+    issue_alerts = {}
+    for alert in alerts:
+        event = alert_event(alert)
+        live_hub.publish(f'doctor:{alert.doctor_id}', 'alert', event)
+        issue_alerts.setdefault((alert.issue_id, alert.alert_time), event)
+    for (issue_id, _), event in issue_alerts.items():
+        live_hub.publish(f'issue:{issue_id}', 'alert', event)
+
+
+def sse_message(kind, data, event_id=None):
+    lines = f'event: {kind}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+    return f'id: {event_id}\n{lines}' if event_id is not None else lines
+
+
+async def event_stream(subscriber, initial=()):
+    """
+    Server-sent events for a subscriber, starting with `initial` (kind, data) events.
+
+    Reading events carry the last row as their id, so a reconnecting EventSource sends
+    it back in Last-Event-ID. A comment is sent when nothing happens for
+    VITALS_STREAM_KEEPALIVE_SECONDS so proxies keep the connection open.
+    """
+    keepalive = getattr(settings, 'VITALS_STREAM_KEEPALIVE_SECONDS', 15)
+    try:
+        yield 'retry: 3000\n\n'
+        for kind, data in initial:
+            yield sse_message(kind, data, data[-1]['row'] if kind == 'readings' else None)
+        while True:
+            event = subscriber.next_event()
+            if event is None:
+                try:
+                    await asyncio.wait_for(subscriber.ready.wait(), keepalive)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                continue
+            kind, data = event
+            if kind == 'readings':
+                yield sse_message(kind, data, data[-1]['row'])
+            elif kind == 'rollup':
+                live_hub.stats['rolled_up'] += data['count']
+                yield sse_message(kind, data, data['last_row'])
+            else:
+                yield sse_message(kind, data)
+    finally:
+        live_hub.unsubscribe(subscriber)
@@ -0,0 +1,116 @@
+"""
+Shared client for the Gemini API.
+
+The API key and endpoint are read once, and every call goes through one requests
+Session to Gemini's REST generateContent endpoint, so setting GEMINI_API_BASE_URL to a
+local server (see `manage.py run_llm_stub`) exercises the same code path. Calls run on
+a bounded thread pool: at most LLM_MAX_WORKERS at once and LLM_MAX_PENDING waiting,
+beyond which they are refused straight away. Each call has a deadline of
+LLM_TIMEOUT_SECONDS; the caller stops waiting then and uses its fallback, while the
+HTTP request itself gives up at the same read timeout.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import requests
+from django.conf import settings
+from dotenv import load_dotenv
+
+
+def estimate_tokens(text):
+    """Rough token count of a prompt, at about four characters per token"""
+    return (len(text) + 3) // 4
+
+
+class LLMUnavailable(Exception):
+    """No answer in time: no API key, too many calls waiting, a timeout or an API error"""
+
+
+class LLMClient:
+    """Gemini calls with deadlines, run on a bounded pool of threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._configured = False
+        self.stats = {'calls': 0, 'succeeded': 0, 'timed_out': 0, 'failed': 0, 'refused': 0,
+                      'seconds': 0.0, 'seconds_max': 0.0, 'prompt_tokens': 0, 'output_tokens': 0}
+
+    def _configure(self):
+        with self._lock:
+            if self._configured:
+                return
+            # Environment variables from .env, read once per process
+            load_dotenv()
+            self.api_key = getattr(settings, 'GEMINI_API_KEY', None) or os.getenv('GEMINI_API_KEY')
+            self.model = getattr(settings, 'GEMINI_MODEL', 'gemini-2.0-pro-exp-02-05')
+            base_url = getattr(settings, 'GEMINI_API_BASE_URL', 'https://generativelanguage.googleapis.com')
+            self.url = f"{base_url.rstrip('/')}/v1beta/models/{self.model}:generateContent"
+            self.timeout = getattr(settings, 'LLM_TIMEOUT_SECONDS', 8.0)
+            max_workers = getattr(settings, 'LLM_MAX_WORKERS', 4)
+            self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm')
+            self.slots = threading.BoundedSemaphore(max_workers + getattr(settings, 'LLM_MAX_PENDING', 16))
+            self.session = requests.Session()
+            self._configured = True
+
+    @property
+    def available(self):
+        """Whether an API key is configured"""
+        self._configure()
+        return bool(self.api_key)
+
+    def _request(self, prompt, timeout):
+        try:
+            response = self.session.post(
+                self.url,
+                params={'key': self.api_key},
+                json={'contents': [{'parts': [{'text': prompt}]}]},
+                timeout=(min(timeout, 3.05), timeout),
+            )
+            response.raise_for_status()
+            data = response.json()
+            usage = data.get('usageMetadata', {})
+            prompt_tokens = usage.get('promptTokenCount') or estimate_tokens(prompt)
+            self.stats['prompt_tokens'] += prompt_tokens
+            self.stats['output_tokens'] += usage.get('candidatesTokenCount', 0)
+            parts = data['candidates'][0]['content']['parts']
+            text = ''.join(part.get('text', '') for part in parts)
+            print(f"Gemini answered {prompt_tokens} prompt tokens with {len(text)} characters")
+            return text
+        finally:
+            self.slots.release()
+
+    def submit(self, prompt, timeout=None):
+        """Start a call on the pool; returns (future, deadline in seconds)"""
+        self._configure()
+        if not self.api_key:
+            raise LLMUnavailable("No Gemini API key found in settings or .env")
+        if not self.slots.acquire(blocking=False):
+            self.stats['refused'] += 1
+            raise LLMUnavailable("Too many Gemini calls waiting")
+        timeout = timeout or self.timeout
+        self.stats['calls'] += 1
+        return self.executor.submit(self._request, prompt, timeout), timeout
+
+    def generate(self, prompt, timeout=None):
+        """Text generated for a prompt; raises LLMUnavailable if there is none within the deadline"""
+        future, timeout = self.submit(prompt, timeout)
+        started = time.perf_counter()
+        try:
+            text = future.result(timeout=timeout)
+        except FutureTimeoutError:
+            self.stats['timed_out'] += 1
+            raise LLMUnavailable(f"Gemini did not answer within {timeout:g}s")
+        except Exception as e:
+            self.stats['failed'] += 1
+            raise LLMUnavailable(f"Gemini call failed: {e}")
+        finally:
+            seconds = time.perf_counter() - started
+            self.stats['seconds'] += seconds
+            self.stats['seconds_max'] = max(self.stats['seconds_max'], seconds)
+        self.stats['succeeded'] += 1
+        return text.strip()
+
+
+llm_client = LLMClient()
@@ -0,0 +1,100 @@
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from hospital.models import Alert, Issue
+from hospital.utils import save_alerts
+from users.models import User
+
+
+def legacy_alert_inserts(alerts):
+    """One get_or_create per alert, each in its own transaction, as create_alerts used to do it"""
+    created = 0
+    for alert in alerts:
+        _, was_created = Alert.objects.get_or_create(
+            issue=alert.issue,
+            doctor=alert.doctor,
+            alert_time=alert.alert_time,
+            defaults={
+                'patient': alert.patient,
+                'timestamp': alert.timestamp,
+                'urgency': alert.urgency,
+                'title': alert.title,
+                'message': alert.message,
+                'vital_signs_data': alert.vital_signs_data,
+                'model_version': alert.model_version,
+            }
+        )
+        created += was_created
+    return created
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks alert inserts per second: the legacy per-alert loop against bulk saves'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--alerts', type=int, default=2000, help='Alert times to save')
+        parser.add_argument('--doctors', type=int, default=5, help='Doctors each alert goes to')
+        parser.add_argument('--batch-sizes', type=int, nargs='+', default=[100, 500, 2000],
+                            help='bulk_create batch sizes to time')
+
+    def handle(self, *args, **options):
+        # Throwaway patient, doctors and issue, deleted again at the end
+        users = [User.objects.create_user('alert-bench-patient', user_type='patient',
+                                          first_name='Bench', last_name='Patient')]
+        try:
+            for i in range(options['doctors']):
+                users.append(User.objects.create_user(f'alert-bench-doctor-{i}', user_type='doctor',
+                                                      first_name='Bench', last_name=f'Doctor {i}'))
+            patient = users[0].patient
+            doctors = [user.doctor for user in users[1:]]
+            issue = Issue.objects.create(patient=patient, description='Alert insert benchmark')
+            self.run(issue, doctors, options)
+        finally:
+            for user in users:
+                user.delete()
+
+    def make_alerts(self, issue, doctors, count):
+        start_time = timezone.make_aware(datetime(2024, 1, 1))
+        now = timezone.now()
+        vital_signs = {'Heart Rate': 130.0, 'Oxygen Saturation': 88.0}
+        return [
+            Alert(issue=issue, doctor=doctor, patient=issue.patient,
+                  alert_time=start_time + timedelta(seconds=101 * i), timestamp=now,
+                  urgency='high', title='Benchmark alert', message='High-risk vital signs detected:',
+                  vital_signs_data=vital_signs, model_version='benchmark')
+            for i in range(count) for doctor in doctors
+        ]
+
+    def run(self, issue, doctors, options):
+        alerts = self.make_alerts(issue, doctors, options['alerts'])
+        self.stdout.write(f"{len(alerts)} alerts ({options['alerts']} alert times x {len(doctors)} doctors)")
+        self.stdout.write(f"{'method':>24} {'created':>8} {'seconds':>9} {'inserts/s':>10}")
+
+        def report(label, created, seconds):
+            self.stdout.write(f'{label:>24} {created:>8} {seconds:>9.3f} {created / seconds:>10.0f}')
+
+        started = time.perf_counter()
+        created = legacy_alert_inserts(alerts)
+        legacy_seconds = time.perf_counter() - started
+        report('get_or_create loop', created, legacy_seconds)
+        issue.alerts.all().delete()
+
+        for batch_size in options['batch_sizes']:
+            alerts = self.make_alerts(issue, doctors, options['alerts'])
+            started = time.perf_counter()
+            with transaction.atomic():
+                created = len(save_alerts(alerts, batch_size=batch_size))
+            seconds = time.perf_counter() - started
+            report(f'bulk, batch {batch_size}', created, seconds)
+            self.stdout.write(f'{"":>24} {legacy_seconds / seconds:.0f}x faster than the loop')
+
+            # Saving the same alerts again only finds the existing rows
+            started = time.perf_counter()
+            duplicates = len(save_alerts(self.make_alerts(issue, doctors, options['alerts']),
+                                         batch_size=batch_size))
+            self.stdout.write(f'{"":>24} re-saving created {duplicates} in {time.perf_counter() - started:.3f}s')
+            issue.alerts.all().delete()
@@ -0,0 +1,122 @@
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital.utils import ALERT_THRESHOLD, detect_alerts, urgency_for_run_lengths
+
+
+def legacy_alert_loop(df, start_time):
+    """Row-by-row alert detection exactly as process_vital_signs_data used to do it"""
+    alerts = []
+    last_alert_time = None
+    anomaly_count = 0
+
+    for i in range(len(df)):
+        timestamp = start_time + timedelta(seconds=i)
+        is_high_risk = df.iloc[i]['Risk Category'] == 'High Risk'
+
+        if is_high_risk:
+            anomaly_count += 1
+            should_create_alert = (
+                anomaly_count >= ALERT_THRESHOLD and
+                (not last_alert_time or (timestamp - last_alert_time).seconds > 100)
+            )
+            if should_create_alert:
+                if anomaly_count >= 10:
+                    urgency = 'critical'
+                elif anomaly_count >= 7:
+                    urgency = 'high'
+                elif anomaly_count >= 5:
+                    urgency = 'medium'
+                else:
+                    urgency = 'low'
+                alerts.append((i, urgency))
+                last_alert_time = timestamp
+        else:
+            anomaly_count = 0
+
+    return alerts
+
+
+def reference_alert_loop(risk_categories, start_time):
+    """Same decisions as legacy_alert_loop on a plain list, fast enough to check 10M rows"""
+    alerts = []
+    last_alert_time = None
+    anomaly_count = 0
+
+    for i, category in enumerate(risk_categories):
+        if category == 'High Risk':
+            anomaly_count += 1
+            if anomaly_count >= ALERT_THRESHOLD:
+                timestamp = start_time + timedelta(seconds=i)
+                if not last_alert_time or (timestamp - last_alert_time).seconds > 100:
+                    alerts.append((i, anomaly_count))
+                    last_alert_time = timestamp
+        else:
+            anomaly_count = 0
+
+    return alerts
+
+
+def synthetic_risk_categories(rows, seed):
+    """Generate a risk column with realistic bursts of consecutive 'High Risk' readings"""
+    rng = np.random.default_rng(seed)
+    # Alternate low/high segments with geometric lengths (mean 40 low, 8 high)
+    segments = rng.geometric([1 / 40, 1 / 8] * (rows // 20 + 2))
+    labels = np.tile(np.array(['Low Risk', 'High Risk'], dtype=object), len(segments) // 2)
+    return np.repeat(labels, segments)[:rows]
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks vectorized alert detection against the legacy row-by-row loop'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[10_000, 100_000, 1_000_000, 10_000_000],
+                            help='Row counts to benchmark')
+        parser.add_argument('--legacy-max-rows', type=int, default=100_000,
+                            help='Largest file to time with the legacy iloc loop (it is extrapolated beyond that)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the synthetic data')
+
+    def handle(self, *args, **options):
+        start_time = datetime(2024, 1, 1)
+        per_row_legacy_seconds = None
+        self.stdout.write(f"{'rows':>12} {'alerts':>8} {'legacy (s)':>12} {'vectorized (s)':>15} {'speedup':>9}")
+
+        for rows in options['sizes']:
+            risk = synthetic_risk_categories(rows, options['seed'])
+
+            started = time.perf_counter()
+            alert_rows, run_lengths = detect_alerts(risk)
+            urgencies = urgency_for_run_lengths(run_lengths)
+            vectorized_seconds = time.perf_counter() - started
+
+            # Check parity with the legacy decisions on every size
+            expected = reference_alert_loop(risk.tolist(), start_time)
+            actual = list(zip(alert_rows.tolist(), run_lengths.tolist()))
+            if actual != expected:
+                raise CommandError(f'Alert mismatch on {rows} rows')
+
+            if rows <= options['legacy_max_rows'] or per_row_legacy_seconds is None:
+                df = pd.DataFrame({'Risk Category': risk})
+                started = time.perf_counter()
+                legacy = legacy_alert_loop(df, start_time)
+                legacy_seconds = time.perf_counter() - started
+                if legacy != list(zip(alert_rows.tolist(), urgencies)):
+                    raise CommandError(f'Alert mismatch against the legacy loop on {rows} rows')
+                legacy_label = f'{legacy_seconds:.3f}'
+            else:
+                # iloc cost is linear in rows, so scale from the largest timed run
+                legacy_seconds = per_row_legacy_seconds * rows
+                legacy_label = f'~{legacy_seconds:.1f}'
+            per_row_legacy_seconds = legacy_seconds / rows
+
+            speedup = legacy_seconds / vectorized_seconds if vectorized_seconds else float('inf')
+            self.stdout.write(
+                f'{rows:>12} {len(alert_rows):>8} {legacy_label:>12} {vectorized_seconds:>15.4f} {speedup:>8.0f}x'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Vectorized alerts match the legacy loop on every size'))
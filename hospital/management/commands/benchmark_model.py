@@ -0,0 +1,76 @@
+import time
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital.compiled_model import CompiledVitalsModel, compile_pipeline
+from hospital.model_registry import model_registry
+
+
+def synthetic_model_inputs(model, rows, seed):
+    """Rows spread around the scaler's training statistics, with some readings exactly on split thresholds"""
+    rng = np.random.default_rng(seed)
+    compiled = CompiledVitalsModel(compile_pipeline(model))
+    data = {
+        column: rng.normal(mean, scale * 1.5, rows)
+        for column, mean, scale in zip(compiled.numeric_columns, compiled.means, compiled.scales)
+    }
+    for i, column in enumerate(compiled.categorical_columns):
+        data[column] = rng.choice(compiled.category_values[compiled.category_column == i], rows)
+    df = pd.DataFrame(data)
+
+    # Put a slice of readings exactly on split points, un-scaled back to raw units
+    n_numeric = len(compiled.numeric_columns)
+    splits = np.flatnonzero((compiled.children_left != -1) & (compiled.feature < n_numeric))
+    picks = rng.choice(splits, min(rows // 10, len(splits) * 10))
+    for row, node in enumerate(picks):
+        feature = compiled.feature[node]
+        column = compiled.numeric_columns[feature]
+        df.loc[row, column] = compiled.threshold[node] * compiled.scales[feature] + compiled.means[feature]
+    return df
+
+
+class Command(BaseCommand):
+    help = 'Checks the NumPy model export against the sklearn pipeline and compares their speed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 100, 10_000, 1_000_000],
+                            help='Batch sizes to time')
+        parser.add_argument('--parity-rows', type=int, default=200_000,
+                            help='Rows compared prediction by prediction')
+        parser.add_argument('--repeat', type=int, default=5, help='Timed runs per batch size (best is kept)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed for the synthetic data')
+
+    def handle(self, *args, **options):
+        model, version = model_registry.get()
+        compiled = CompiledVitalsModel(compile_pipeline(model, source_version=version))
+
+        df = synthetic_model_inputs(model, options['parity_rows'], options['seed'])
+        # Missing readings follow the same branch as in sklearn
+        df.iloc[::97, 0] = np.nan
+        expected = model.predict(df)
+        actual = compiled.predict(df)
+        mismatches = int((expected != actual).sum())
+        if mismatches:
+            raise CommandError(f'{mismatches} of {len(df)} predictions differ from model.predict')
+        self.stdout.write(self.style.SUCCESS(f'Compiled model {version} matches model.predict on {len(df)} rows'))
+
+        self.stdout.write(f"{'rows':>10} {'sklearn (ms)':>14} {'numpy (ms)':>12} {'numpy rows/s':>14} {'speedup':>9}")
+        for rows in options['sizes']:
+            batch = synthetic_model_inputs(model, rows, options['seed'] + rows)
+            sklearn_seconds = self.best_time(lambda: model.predict(batch), options['repeat'])
+            numpy_seconds = self.best_time(lambda: compiled.predict(batch), options['repeat'])
+            self.stdout.write(
+                f'{rows:>10} {sklearn_seconds * 1000:>14.3f} {numpy_seconds * 1000:>12.3f} '
+                f'{rows / numpy_seconds:>14,.0f} {sklearn_seconds / numpy_seconds:>8.1f}x'
+            )
+
+    @staticmethod
+    def best_time(fn, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            best = min(best, time.perf_counter() - started)
+        return best
@@ -0,0 +1,87 @@
+import gzip
+import json
+import time
+
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital import plot_payload
+from hospital.plot_payload import PAYLOAD_FORMATS, compress, figure_payload, response_body
+from hospital.visualization import (
+    create_timeseries_plot, load_timeseries_data, load_vital_signs_data, time_axis_descriptor
+)
+
+
+class Command(BaseCommand):
+    help = 'Compares the size and encoding time of JSON and binary plot payloads for a 24-hour recording'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', help='Vitals dataset directory or CSV file')
+        parser.add_argument('patient_id', type=int, help='Patient ID within the dataset')
+        parser.add_argument('--hours', type=float, default=24, help="Length of the recording, from the patient's first reading")
+        parser.add_argument('--downsample', choices=['none', 'lttb', 'rollup'], default='none')
+        parser.add_argument('--points', type=int, default=1000, help='Target points per trace when downsampling')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement; the fastest is reported')
+
+    def handle(self, *args, **options):
+        patient_id = options['patient_id']
+        readings = load_vital_signs_data(options['dataset'], patient_id=patient_id, columns=['Timestamp'])
+        if readings is None or readings.empty:
+            raise CommandError(f'No readings for patient {patient_id}')
+        start = readings['Timestamp'].min()
+        end = start + pd.Timedelta(hours=options['hours'])
+        window = (start.isoformat(), end.isoformat())
+
+        data, resolution = load_timeseries_data(options['dataset'], patient_id, *window,
+                                                target_points=options['points'], downsample=options['downsample'])
+        timestamps = load_vital_signs_data(options['dataset'], *window, patient_id=patient_id,
+                                           columns=['Timestamp'])['Timestamp']
+        point_counts = {}
+        fig = create_timeseries_plot(data, patient_id, resolution,
+                                     None if options['downsample'] == 'none' else options['points'], point_counts)
+        self.stdout.write(f"{window[0]} to {window[1]}: {len(timestamps)} readings, "
+                          f"{point_counts['returned']} points plotted ({resolution})")
+
+        encodings = ['identity', 'gzip'] + (['br'] if plot_payload.brotli is not None else [])
+        self.stdout.write(f"{'format':>7} {'encoding':>9} {'size (KB)':>10} {'encode (ms)':>12} {'decode (ms)':>12}")
+        for payload_format in PAYLOAD_FORMATS:
+            def encode():
+                plot_jsons = {
+                    'time_axis': time_axis_descriptor(timestamps),
+                    'timeseries': figure_payload(fig, payload_format),
+                }
+                return response_body(plot_jsons, payload_format).encode('utf-8')
+
+            encode_seconds, body = self.fastest(encode, options['repeat'])
+            for encoding in encodings:
+                if encoding == 'identity':
+                    compress_seconds, wire = 0.0, body
+                else:
+                    compress_seconds, wire = self.fastest(lambda: compress(body, encoding), options['repeat'])
+                decode_seconds, _ = self.fastest(lambda: self.decode(wire, encoding, payload_format), options['repeat'])
+                self.stdout.write(
+                    f"{payload_format:>7} {encoding:>9} {len(wire) / 1024:>10.1f} "
+                    f"{(encode_seconds + compress_seconds) * 1000:>12.1f} {decode_seconds * 1000:>12.1f}"
+                )
+
+    @staticmethod
+    def fastest(fn, repeat):
+        best, result = None, None
+        for _ in range(max(repeat, 1)):
+            started = time.perf_counter()
+            result = fn()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return best, result
+
+    @staticmethod
+    def decode(wire, encoding, payload_format):
+        """What a client does with the response: decompress, parse, and parse the embedded figure strings"""
+        if encoding == 'gzip':
+            wire = gzip.decompress(wire)
+        elif encoding == 'br':
+            wire = plot_payload.brotli.decompress(wire)
+        body = json.loads(wire)
+        if payload_format == 'json':
+            body['timeseries'] = json.loads(body['timeseries'])
+        return body
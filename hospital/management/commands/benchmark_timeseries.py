@@ -0,0 +1,53 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hospital.visualization import TIMESERIES_COLUMNS, create_timeseries_plot, load_timeseries_data
+
+
+class Command(BaseCommand):
+    help = 'Compares time series plot payloads with rollups, LTTB downsampling and raw readings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', help='Vitals dataset directory or CSV file')
+        parser.add_argument('patient_id', type=int, help='Patient ID within the dataset')
+        parser.add_argument('--points', type=int, default=1000, help='Target points per trace')
+        parser.add_argument('--start-time', help='Start of the window (ISO timestamp)')
+        parser.add_argument('--end-time', help='End of the window (ISO timestamp)')
+
+    def handle(self, *args, **options):
+        patient_id = options['patient_id']
+        window = (options['start_time'], options['end_time'])
+        self.stdout.write(f"{'mode':>8} {'resolution':>11} {'readings':>10} {'points':>8} {'payload (KB)':>13} {'build (s)':>10}")
+
+        raw = None
+        for mode in ('none', 'lttb', 'rollup'):
+            started = time.perf_counter()
+            data, resolution = load_timeseries_data(options['dataset'], patient_id, *window,
+                                                    target_points=options['points'], downsample=mode)
+            if data is None or data.empty:
+                raise CommandError(f'No readings for patient {patient_id}')
+            point_counts = {}
+            fig = create_timeseries_plot(data, patient_id, resolution,
+                                         None if mode == 'none' else options['points'], point_counts)
+            payload = fig.to_json()
+            seconds = time.perf_counter() - started
+            self.stdout.write(
+                f"{mode:>8} {resolution:>11} {point_counts['original']:>10} {point_counts['returned']:>8} "
+                f"{len(payload) / 1024:>13.0f} {seconds:>10.3f}"
+            )
+
+            if mode == 'none':
+                raw = data
+            elif mode == 'lttb':
+                self.check_extremes(raw, fig)
+
+    def check_extremes(self, raw, fig):
+        """LTTB must keep every vital's lowest and highest reading"""
+        kept = {trace.name: trace.y for trace in fig.data}
+        names = {'Systolic Blood Pressure': 'Systolic BP', 'Diastolic Blood Pressure': 'Diastolic BP'}
+        for column in TIMESERIES_COLUMNS[2:]:
+            values = kept[names.get(column, column)]
+            if values.min() != raw[column].min() or values.max() != raw[column].max():
+                raise CommandError(f'LTTB dropped an extreme {column} reading')
+        self.stdout.write(self.style.SUCCESS('LTTB kept the minimum and maximum of every vital'))
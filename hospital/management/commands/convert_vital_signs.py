@@ -0,0 +1,30 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from hospital.models import Issue
+from hospital.vitals_store import convert_csv_to_dataset, dataset_path_for_issue, is_vitals_dataset
+
+
+class Command(BaseCommand):
+    help = 'Converts device CSVs of existing issues into the Parquet vitals store'
+
+    def handle(self, *args, **options):
+        issues = Issue.objects.exclude(device_data__isnull=True).exclude(device_data='')
+        converted = 0
+
+        for issue in issues:
+            file_path = os.path.join(settings.BASE_DIR, issue.device_data)
+            if is_vitals_dataset(file_path):
+                continue
+            if not os.path.isfile(file_path):
+                self.stdout.write(self.style.WARNING(f'File not found for issue {issue.id}: {file_path}'))
+                continue
+
+            dataset_path = dataset_path_for_issue(issue.id)
+            convert_csv_to_dataset(file_path, dataset_path, default_patient_id=issue.patient_id)
+            Issue.objects.filter(id=issue.id).update(device_data=os.path.relpath(dataset_path, settings.BASE_DIR))
+            converted += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Converted {converted} device files into the vitals store'))
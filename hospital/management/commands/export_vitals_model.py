@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from hospital.compiled_model import compile_pipeline, save_compiled_model
+from hospital.model_registry import compiled_model_registry, model_registry
+
+
+class Command(BaseCommand):
+    help = 'Compiles the pickled vitals model into NumPy arrays that are scored without sklearn'
+
+    def handle(self, *args, **options):
+        model, version = model_registry.get()
+        arrays = compile_pipeline(model, source_version=version)
+        save_compiled_model(arrays, compiled_model_registry.path)
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported model {version} ({len(arrays['feature'])} nodes) to {compiled_model_registry.path}"
+        ))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from hospital.utils import reprocess_vital_signs_files
+
+
+class Command(BaseCommand):
+    help = 'Scores new vital signs readings for every issue with device data and creates alerts'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Processing vital signs files...')
+        reprocess_vital_signs_files()
+        self.stdout.write(self.style.SUCCESS('Vital signs alerts are up to date'))
@@ -0,0 +1,18 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from hospital.doctor_candidates import rebuild_doctor_candidates
+
+
+class Command(BaseCommand):
+    help = 'Ranks every doctor for every disease type again, for the recommendations page'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows written per INSERT')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rows = rebuild_doctor_candidates(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {rows} doctor candidates in {time.perf_counter() - started:.2f}s"))
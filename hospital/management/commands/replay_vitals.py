@@ -0,0 +1,85 @@
+import time
+
+import numpy as np
+import pandas as pd
+import requests
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Streams a device CSV to the telemetry ingestion endpoint at N times its recorded speed, for load testing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_path', help='Device CSV to replay')
+        parser.add_argument('url', help='Ingestion endpoint, e.g. http://localhost:8000/hospital/vital-signs/ingest/1/')
+        parser.add_argument('--token', required=True, help='Bearer token from VITALS_TELEMETRY_TOKENS')
+        parser.add_argument('--speed', type=float, default=1.0,
+                            help='Replay speed relative to the recorded timestamps; 0 sends as fast as possible')
+        parser.add_argument('--interval', type=float, default=0.2, help='Seconds of wall time per request')
+        parser.add_argument('--batch-rows', type=int, default=2000,
+                            help='Most readings per request; bodies must stay under DATA_UPLOAD_MAX_MEMORY_SIZE')
+        parser.add_argument('--format', choices=['ndjson', 'csv'], default='ndjson')
+        parser.add_argument('--rows', type=int, default=None, help='Replay only the first N readings')
+        parser.add_argument('--restamp', action='store_true',
+                            help='Shift timestamps so the first reading is sent as now')
+
+    def handle(self, *args, **options):
+        df = pd.read_csv(options['csv_path'], nrows=options['rows'])
+        if df.empty:
+            raise CommandError(f"No readings in {options['csv_path']}")
+
+        # Seconds after the first reading at which each reading is due, one per second without timestamps
+        if 'Timestamp' in df.columns:
+            df['Timestamp'] = pd.to_datetime(df['Timestamp'])
+            df = df.sort_values('Timestamp', kind='stable').reset_index(drop=True)
+            offsets = (df['Timestamp'] - df['Timestamp'].iloc[0]).dt.total_seconds().to_numpy()
+        else:
+            offsets = np.arange(len(df), dtype=float)
+        speed = options['speed']
+        due = offsets / speed if speed > 0 else np.zeros(len(df))
+        if options['restamp'] and 'Timestamp' in df.columns:
+            df['Timestamp'] += pd.Timestamp.now() - df['Timestamp'].iloc[0]
+
+        content_type = 'application/x-ndjson' if options['format'] == 'ndjson' else 'text/csv'
+        session = requests.Session()
+        session.headers.update({'Authorization': f"Bearer {options['token']}", 'Content-Type': content_type})
+
+        sent, retried, latencies = 0, 0, []
+        started = time.perf_counter()
+        first = 0
+        while first < len(df):
+            elapsed = time.perf_counter() - started
+            # Everything due up to one interval from now goes in this request
+            last = int(np.searchsorted(due, max(elapsed, due[first]) + options['interval'], 'right'))
+            last = min(last, first + options['batch_rows'])
+            if due[first] > elapsed:
+                time.sleep(due[first] - elapsed)
+            batch = df.iloc[first:last]
+            if options['format'] == 'ndjson':
+                body = batch.to_json(orient='records', lines=True, date_format='iso', double_precision=15)
+            else:
+                body = batch.to_csv(index=False)
+
+            while True:
+                request_started = time.perf_counter()
+                response = session.post(options['url'], data=body.encode('utf-8'))
+                latencies.append(time.perf_counter() - request_started)
+                if response.status_code != 503:
+                    break
+                retried += 1
+                time.sleep(float(response.headers.get('Retry-After', 1)))
+            if response.status_code != 202:
+                raise CommandError(f"Ingestion failed with {response.status_code}: {response.text[:200]}")
+            sent += len(batch)
+            first = last
+
+        total = time.perf_counter() - started
+        latencies_ms = np.array(latencies) * 1000
+        summary = f"Sent {sent} readings in {len(latencies)} requests over {total:.1f}s: {sent / total:.0f} readings/s"
+        if speed > 0 and due[-1] > 0:
+            summary += f" (target {len(df) / due[-1]:.0f} readings/s at x{speed:g})"
+        self.stdout.write(summary)
+        self.stdout.write(
+            f"Request latency ms: p50 {np.percentile(latencies_ms, 50):.1f}, "
+            f"p95 {np.percentile(latencies_ms, 95):.1f}, max {latencies_ms.max():.1f}; {retried} retried after 503"
+        )
@@ -0,0 +1,68 @@
+import json
+import random
+import re
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+
+def stub_answer(prompt):
+    """A plausible answer to the app's prompts: recommendation JSON or a summary"""
+    if '"recommendations"' in prompt:
+        doctor_ids = [int(doctor_id) for doctor_id in re.findall(r'"id": ?(\d+)', prompt)][:3]
+        return json.dumps({'recommendations': [
+            {'id': doctor_id, 'name': f'Doctor {doctor_id}', 'explanation': 'Recommended by the stub server.'}
+            for doctor_id in doctor_ids
+        ]})
+    return f"Stub summary of {prompt.count('Issue:')} medical issues."
+
+
+class Command(BaseCommand):
+    help = 'Runs a local stand-in for the Gemini generateContent API that adds latency and failures'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--latency', type=float, default=1.0, help='Seconds before each answer')
+        parser.add_argument('--jitter', type=float, default=0.0, help='Random extra seconds, up to this many')
+        parser.add_argument('--fail-rate', type=float, default=0.0, help='Fraction of calls answered with a 500')
+
+    def handle(self, *args, **options):
+        stdout = self.stdout
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                prompt = ''.join(part.get('text', '') for content in body.get('contents', [])
+                                 for part in content.get('parts', []))
+                time.sleep(options['latency'] + random.uniform(0, options['jitter']))
+                if random.random() < options['fail_rate']:
+                    status, payload = 500, {'error': {'code': 500, 'message': 'Injected failure'}}
+                else:
+                    answer = stub_answer(prompt)
+                    status, payload = 200, {
+                        'candidates': [{'content': {'parts': [{'text': answer}]}}],
+                        # Gemini reports its own token counts; about four characters per token here
+                        'usageMetadata': {'promptTokenCount': len(prompt) // 4, 'candidatesTokenCount': len(answer) // 4},
+                    }
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                stdout.write(f"{self.address_string()} {format % args}")
+
+        server = ThreadingHTTPServer(('127.0.0.1', options['port']), Handler)
+        self.stdout.write(
+            f"Gemini stub on http://127.0.0.1:{options['port']} with {options['latency']:g}s latency; "
+            f"set GEMINI_API_BASE_URL to it and GEMINI_API_KEY to anything"
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
@@ -0,0 +1,123 @@
+import multiprocessing
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+
+from hospital.jobs import DEFAULT_LEASE_SECONDS, claim_jobs, finish_job, heartbeat, make_worker_id
+from hospital.job_runner import init_worker_process, run_vitals_job
+from hospital.model_registry import warm_scoring_model_on_startup
+
+
+class Command(BaseCommand):
+    help = 'Runs queued vital signs processing jobs on a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=2,
+                            help='Worker processes scoring files (0 runs jobs in this process)')
+        parser.add_argument('--lease-seconds', type=int, default=DEFAULT_LEASE_SECONDS,
+                            help='How long a claimed job is reserved between heartbeats')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Seconds to wait between polls when the queue is empty')
+        parser.add_argument('--once', action='store_true',
+                            help='Exit once the queue is empty instead of polling forever')
+
+    def handle(self, *args, **options):
+        worker_id = make_worker_id()
+        processes = options['processes']
+        lease_seconds = options['lease_seconds']
+        self.stdout.write(f'Vitals worker {worker_id} starting with {processes} processes')
+
+        if processes <= 0:
+            self.run_inline(worker_id, lease_seconds, options)
+            return
+
+        # Children are spawned, not forked, so they never share this process's DB connections
+        connections.close_all()
+        pool = ProcessPoolExecutor(
+            max_workers=processes,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=init_worker_process,
+        )
+        running = {}
+        heartbeat_interval = max(1.0, lease_seconds / 3)
+        last_heartbeat = time.monotonic()
+
+        try:
+            while True:
+                free_slots = processes - len(running)
+                if free_slots > 0:
+                    for job in claim_jobs(worker_id, free_slots, lease_seconds):
+                        self.stdout.write(f'Claimed job #{job.id} for issue {job.issue_id}')
+                        running[pool.submit(run_vitals_job, job.id)] = job
+
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+
+                done, _ = wait(running, timeout=min(heartbeat_interval, options['poll_interval']),
+                               return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = {'success': False, 'timings': {}, 'error': f'Worker process failed: {e}'}
+                    self.report(worker_id, job, result)
+
+                if running and time.monotonic() - last_heartbeat >= heartbeat_interval:
+                    heartbeat(worker_id, [job.id for job in running.values()], lease_seconds)
+                    last_heartbeat = time.monotonic()
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping; unfinished jobs will be picked up again when their lease expires')
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def run_inline(self, worker_id, lease_seconds, options):
+        """Run jobs one at a time in this process"""
+        warm_scoring_model_on_startup()
+        while True:
+            jobs = claim_jobs(worker_id, 1, lease_seconds)
+            if not jobs:
+                if options['once']:
+                    return
+                time.sleep(options['poll_interval'])
+                continue
+            job = jobs[0]
+            self.stdout.write(f'Claimed job #{job.id} for issue {job.issue_id}')
+            # The lease is renewed on a thread while the job runs here, as the pool path does between waits
+            finished = threading.Event()
+            renewer = threading.Thread(target=self.keep_lease, args=(worker_id, job.id, lease_seconds, finished),
+                                       name=f'vitals-lease-{job.id}', daemon=True)
+            renewer.start()
+            try:
+                result = run_vitals_job(job.id)
+            finally:
+                finished.set()
+                renewer.join()
+            self.report(worker_id, job, result)
+
+    def keep_lease(self, worker_id, job_id, lease_seconds, finished):
+        """Renew a job's lease every third of `lease_seconds` until `finished` is set"""
+        try:
+            while not finished.wait(max(1.0, lease_seconds / 3)):
+                try:
+                    heartbeat(worker_id, [job_id], lease_seconds)
+                except Exception as e:
+                    # A missed heartbeat is retried on the next tick; the lease outlasts two of them
+                    self.stdout.write(self.style.WARNING(f'Could not renew the lease on job #{job_id}: {e}'))
+        finally:
+            connection.close()
+
+    def report(self, worker_id, job, result):
+        """Store a finished job's outcome and log it"""
+        if not finish_job(worker_id, job.id, result):
+            self.stdout.write(self.style.WARNING(f'Lost the lease on job #{job.id}; another worker owns it now'))
+        elif result['success']:
+            self.stdout.write(self.style.SUCCESS(f'Job #{job.id} succeeded in {result["timings"].get("total")}s'))
+        else:
+            self.stdout.write(self.style.ERROR(f'Job #{job.id} failed: {result["error"]}'))
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 22:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0004_alert'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='alert',
+            name='model_version',
+            field=models.CharField(blank=True, default='', help_text='Version of the risk model that scored the readings', max_length=64),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.1.7 on 2026-10-17 22:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def remove_duplicate_alerts(apps, schema_editor):
+    """Keep the oldest alert for each (issue, doctor, alert_time); reprocessing used to repeat them"""
+    Alert = apps.get_model('hospital', 'Alert')
+    seen = set()
+    duplicate_ids = []
+    for alert in Alert.objects.order_by('id').values('id', 'issue_id', 'doctor_id', 'alert_time').iterator():
+        key = (alert['issue_id'], alert['doctor_id'], alert['alert_time'])
+        if key in seen:
+            duplicate_ids.append(alert['id'])
+        else:
+            seen.add(key)
+    for start in range(0, len(duplicate_ids), 500):
+        Alert.objects.filter(id__in=duplicate_ids[start:start + 500]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0005_alert_model_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VitalSignsIngestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('file_path', models.CharField(max_length=500)),
+                ('content_hash', models.CharField(blank=True, default='', help_text='SHA-256 of the bytes processed so far', max_length=64)),
+                ('file_size', models.BigIntegerField(default=0, help_text='Bytes of the file processed so far')),
+                ('file_mtime', models.FloatField(blank=True, null=True)),
+                ('rows_processed', models.BigIntegerField(default=0, help_text='Data rows scored so far; the next run starts here')),
+                ('start_time', models.DateTimeField(help_text='Alert time of the first row, one second per row after it')),
+                ('run_length', models.PositiveIntegerField(default=0, help_text='Consecutive high-risk readings at the end of the file')),
+                ('last_alert_row', models.BigIntegerField(blank=True, null=True)),
+                ('heart_rate_tail', models.JSONField(blank=True, default=list, help_text='Last heart rate readings, for the HRV window')),
+                ('model_version', models.CharField(blank=True, default='', max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(remove_duplicate_alerts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='alert',
+            constraint=models.UniqueConstraint(fields=('issue', 'doctor', 'alert_time'), name='unique_alert_per_issue_doctor_time'),
+        ),
+        migrations.AddField(
+            model_name='vitalsignsingestion',
+            name='issue',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vital_signs_ingestions', to='hospital.issue'),
+        ),
+        migrations.AddConstraint(
+            model_name='vitalsignsingestion',
+            constraint=models.UniqueConstraint(fields=('issue', 'file_path'), name='unique_ingestion_per_issue_file'),
+        ),
+    ]
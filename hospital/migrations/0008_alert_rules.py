@@ -0,0 +1,54 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0007_vitalsignsjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('expression', models.CharField(help_text="Condition on one reading, e.g. 'spo2 < 90' or 'map < 65 or (hr > 130 and sbp < 90)'. Names: hr, rr, temp, spo2, sbp, dbp, map, pulse_pressure, hrv, bmi, age", max_length=500)),
+                ('sustained_seconds', models.PositiveIntegerField(default=0, help_text='Seconds the condition must hold before the rule fires (one reading per second)')),
+                ('cooldown_seconds', models.PositiveIntegerField(default=100, help_text='Minimum gap between two alerts from this rule for the same file')),
+                ('urgency', models.CharField(choices=[('low', 'Low'), ('medium', 'Medium'), ('high', 'High'), ('critical', 'Critical')], default='high', max_length=10)),
+                ('enabled', models.BooleanField(default=True)),
+                ('description', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.RemoveConstraint(
+            model_name='alert',
+            name='unique_alert_per_issue_doctor_time',
+        ),
+        migrations.AddField(
+            model_name='vitalsignsingestion',
+            name='rule_state',
+            field=models.JSONField(blank=True, default=dict, help_text='Open run length and last alert row of each alert rule, by rule id'),
+        ),
+        migrations.AddField(
+            model_name='alert',
+            name='rule',
+            field=models.ForeignKey(blank=True, help_text='Threshold rule that fired; empty when the risk model did', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='alerts', to='hospital.alertrule'),
+        ),
+        migrations.AddConstraint(
+            model_name='alert',
+            constraint=models.UniqueConstraint(condition=models.Q(('rule__isnull', True)), fields=('issue', 'doctor', 'alert_time'), name='unique_alert_per_issue_doctor_time'),
+        ),
+        migrations.AddConstraint(
+            model_name='alert',
+            constraint=models.UniqueConstraint(condition=models.Q(('rule__isnull', False)), fields=('issue', 'doctor', 'alert_time', 'rule'), name='unique_rule_alert_per_issue_doctor_time'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0008_alert_rules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MedicalSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(help_text='SHA-256 of the ids, update times and statuses of the issues summarized', max_length=64)),
+                ('summary', models.TextField()),
+                ('stale', models.BooleanField(default=False, help_text="Set when one of the patient's issues is saved or deleted")),
+                ('generation_seconds', models.FloatField(default=0, help_text='Time the summary took to generate')),
+                ('generated_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('patient', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='medical_summary', to='hospital.patient')),
+            ],
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0009_medicalsummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DoctorCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('specialization_match', models.PositiveSmallIntegerField(choices=[(2, 'Recommended specialization'), (1, 'Keyword specialization')])),
+                ('specialization', models.CharField(max_length=100)),
+                ('years_of_experience', models.PositiveIntegerField(default=0)),
+                ('scheduled_appointments', models.PositiveIntegerField(default=0, help_text="The doctor's appointments still scheduled")),
+                ('disease_type', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='doctor_candidates', to='hospital.diseasetype')),
+                ('doctor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='candidacies', to='hospital.doctor')),
+            ],
+            options={
+                'ordering': ['-specialization_match', '-years_of_experience', 'scheduled_appointments', 'doctor'],
+                'indexes': [models.Index(fields=['disease_type', '-specialization_match', '-years_of_experience', 'scheduled_appointments', 'doctor'], name='doctor_candidate_rank')],
+                'constraints': [models.UniqueConstraint(fields=('disease_type', 'doctor'), name='unique_candidate_per_disease_type')],
+            },
+        ),
+    ]
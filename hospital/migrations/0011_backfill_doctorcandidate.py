@@ -0,0 +1,102 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:45
+
+from django.db import migrations
+from django.db.models import Count, Q
+
+RECOMMENDED_MATCH = 2
+KEYWORD_MATCH = 1
+
+# hospital.doctor_index.SPECIALIZATION_MAP as of this migration; later edits to it must not change what it wrote
+SPECIALIZATION_MAP = {
+    'fever': ['General Medicine', 'Internal Medicine'],
+    'cold': ['General Medicine', 'ENT'],
+    'flu': ['General Medicine', 'Internal Medicine'],
+    'headache': ['Neurology', 'General Medicine'],
+    'migraine': ['Neurology'],
+    'back pain': ['Orthopedics', 'Neurology', 'Physical Therapy'],
+    'skin': ['Dermatology'],
+    'rash': ['Dermatology', 'Allergy'],
+    'stomach': ['Gastroenterology', 'General Medicine'],
+    'digestive': ['Gastroenterology'],
+    'heart': ['Cardiology'],
+    'blood pressure': ['Cardiology', 'Internal Medicine'],
+    'breathing': ['Pulmonology', 'Respiratory Medicine'],
+    'respiratory': ['Pulmonology', 'Respiratory Medicine'],
+    'eye': ['Ophthalmology'],
+    'ear': ['ENT', 'Otolaryngology'],
+    'throat': ['ENT', 'Otolaryngology'],
+    'joint': ['Orthopedics', 'Rheumatology'],
+    'bone': ['Orthopedics'],
+    'diabetes': ['Endocrinology', 'Internal Medicine'],
+    'thyroid': ['Endocrinology'],
+    'anxiety': ['Psychiatry', 'Psychology'],
+    'depression': ['Psychiatry', 'Psychology'],
+    'sleep': ['Neurology', 'Psychiatry', 'Sleep Medicine'],
+    'insomnia': ['Neurology', 'Psychiatry', 'Sleep Medicine'],
+    'kidney': ['Nephrology', 'Urology'],
+    'urinary': ['Urology', 'Nephrology'],
+    'pregnancy': ['Obstetrics', 'Gynecology', 'OB/GYN'],
+    'women': ['Gynecology', 'OB/GYN'],
+    'child': ['Pediatrics'],
+    'cancer': ['Oncology'],
+    'surgery': ['General Surgery'],
+    'allergy': ['Allergy and Immunology', 'Dermatology'],
+    'dental': ['Dentistry'],
+    'teeth': ['Dentistry'],
+    'checkup': ['General Medicine', 'Family Medicine'],
+    'general': ['General Medicine', 'Family Medicine']
+}
+
+
+def keyword_specializations(name, description):
+    """Specializations whose keywords appear in a disease type's name or description"""
+    text = f"{(name or '').lower()}\n{(description or '').lower()}"
+    return {specialization for keyword, specializations in SPECIALIZATION_MAP.items() if keyword in text
+            for specialization in specializations}
+
+
+def backfill_doctor_candidates(apps, schema_editor):
+    """Rank the existing doctors, which signals only do for doctors saved from now on"""
+    DiseaseType = apps.get_model('hospital', 'DiseaseType')
+    Doctor = apps.get_model('hospital', 'Doctor')
+    DoctorCandidate = apps.get_model('hospital', 'DoctorCandidate')
+
+    disease_types = [(disease_type, disease_type.recommended_specialization or '',
+                      keyword_specializations(disease_type.name, disease_type.description))
+                     for disease_type in DiseaseType.objects.all()]
+    doctors = Doctor.objects.annotate(scheduled=Count('appointments', filter=Q(appointments__status='scheduled')))
+    rows = []
+    for doctor in doctors.iterator(chunk_size=1000):
+        for disease_type, recommended, keywords in disease_types:
+            if recommended and doctor.specialization == recommended:
+                match = RECOMMENDED_MATCH
+            elif doctor.specialization in keywords:
+                match = KEYWORD_MATCH
+            else:
+                continue
+            rows.append(DoctorCandidate(
+                disease_type=disease_type,
+                doctor=doctor,
+                specialization_match=match,
+                specialization=doctor.specialization,
+                years_of_experience=doctor.years_of_experience,
+                scheduled_appointments=doctor.scheduled,
+            ))
+    DoctorCandidate.objects.all().delete()
+    DoctorCandidate.objects.bulk_create(rows, batch_size=1000)
+    print(f"Stored {len(rows)} doctor candidates")
+
+
+def clear_doctor_candidates(apps, schema_editor):
+    apps.get_model('hospital', 'DoctorCandidate').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0010_doctorcandidate'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_doctor_candidates, clear_doctor_candidates),
+    ]
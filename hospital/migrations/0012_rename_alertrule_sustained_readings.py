@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hospital', '0011_backfill_doctorcandidate'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='alertrule',
+            old_name='sustained_seconds',
+            new_name='sustained_readings',
+        ),
+        migrations.AlterField(
+            model_name='alertrule',
+            name='sustained_readings',
+            field=models.PositiveIntegerField(default=0, help_text='Consecutive readings the condition must hold for before the rule fires, whatever their spacing in time'),
+        ),
+    ]
@@ -0,0 +1,163 @@
+import hashlib
+import os
+import pickle
+import threading
+
+from django.conf import settings
+
+
+def default_model_path():
+    """Path of the vitals risk model artifact"""
+    return str(getattr(
+        settings,
+        'VITALS_MODEL_PATH',
+        os.path.join(settings.BASE_DIR, 'hospital', 'ml_models', 'vitals-model.pkl'),
+    ))
+
+
+def default_compiled_model_path():
+    """Path of the NumPy export of the vitals risk model"""
+    return str(getattr(
+        settings,
+        'VITALS_COMPILED_MODEL_PATH',
+        os.path.join(settings.BASE_DIR, 'hospital', 'ml_models', 'vitals-model.npz'),
+    ))
+
+
+def load_compiled_model(payload):
+    """Loader for the .npz export; imported lazily so sklearn-free processes stay that way"""
+    from .compiled_model import CompiledVitalsModel
+    return CompiledVitalsModel.from_bytes(payload)
+
+
+class ModelRegistry:
+    """
+    Process-wide holder for a vitals risk model artifact.
+    
+    The artifact (the pickled pipeline by default) is loaded once and kept in memory.
+    Each lookup only stats the file; it is re-read when its mtime or size changes, and
+    loaded again only when its content hash differs from the active version.
+    """
+    
+    def __init__(self, path=None, loader=pickle.loads, default_path=default_model_path):
+        self._path = path
+        self._loader = loader
+        self._default_path = default_path
+        self._lock = threading.Lock()
+        self._model = None
+        self._version = None
+        self._stat_key = None
+        self._artifact_key = None
+        self._artifact_version = None
+        self.load_count = 0
+    
+    @property
+    def path(self):
+        return str(self._path) if self._path else self._default_path()
+    
+    @property
+    def version(self):
+        """Short content hash of the active model, or None if nothing is loaded"""
+        return self._version
+    
+    def get(self):
+        """Return (model, version), reloading the model if the artifact has changed"""
+        path = self.path
+        stat = os.stat(path)
+        stat_key = (path, stat.st_mtime_ns, stat.st_size)
+        
+        if self._model is not None and stat_key == self._stat_key:
+            return self._model, self._version
+        
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            if self._model is not None and stat_key == self._stat_key:
+                return self._model, self._version
+            
+            with open(path, 'rb') as f:
+                payload = f.read()
+            version = hashlib.sha256(payload).hexdigest()[:12]
+            
+            if version != self._version:
+                self._model = self._loader(payload)
+                self._version = version
+                self.load_count += 1
+                print(f"Loaded vitals model {version} from {path}")
+            
+            self._stat_key = stat_key
+            return self._model, self._version
+    
+    def artifact_version(self):
+        """Content hash of the artifact on disk, without loading it"""
+        path = self.path
+        stat = os.stat(path)
+        stat_key = (path, stat.st_mtime_ns, stat.st_size)
+        if stat_key == self._stat_key:
+            return self._version
+        if stat_key != self._artifact_key:
+            with open(path, 'rb') as f:
+                self._artifact_version = hashlib.sha256(f.read()).hexdigest()[:12]
+            self._artifact_key = stat_key
+        return self._artifact_version
+    
+    def warm(self):
+        """Load the model ahead of the first request; failures are reported, not raised"""
+        try:
+            self.get()
+            return True
+        except Exception as e:
+            print(f"Could not warm vitals model from {self.path}: {e}")
+            return False
+    
+    def clear(self):
+        """Drop the cached model so the next lookup reloads it from disk"""
+        with self._lock:
+            self._model = None
+            self._version = None
+            self._stat_key = None
+
+
+model_registry = ModelRegistry()
+compiled_model_registry = ModelRegistry(loader=load_compiled_model, default_path=default_compiled_model_path)
+
+
+def get_vitals_model():
+    """Return (model, version) for the active vitals risk model"""
+    return model_registry.get()
+
+
+def get_scoring_model():
+    """
+    Return (model, version) used to score readings.
+    
+    The NumPy export is used when it was compiled from the current pickle, so scoring
+    does not need sklearn. Otherwise, or if there is no export, the pipeline is used.
+    Either way the version is the pickle's, so alerts record the same model_version.
+    """
+    if os.path.exists(compiled_model_registry.path):
+        compiled, _ = compiled_model_registry.get()
+        if compiled.source_version == model_registry.artifact_version():
+            return compiled, compiled.source_version
+        print(f"{compiled_model_registry.path} is out of date, run manage.py export_vitals_model")
+    return model_registry.get()
+
+
+def warm_scoring_model():
+    """Load the scoring model ahead of the first job; failures are reported, not raised"""
+    try:
+        get_scoring_model()
+        return True
+    except Exception as e:
+        print(f"Could not warm vitals model: {e}")
+        return False
+
+
+def warm_scoring_model_on_startup():
+    """
+    Warm the scoring model if VITALS_MODEL_WARM_ON_STARTUP is set.
+
+    Called by the web server and the vitals workers, not from AppConfig.ready, so
+    management commands such as migrate don't load the model.
+    """
+    if getattr(settings, 'VITALS_MODEL_WARM_ON_STARTUP', False):
+        warm_scoring_model()
@@ -1,9 +1,12 @@
+from django.core.exceptions import ValidationError
 from django.db import models
 from django.utils import timezone
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 from users.models import User
 
+from .alert_rules import RuleExpressionError, compile_expression
+
 # Create your models here.
 class Doctor(models.Model):
     """Doctor model representing a doctor in the system"""
@@ -95,6 +98,18 @@ class Issue(models.Model):
         disease_name = self.disease_type.name if self.disease_type else self.custom_disease_type
         return f"{disease_name} - {self.patient}"
 
+class MedicalSummary(models.Model):
+    """Last AI summary of a patient's issues, reused until the issues change"""
+    patient = models.OneToOneField(Patient, on_delete=models.CASCADE, related_name='medical_summary')
+    digest = models.CharField(max_length=64, help_text="SHA-256 of the ids, update times and statuses of the issues summarized")
+    summary = models.TextField()
+    stale = models.BooleanField(default=False, help_text="Set when one of the patient's issues is saved or deleted")
+    generation_seconds = models.FloatField(default=0, help_text="Time the summary took to generate")
+    generated_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"Medical summary for {self.patient}"
+
 class Appointment(models.Model):
     """Appointment model representing a scheduled meeting between a doctor and a patient"""
     STATUS_CHOICES = [
@@ -122,6 +137,67 @@ class Appointment(models.Model):
     class Meta:
         ordering = ['appointment_date', 'appointment_time']
 
+class DoctorCandidate(models.Model):
+    """A doctor ranked for a disease type, kept current by hospital/doctor_candidates.py"""
+    MATCH_CHOICES = [
+        (2, 'Recommended specialization'),
+        (1, 'Keyword specialization'),
+    ]
+    
+    disease_type = models.ForeignKey(DiseaseType, on_delete=models.CASCADE, related_name='doctor_candidates')
+    doctor = models.ForeignKey(Doctor, on_delete=models.CASCADE, related_name='candidacies')
+    specialization_match = models.PositiveSmallIntegerField(choices=MATCH_CHOICES)
+    # Copied from the doctor so filters and ordering stay on this table
+    specialization = models.CharField(max_length=100)
+    years_of_experience = models.PositiveIntegerField(default=0)
+    scheduled_appointments = models.PositiveIntegerField(default=0, help_text="The doctor's appointments still scheduled")
+    
+    class Meta:
+        ordering = ['-specialization_match', '-years_of_experience', 'scheduled_appointments', 'doctor']
+        indexes = [
+            models.Index(fields=['disease_type', '-specialization_match', '-years_of_experience',
+                                 'scheduled_appointments', 'doctor'], name='doctor_candidate_rank'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['disease_type', 'doctor'], name='unique_candidate_per_disease_type'),
+        ]
+    
+    def __str__(self):
+        return f"{self.doctor} for {self.disease_type}"
+
+class AlertRule(models.Model):
+    """Threshold condition on vital signs that raises alerts alongside the risk model"""
+    URGENCY_CHOICES = [
+        ('low', 'Low'),
+        ('medium', 'Medium'),
+        ('high', 'High'),
+        ('critical', 'Critical')
+    ]
+    
+    name = models.CharField(max_length=100, unique=True)
+    expression = models.CharField(max_length=500, help_text="Condition on one reading, e.g. 'spo2 < 90' or 'map < 65 or (hr > 130 and sbp < 90)'. "
+                                  "Names: hr, rr, temp, spo2, sbp, dbp, map, pulse_pressure, hrv, bmi, age")
+    sustained_readings = models.PositiveIntegerField(default=0, help_text="Consecutive readings the condition must hold for before the rule fires, whatever their spacing in time")
+    cooldown_seconds = models.PositiveIntegerField(default=100, help_text="Minimum gap between two alerts from this rule for the same file")
+    urgency = models.CharField(max_length=10, choices=URGENCY_CHOICES, default='high')
+    enabled = models.BooleanField(default=True)
+    description = models.TextField(blank=True, default='')
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['name']
+    
+    def clean(self):
+        try:
+            compile_expression(self.expression)
+        except RuleExpressionError as e:
+            raise ValidationError({'expression': str(e)})
+    
+    def __str__(self):
+        return f"{self.name}: {self.expression}"
+
 class Alert(models.Model):
     URGENCY_CHOICES = [
         ('low', 'Low'),
@@ -149,6 +225,9 @@ class Alert(models.Model):
     title = models.CharField(max_length=200)
     message = models.TextField()
     vital_signs_data = models.JSONField()  # Store the relevant vital signs that triggered the alert
+    model_version = models.CharField(max_length=64, blank=True, default='', help_text="Version of the risk model that scored the readings")
+    rule = models.ForeignKey(AlertRule, on_delete=models.PROTECT, null=True, blank=True, related_name='alerts',
+                             help_text="Threshold rule that fired; empty when the risk model did")
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -160,9 +239,51 @@ class Alert(models.Model):
             models.Index(fields=['status']),
             models.Index(fields=['doctor', 'status']),
         ]
+        constraints = [
+            # One model alert, and one per rule, for each doctor at a given time
+            models.UniqueConstraint(fields=['issue', 'doctor', 'alert_time'], condition=models.Q(rule__isnull=True),
+                                    name='unique_alert_per_issue_doctor_time'),
+            models.UniqueConstraint(fields=['issue', 'doctor', 'alert_time', 'rule'], condition=models.Q(rule__isnull=False),
+                                    name='unique_rule_alert_per_issue_doctor_time'),
+        ]
 
     def __str__(self):
         return f"Alert for {self.patient} - {self.title} ({self.get_urgency_display()})"
+    
+    @property
+    def source(self):
+        """What raised the alert: a threshold rule or the risk model"""
+        if self.rule_id:
+            return f"Rule: {self.rule.name}"
+        return f"Risk model {self.model_version}".strip()
+
+class VitalSignsIngestion(models.Model):
+    """Ledger of how far a device data file has been scored for alerts"""
+    issue = models.ForeignKey(Issue, on_delete=models.CASCADE, related_name='vital_signs_ingestions')
+    file_path = models.CharField(max_length=500)
+    content_hash = models.CharField(max_length=64, blank=True, default='', help_text="SHA-256 of the bytes processed so far")
+    file_size = models.BigIntegerField(default=0, help_text="Bytes of the file processed so far")
+    file_mtime = models.FloatField(null=True, blank=True)
+    rows_processed = models.BigIntegerField(default=0, help_text="Data rows scored so far; the next run starts here")
+    start_time = models.DateTimeField(help_text="Alert time of the first row, one second per row after it")
+    
+    # Alert state carried over to the next run
+    run_length = models.PositiveIntegerField(default=0, help_text="Consecutive high-risk readings at the end of the file")
+    last_alert_row = models.BigIntegerField(null=True, blank=True)
+    heart_rate_tail = models.JSONField(default=list, blank=True, help_text="Last heart rate readings, for the HRV window")
+    rule_state = models.JSONField(default=dict, blank=True, help_text="Open run length and last alert row of each alert rule, by rule id")
+    model_version = models.CharField(max_length=64, blank=True, default='')
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['issue', 'file_path'], name='unique_ingestion_per_issue_file'),
+        ]
+    
+    def __str__(self):
+        return f"{self.file_path} - {self.rows_processed} rows"
 
 # Signal handlers to ensure Doctor and Patient records exist for respective users
 @receiver(post_save, sender=User)
@@ -211,3 +332,43 @@ def create_user_profile(sender, instance, created, **kwargs):
             patient, patient_created = Patient.objects.get_or_create(
                 user=instance
             )
+
+class VitalSignsJob(models.Model):
+    """Queued request to score an uploaded device data file, run by `manage.py run_vitals_worker`"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    
+    issue = models.ForeignKey(Issue, on_delete=models.CASCADE, related_name='vital_signs_jobs')
+    file_path = models.CharField(max_length=500)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    
+    # Lease held by the worker running the job; an expired lease lets another worker take over
+    worker_id = models.CharField(max_length=100, blank=True, default='')
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    
+    enqueued_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    timings = models.JSONField(default=dict, blank=True, help_text="Seconds spent in each processing step")
+    error = models.TextField(blank=True, default='')
+    
+    class Meta:
+        ordering = ['enqueued_at']
+        indexes = [
+            models.Index(fields=['status', 'enqueued_at']),
+        ]
+    
+    def __str__(self):
+        return f"Vital signs job #{self.id} for issue {self.issue_id} ({self.get_status_display()})"
+    
+    @property
+    def duration_seconds(self):
+        if self.started_at and self.finished_at:
+            return (self.finished_at - self.started_at).total_seconds()
+        return None
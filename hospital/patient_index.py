@@ -0,0 +1,140 @@
+"""
+Per-patient row index over multi-patient readings.
+
+A source's readings are sorted once by (Patient ID, Timestamp), so each patient's
+rows form one contiguous range, and within it the timestamps are sorted. Finding a
+patient is then a binary search over the patient ids, and a time window within the
+patient a binary search over that range: O(log n + k) for k rows returned, instead
+of boolean scans over every reading. Datasets keep the sort order and the ranges in
+_patient_index.npz, tagged with the manifest content hash they were built for.
+"""
+import io
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from .frame_cache import frame_bytes
+from .vitals_store import as_naive_timestamp
+
+PATIENT_INDEX_NAME = '_patient_index.npz'
+
+
+class PatientIndexedFrame:
+    """Readings sorted by patient and time, with the row range of every patient"""
+
+    def __init__(self, data, patients, starts):
+        self.data = data
+        self.patients = patients
+        # Rows of patients[i] are starts[i]:starts[i + 1]
+        self.starts = starts
+        self.timestamps = data['Timestamp'].to_numpy()
+
+    @classmethod
+    def build(cls, data, order=None, patients=None, starts=None):
+        """
+        Index `data`, sorting it first unless a stored `order` with its ranges is given.
+
+        Rows without a Patient ID are kept at the end, outside every patient's range.
+        Rows keep their index labels, so a frame indexed by row number still tells the
+        order the readings came in.
+        """
+        if order is None:
+            order = data.sort_values(['Patient ID', 'Timestamp'], kind='stable', na_position='last').index
+            order = np.asarray(order, dtype=np.int64)
+        data = data.take(order)
+        if patients is None:
+            ids = data['Patient ID']
+            known = int(ids.notna().sum())
+            ids = ids.iloc[:known].to_numpy(dtype=np.int64)
+            boundaries = np.flatnonzero(ids[1:] != ids[:-1]) + 1
+            starts = np.concatenate(([0], boundaries, [known])).astype(np.int64)
+            patients = ids[starts[:-1]]
+        return cls(data, patients, starts), order
+
+    @property
+    def nbytes(self):
+        return frame_bytes(self.data) + self.patients.nbytes + self.starts.nbytes
+
+    def rows(self, patient_id=None, start_time=None, end_time=None):
+        """Row positions in `data` of a patient's readings within the window (inclusive)"""
+        if patient_id is None:
+            ranges = zip(self.starts[:-1].tolist(), self.starts[1:].tolist())
+        else:
+            i = self.patients.searchsorted(int(patient_id))
+            if i == len(self.patients) or self.patients[i] != int(patient_id):
+                return np.arange(0)
+            ranges = [(int(self.starts[i]), int(self.starts[i + 1]))]
+
+        pieces = []
+        for first, last in ranges:
+            if start_time is not None or end_time is not None:
+                timestamps = self.timestamps[first:last]
+                low, high = 0, last - first
+                if start_time is not None:
+                    low = timestamps.searchsorted(as_naive_timestamp(start_time).to_datetime64(), 'left')
+                if end_time is not None:
+                    high = timestamps.searchsorted(as_naive_timestamp(end_time).to_datetime64(), 'right')
+                first, last = first + low, first + max(low, high)
+            pieces.append(np.arange(first, last))
+        return np.concatenate(pieces) if pieces else np.arange(0)
+
+    def select(self, patient_id=None, start_time=None, end_time=None):
+        """Readings of a patient (or everyone) within the window, sorted by patient and time"""
+        if patient_id is None and start_time is None and end_time is None:
+            return self.data
+        rows = self.rows(patient_id, start_time, end_time)
+        if patient_id is not None and len(rows):
+            # One patient's readings are a single slice; no need to gather them
+            return self.data.iloc[rows[0]:rows[-1] + 1]
+        return self.data.take(rows)
+
+
+def patient_index_path(path):
+    return os.path.join(path, PATIENT_INDEX_NAME)
+
+
+def read_patient_index(path, content_hash):
+    """A dataset's stored (order, patients, starts) if built for version `content_hash`, else None"""
+    try:
+        with open(patient_index_path(path), 'rb') as f:
+            with np.load(io.BytesIO(f.read()), allow_pickle=False) as arrays:
+                if str(arrays['content_hash']) != content_hash:
+                    return None
+                return arrays['order'], arrays['patients'], arrays['starts']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def write_patient_index(path, index, order, content_hash):
+    target = patient_index_path(path)
+    temp = f"{target}.{uuid.uuid4().hex}.tmp"
+    with open(temp, 'wb') as f:
+        np.savez(f, order=order, patients=index.patients, starts=index.starts,
+                 content_hash=np.array(content_hash, dtype=str))
+    os.replace(temp, target)
+
+
+def index_vitals_frame(data, path=None, content_hash=None):
+    """
+    PatientIndexedFrame over `data` read in upload order, labelled by upload row.
+
+    For a dataset (`path` and its `content_hash`), the stored sort order is reused when
+    it is current and written after sorting otherwise. Returns None if `data` has no
+    Patient ID or Timestamp column to index on.
+    """
+    if 'Patient ID' not in data.columns or 'Timestamp' not in data.columns:
+        return None
+    data = data.reset_index(drop=True)
+    stored = read_patient_index(path, content_hash) if path else None
+    if stored is not None and len(stored[0]) == len(data):
+        return PatientIndexedFrame.build(data, *stored)[0]
+
+    index, order = PatientIndexedFrame.build(data)
+    if path:
+        try:
+            write_patient_index(path, index, order, content_hash)
+        except OSError as e:
+            print(f"Could not write patient index for {path}: {e}")
+    return index
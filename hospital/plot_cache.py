@@ -0,0 +1,133 @@
+"""
+Two-tier cache of rendered plot JSON.
+
+Each entry is the part of a vital_signs_data response produced by one figure kind,
+keyed by the source's content hash, the patient, the normalized time window and the
+figure's options. Entries live in a process-local LRU and on disk, so other worker
+processes and restarts reuse them. When a source's content changes its hash does too:
+old entries are never looked up again, and are dropped from both tiers as soon as an
+entry for the new version is stored.
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+
+from django.conf import settings
+
+from .frame_cache import SizedLRUCache, source_key
+from .ingestion import HASH_BLOCK_SIZE
+from .vitals_store import as_naive_timestamp, is_vitals_dataset, read_manifest
+
+# Bump when the figures change so entries rendered by older code are not served
+PLOT_CACHE_FORMAT = 2
+
+
+def payload_bytes(payload):
+    return sum(len(value) if isinstance(value, str) else 64 for value in payload.values())
+
+
+class PlotCache:
+    """Memory-then-disk cache of figure payloads with hit-rate counters"""
+
+    def __init__(self, root=None):
+        self._root = root
+        self._lock = threading.Lock()
+        self.memory = SizedLRUCache(sizeof=payload_bytes, budget_setting='VITALS_PLOT_CACHE_BYTES',
+                                    default_max_bytes=64 * 1024 * 1024)
+        # Content hashes of CSV sources, so each file version is hashed once
+        self._csv_hashes = {}
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    @property
+    def root(self):
+        if self._root:
+            return str(self._root)
+        return str(getattr(settings, 'VITALS_PLOT_CACHE_DIR', os.path.join(settings.BASE_DIR, 'plot_cache')))
+
+    def source_version(self, path):
+        """Content hash of a dataset (from its manifest) or CSV file"""
+        if is_vitals_dataset(path):
+            return read_manifest(path)['content_hash']
+        stat_key = source_key(path)
+        content_hash = self._csv_hashes.get(stat_key)
+        if content_hash is None:
+            digest = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                    digest.update(block)
+            content_hash = digest.hexdigest()
+            with self._lock:
+                for stale in [k for k in self._csv_hashes if k[0] == stat_key[0]]:
+                    del self._csv_hashes[stale]
+                self._csv_hashes[stat_key] = content_hash
+        return content_hash
+
+    @staticmethod
+    def params_key(kind, patient_id=None, start_time=None, end_time=None, **options):
+        """Canonical text for everything a figure depends on besides the source"""
+        window = [as_naive_timestamp(t).isoformat() if t else None for t in (start_time, end_time)]
+        return json.dumps([PLOT_CACHE_FORMAT, kind, patient_id, window, options], sort_keys=True)
+
+    def _source_dir(self, source):
+        return os.path.join(self.root, hashlib.sha1(os.path.abspath(source).encode()).hexdigest()[:16])
+
+    def _disk_path(self, source, version, params):
+        name = hashlib.sha1(params.encode()).hexdigest()
+        return os.path.join(self._source_dir(source), version[:16], f'{name}.json')
+
+    def get(self, source, version, params):
+        """Cached payload for a figure, or None"""
+        key = (os.path.abspath(source), version, params)
+        payload = self.memory.get(key)
+        if payload is not None:
+            self.memory_hits += 1
+            return payload
+
+        try:
+            with open(self._disk_path(source, version, params)) as f:
+                payload = json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        self.memory.put(key, payload)
+        return payload
+
+    def put(self, source, version, params, payload):
+        self.memory.put((os.path.abspath(source), version, params), payload)
+
+        target = self._disk_path(source, version, params)
+        version_dir = os.path.dirname(target)
+        if not os.path.isdir(version_dir):
+            # First entry for this version of the source: drop the older versions' files
+            source_dir = self._source_dir(source)
+            if os.path.isdir(source_dir):
+                for name in os.listdir(source_dir):
+                    if name != version[:16]:
+                        shutil.rmtree(os.path.join(source_dir, name), ignore_errors=True)
+            os.makedirs(version_dir, exist_ok=True)
+        temp = f"{target}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(temp, 'w') as f:
+                json.dump(payload, f)
+            os.replace(temp, target)
+        except OSError as e:
+            print(f"Could not write plot cache entry {target}: {e}")
+
+    def stats(self):
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else None,
+            'memory': self.memory.stats(),
+        }
+
+
+plot_cache = PlotCache()
@@ -0,0 +1,147 @@
+"""
+Compact encodings of vital signs plot payloads.
+
+The 'json' format is the original one: each figure is plotly's fig.to_json() string,
+wrapped in the response's own JSON. The 'binary' format writes trace arrays as
+base64 typed arrays that plotly.js decodes natively: float32 for readings and
+float64 epoch milliseconds for timestamps (plotly.js has no 64-bit integer arrays).
+Figures are embedded in the response as JSON objects, so the client parses them once.
+Responses are compressed with brotli (if installed) or gzip when the client accepts it.
+"""
+import base64
+import gzip
+import json
+
+import numpy as np
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from plotly.utils import PlotlyJSONEncoder
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+PAYLOAD_FORMATS = ('json', 'binary')
+
+# Response fields holding a figure, as opposed to metadata about one
+FIGURE_FIELDS = ['timeseries', 'radar', 'gauges', 'distribution', 'correlation', 'risk_analysis']
+
+# Smaller bodies aren't worth compressing
+COMPRESS_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def typed_array(values, dtype):
+    """plotly.js typed array spec of `values` as `dtype` ('f4', 'f8', 'i4', ...)"""
+    data = np.ascontiguousarray(values, dtype=np.dtype(dtype).newbyteorder('<'))
+    return {'dtype': dtype, 'bdata': base64.b64encode(data.tobytes()).decode('ascii')}
+
+
+def epoch_milliseconds(values):
+    """Naive (UTC) datetime64 values as float64 milliseconds since the epoch"""
+    values = np.asarray(values, dtype='datetime64[ns]')
+    return values.astype(np.int64) / 1e6
+
+
+def _compact_arrays(value):
+    """Re-encode float64 typed arrays plotly produced as float32, recursively"""
+    if isinstance(value, dict):
+        if value.get('dtype') == 'f8' and 'bdata' in value:
+            values = np.frombuffer(base64.b64decode(value['bdata']), dtype='<f8')
+            return typed_array(values, 'f4')
+        return {key: _compact_arrays(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_compact_arrays(item) for item in value]
+    return value
+
+
+def compact_figure(fig):
+    """A figure as a JSON-ready dict with its trace arrays in compact typed arrays"""
+    figure = fig.to_plotly_json()
+    layout = figure.get('layout', {})
+    traces = []
+    for trace in figure.get('data', []):
+        trace = _compact_arrays(trace)
+        for axis in ('x', 'y'):
+            values = trace.get(axis)
+            if isinstance(values, np.ndarray) and np.issubdtype(values.dtype, np.datetime64):
+                trace[axis] = typed_array(epoch_milliseconds(values), 'f8')
+                # Numbers only show as dates on axes typed as dates
+                name = trace.get(f'{axis}axis', axis)
+                axis_key = f"{axis}axis{name[1:]}"
+                layout[axis_key] = dict(layout.get(axis_key, {}), type='date')
+        traces.append(trace)
+    figure['data'] = traces
+    figure['layout'] = layout
+    return figure
+
+
+def figure_payload(fig, payload_format):
+    """A figure as stored in the plot cache and sent in responses: JSON text either way"""
+    if payload_format == 'binary':
+        return json.dumps(compact_figure(fig), cls=PlotlyJSONEncoder, separators=(',', ':'))
+    return fig.to_json()
+
+
+def timestamps_payload(timestamps, payload_format):
+    """A page of exact reading times: ISO strings, or epoch milliseconds"""
+    if payload_format == 'binary':
+        return typed_array(epoch_milliseconds(timestamps.to_numpy()), 'f8')
+    return timestamps.dt.strftime('%Y-%m-%dT%H:%M:%S.%fZ').tolist()
+
+
+def response_body(plot_jsons, payload_format):
+    """
+    The vital_signs_data response body.
+
+    In the binary format figures are spliced in as they are stored, already JSON, rather
+    than being escaped into strings.
+    """
+    if payload_format != 'binary':
+        return json.dumps(plot_jsons)
+    fields = ['"format":"binary"']
+    for key, value in plot_jsons.items():
+        raw = value if key in FIGURE_FIELDS else json.dumps(value, separators=(',', ':'))
+        fields.append(f'{json.dumps(key)}:{raw}')
+    return '{' + ','.join(fields) + '}'
+
+
+def accepted_encoding(request):
+    """'br', 'gzip' or None, the best encoding both sides support"""
+    accepted = set()
+    for item in request.headers.get('Accept-Encoding', '').split(','):
+        name, _, params = item.partition(';')
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                if float(params[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        accepted.add(name.strip().lower())
+    if brotli is not None and 'br' in accepted:
+        return 'br'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def compressed_json_response(request, body, status=200):
+    """JSON response with `body` compressed in the best encoding the client accepts"""
+    body = body.encode('utf-8')
+    encoding = accepted_encoding(request) if len(body) >= COMPRESS_MIN_BYTES else None
+    if encoding:
+        body = compress(body, encoding)
+    response = HttpResponse(body, content_type='application/json', status=status)
+    if encoding:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
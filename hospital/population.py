@@ -0,0 +1,253 @@
+"""
+Precomputed statistics behind the population figures.
+
+The distribution, correlation and risk analysis figures don't depend on the patient,
+so they are drawn from a few mergeable aggregates instead of the raw readings:
+fine-grained histogram bin counts, pairwise moments for the correlation matrix and
+per-risk-category sums. A dataset keeps the aggregates of all its readings in
+_population.json, tagged with the manifest content hash they describe; each append
+folds its chunk in, so they are only refreshed when the data changes.
+"""
+import json
+import math
+import os
+import uuid
+
+import numpy as np
+import pandas as pd
+
+POPULATION_NAME = '_population.json'
+
+# Width of the stored histogram bins; figures group them into coarser bars
+HISTOGRAM_BIN_WIDTHS = {
+    'Heart Rate': 0.1,
+    'Respiratory Rate': 0.1,
+    'Body Temperature': 0.01,
+    'Oxygen Saturation': 0.01,
+    'Systolic Blood Pressure': 0.1,
+    'Diastolic Blood Pressure': 0.1,
+}
+RISK_VITALS = list(HISTOGRAM_BIN_WIDTHS)
+CORRELATION_COLUMNS = RISK_VITALS + [
+    'Age', 'Weight (kg)', 'Height (m)', 'Derived_HRV', 'Derived_Pulse_Pressure',
+    'Derived_BMI', 'Derived_MAP',
+]
+PAIR_MOMENTS = ['n', 'mean', 'm2', 'cxy']
+# Version of the stored aggregates; files in another format are rebuilt
+POPULATION_FORMAT = 2
+# Relative spread below which a column counts as constant, as rounding noise
+CONSTANT_TOLERANCE = 1e-12
+
+
+def _numeric(df, columns):
+    return df[columns].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+
+
+def population_stats(df):
+    """Aggregates of a frame of readings that population_stats results can be merged from"""
+    stats = {'rows': len(df), 'histograms': {}, 'ranges': {}, 'correlation': None, 'risk': {}}
+
+    for vital, width in HISTOGRAM_BIN_WIDTHS.items():
+        if vital not in df.columns:
+            continue
+        values = _numeric(df, [vital])[:, 0]
+        values = values[~np.isnan(values)]
+        if not len(values):
+            continue
+        bins, counts = np.unique(np.floor(values / width).astype(np.int64), return_counts=True)
+        stats['histograms'][vital] = {'width': width, 'bins': dict(zip(map(str, bins.tolist()), counts.tolist()))}
+
+    for column in CORRELATION_COLUMNS:
+        if column in df.columns:
+            values = _numeric(df, [column])[:, 0]
+            if not np.isnan(values).all():
+                stats['ranges'][column] = [float(np.nanmin(values)), float(np.nanmax(values))]
+
+    # Pairwise-complete moments, matching DataFrame.corr()'s handling of missing values:
+    # for the rows where columns i and j are both present, mean[i][j] is the mean of
+    # column i and m2[i][j] the sum of its squared deviations, and cxy[i][j] the sum of
+    # products of both columns' deviations. Centred moments merge without the
+    # cancellation that raw sums suffer from.
+    columns = [c for c in CORRELATION_COLUMNS if c in df.columns]
+    if columns:
+        X = _numeric(df, columns)
+        present = ~np.isnan(X)
+        X = np.nan_to_num(X)
+        weights = present.astype(np.float64)
+        n = weights.T @ weights
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean = np.where(n > 0, (X.T @ weights) / n, 0.0)
+        m2, cxy = np.zeros_like(n), np.zeros_like(n)
+        for j in range(len(columns)):
+            both = weights * weights[:, [j]]
+            # Column i about mean[i][j], and column j about mean[j][i], over their common rows
+            deviations = (X - mean[:, j]) * both
+            partner = (X[:, [j]] - mean[j, :]) * both
+            m2[:, j] = (deviations * deviations).sum(axis=0)
+            cxy[:, j] = (deviations * partner).sum(axis=0)
+        stats['correlation'] = {
+            'columns': columns,
+            'n': n.tolist(),
+            'mean': mean.tolist(),
+            'm2': m2.tolist(),
+            'cxy': cxy.tolist(),
+        }
+
+    vitals = [v for v in RISK_VITALS if v in df.columns]
+    if 'Risk Category' in df.columns:
+        numeric = pd.DataFrame(_numeric(df, vitals), columns=vitals, index=df.index)
+        grouped = numeric.groupby(df['Risk Category'].astype(str).where(df['Risk Category'].notna()))
+        sums, counts, sizes = grouped.sum(), grouped.count(), grouped.size()
+        for category in sizes.index:
+            stats['risk'][category] = {
+                'rows': int(sizes[category]),
+                'sums': {v: float(sums.at[category, v]) for v in vitals},
+                'counts': {v: int(counts.at[category, v]) for v in vitals},
+            }
+    return stats
+
+
+def _add_counts(a, b):
+    merged = dict(a)
+    for key, value in b.items():
+        merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def _merge_correlation(a, b):
+    if a is None or b is None:
+        return a or b
+    columns = a['columns'] + [c for c in b['columns'] if c not in a['columns']]
+
+    def aligned(part):
+        # Pairs a part has no readings of count as zero rows
+        return [pd.DataFrame(part[name], index=part['columns'], columns=part['columns'])
+                .reindex(index=columns, columns=columns, fill_value=0.0).to_numpy(dtype=np.float64)
+                for name in PAIR_MOMENTS]
+
+    (na, mean_a, m2_a, cxy_a), (nb, mean_b, m2_b, cxy_b) = aligned(a), aligned(b)
+    # Chan et al.'s pairwise update of means and co-moments
+    n = na + nb
+    with np.errstate(divide='ignore', invalid='ignore'):
+        share = np.where(n > 0, nb / n, 0.0)
+        weight = np.where(n > 0, na * nb / n, 0.0)
+    delta = mean_b - mean_a
+    return {
+        'columns': columns,
+        'n': n.tolist(),
+        'mean': (mean_a + delta * share).tolist(),
+        'm2': (m2_a + m2_b + delta * delta * weight).tolist(),
+        'cxy': (cxy_a + cxy_b + delta * delta.T * weight).tolist(),
+    }
+
+
+def merge_population_stats(a, b):
+    """Aggregates of two sets of readings combined"""
+    merged = {'rows': a['rows'] + b['rows'], 'histograms': dict(a['histograms']),
+              'ranges': dict(a['ranges']), 'risk': dict(a['risk'])}
+    for vital, histogram in b['histograms'].items():
+        if vital in merged['histograms']:
+            histogram = dict(histogram, bins=_add_counts(merged['histograms'][vital]['bins'], histogram['bins']))
+        merged['histograms'][vital] = histogram
+    for column, (low, high) in b['ranges'].items():
+        if column in merged['ranges']:
+            low, high = min(low, merged['ranges'][column][0]), max(high, merged['ranges'][column][1])
+        merged['ranges'][column] = [low, high]
+    merged['correlation'] = _merge_correlation(a['correlation'], b['correlation'])
+    for category, group in b['risk'].items():
+        if category in merged['risk']:
+            current = merged['risk'][category]
+            group = {
+                'rows': current['rows'] + group['rows'],
+                'sums': _add_counts(current['sums'], group['sums']),
+                'counts': _add_counts(current['counts'], group['counts']),
+            }
+        merged['risk'][category] = group
+    return merged
+
+
+def histogram_bars(stats, vital, nbins):
+    """(centers, counts, width) of about `nbins` bars for a vital, or None without readings"""
+    histogram = stats['histograms'].get(vital)
+    if not histogram:
+        return None
+    bins = np.array([int(b) for b in histogram['bins']], dtype=np.int64)
+    counts = np.array(list(histogram['bins'].values()), dtype=np.int64)
+    # Group the stored bins into bars that are a whole number of bins wide
+    group = max(1, math.ceil((bins.max() - bins.min() + 1) / nbins))
+    bars, totals = np.unique(bins // group, return_inverse=True)
+    totals = np.bincount(totals, weights=counts).astype(np.int64)
+    width = group * histogram['width']
+    return (bars * group) * histogram['width'] + width / 2, totals, width
+
+
+def correlation_matrix(stats):
+    """Pearson correlation of the population's numeric columns as a DataFrame"""
+    pairs = stats['correlation']
+    if pairs is None:
+        return None
+    n, mean, m2, cxy = (np.array(pairs[name], dtype=np.float64) for name in PAIR_MOMENTS)
+    # Columns that never change come out with rounding noise rather than exactly zero
+    m2 = np.where(m2 <= n * (CONSTANT_TOLERANCE * mean) ** 2, 0.0, m2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        corr = cxy / np.sqrt(m2 * m2.T)
+    corr[(n < 2) | (m2 == 0) | (m2.T == 0)] = np.nan
+    np.fill_diagonal(corr, np.where((np.diag(m2) > 0) & (np.diag(n) >= 2), 1.0, np.nan))
+    return pd.DataFrame(np.clip(corr, -1, 1), index=pairs['columns'], columns=pairs['columns'])
+
+
+def risk_counts(stats):
+    """Readings per risk category, most common first"""
+    counts = pd.Series({category: group['rows'] for category, group in stats['risk'].items()}, dtype='int64')
+    return counts.sort_values(ascending=False, kind='stable')
+
+
+def risk_group_means(stats):
+    """Mean of each vital per risk category, categories sorted by name"""
+    means = {
+        category: {v: group['sums'][v] / group['counts'][v] if group['counts'][v] else np.nan
+                   for v in group['sums']}
+        for category, group in stats['risk'].items()
+    }
+    return pd.DataFrame.from_dict(means, orient='index').sort_index()
+
+
+def population_path(path):
+    return os.path.join(path, POPULATION_NAME)
+
+
+def read_population_stats(path, content_hash):
+    """A dataset's stored aggregates if they describe version `content_hash`, else None"""
+    try:
+        with open(population_path(path)) as f:
+            stored = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if stored.get('format') != POPULATION_FORMAT or stored.get('content_hash') != content_hash:
+        return None
+    return stored['stats']
+
+
+def write_population_stats(path, stats, content_hash):
+    target = population_path(path)
+    temp = f"{target}.{uuid.uuid4().hex}.tmp"
+    with open(temp, 'w') as f:
+        json.dump({'format': POPULATION_FORMAT, 'content_hash': content_hash, 'stats': stats}, f)
+    os.replace(temp, target)
+
+
+def update_population_stats(path, df, previous_hash, content_hash):
+    """
+    Fold a chunk being appended into a dataset's aggregates.
+
+    Only aggregates that are current for `previous_hash` are extended; missing or
+    stale ones are left for the next population figure request to rebuild.
+    """
+    if previous_hash is None:
+        stats = population_stats(df)
+    else:
+        stats = read_population_stats(path, previous_hash)
+        if stats is None:
+            return
+        stats = merge_population_stats(stats, population_stats(df))
+    write_population_stats(path, stats, content_hash)
@@ -0,0 +1,53 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from users.models import User
+from .doctor_candidates import refresh_disease_type_candidates, refresh_doctor_candidates, refresh_scheduled_appointments
+from .doctor_index import doctor_index
+from .models import Appointment, DiseaseType, Doctor, Issue
+from .summaries import mark_summary_stale
+
+
+@receiver([post_save, post_delete], sender=Issue)
+def invalidate_medical_summary(sender, instance, **kwargs):
+    """A patient's stored summary no longer covers their issues once one changes"""
+    mark_summary_stale(instance.patient_id)
+
+
+@receiver(post_save, sender=Doctor)
+def index_doctor(sender, instance, **kwargs):
+    """Re-file a saved doctor in the recommendation index once the save commits"""
+    transaction.on_commit(partial(doctor_index.update, instance))
+
+
+@receiver(post_delete, sender=Doctor)
+def unindex_doctor(sender, instance, **kwargs):
+    """Drop a deleted doctor from the recommendation index once the delete commits"""
+    transaction.on_commit(partial(doctor_index.remove, instance.id))
+
+
+@receiver(post_save, sender=User)
+def rename_indexed_doctor(sender, instance, **kwargs):
+    """Doctor names in the recommendation index come from their user"""
+    transaction.on_commit(partial(doctor_index.rename, instance))
+
+
+@receiver(post_save, sender=Doctor)
+def rank_doctor(sender, instance, **kwargs):
+    """Re-rank a saved doctor as a candidate for each disease type"""
+    refresh_doctor_candidates(instance)
+
+
+@receiver(post_save, sender=DiseaseType)
+def rank_disease_type_doctors(sender, instance, **kwargs):
+    """Re-rank the doctors for a saved disease type"""
+    refresh_disease_type_candidates(instance)
+
+
+@receiver([post_save, post_delete], sender=Appointment)
+def count_scheduled_appointments(sender, instance, **kwargs):
+    """Candidates rank doctors with fewer scheduled appointments first"""
+    refresh_scheduled_appointments(instance.doctor_id)
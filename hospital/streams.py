@@ -0,0 +1,140 @@
+"""
+ASGI serving of live event streams.
+
+Django runs each ASGI request in its own ThreadSensitiveContext, whose thread stays
+alive until the response ends, so a stream left open for hours would hold a thread for
+hours. live_streams() wraps the Django application and serves the stream URLs itself:
+the session and permission checks run once in the shared thread pool, and after that
+an open stream is only a coroutine waiting on its Subscriber.
+
+Under WSGI the same URLs reach the Django views, which answer 501 so pages poll instead.
+"""
+import asyncio
+import io
+import json
+from importlib import import_module
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user
+from django.core.handlers.asgi import ASGIRequest
+from django.db import close_old_connections
+from django.urls import Resolver404, resolve
+
+from .live_events import event_stream, live_hub
+from .models import Appointment, Doctor, Issue
+from .telemetry import stored_readings, telemetry_buffer
+
+STREAM_VIEWS = ['hospital:vital_signs_stream', 'hospital:doctor_alerts_stream']
+
+
+def can_view_issue_vitals(user, issue):
+    """Staff see every issue's readings, doctors those of their patients, patients only their own"""
+    if user.is_staff or issue.patient.user_id == user.id:
+        return True
+    # As in visualize_vital_signs, a doctor needs an appointment with the patient
+    return user.is_doctor() and Appointment.objects.filter(doctor__user=user, patient=issue.patient).exists()
+
+
+def authorize_stream(scope, view_name, kwargs):
+    """
+    Check the session behind a stream request.
+
+    Returns (topics, issue, after) for the stream, or (status, error) if it is refused.
+    """
+    request = ASGIRequest(scope, io.BytesIO())
+    engine = import_module(settings.SESSION_ENGINE)
+    request.session = engine.SessionStore(request.COOKIES.get(settings.SESSION_COOKIE_NAME))
+    try:
+        user = get_user(request)
+        if not user.is_authenticated:
+            return 401, 'Authentication required'
+
+        if view_name == 'hospital:doctor_alerts_stream':
+            doctor = Doctor.objects.filter(user=user).first() if user.is_doctor() else None
+            if doctor is None:
+                return 403, 'Permission denied'
+            return [f'doctor:{doctor.id}'], None, None
+
+        issue = Issue.objects.select_related('patient').filter(id=kwargs['issue_id']).first()
+        if issue is None:
+            return 404, 'Issue not found'
+        if not can_view_issue_vitals(user, issue):
+            return 403, 'Permission denied'
+        after = request.headers.get('Last-Event-ID') or request.GET.get('after')
+        if after is not None and not after.lstrip('-').isdigit():
+            return 400, 'after must be a number'
+        return [f'issue:{issue.id}'], issue, int(after) if after is not None else None
+    finally:
+        close_old_connections()
+
+
+def latest_readings(issue, after):
+    try:
+        return telemetry_buffer.recent(issue.id, after) or stored_readings(issue, after)
+    finally:
+        close_old_connections()
+
+
+async def send_error(send, status, message):
+    body = json.dumps({'error': message}).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json')]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def serve_stream(scope, receive, send, view_name, kwargs):
+    authorized = await sync_to_async(authorize_stream, thread_sensitive=False)(scope, view_name, kwargs)
+    if len(authorized) == 2:
+        return await send_error(send, *authorized)
+    topics, issue, after = authorized
+
+    # Subscribe before reading the latest readings so none fall in between
+    subscriber = live_hub.subscribe(topics)
+    try:
+        initial = []
+        if issue is not None:
+            readings = await sync_to_async(latest_readings, thread_sensitive=False)(issue, after)
+            initial = [('readings', readings)] if readings else []
+    except BaseException:
+        live_hub.unsubscribe(subscriber)
+        raise
+
+    async def stream():
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            # Stop nginx from buffering the stream
+            (b'x-accel-buffering', b'no'),
+        ]})
+        async for message in event_stream(subscriber, initial):
+            await send({'type': 'http.response.body', 'body': message.encode(), 'more_body': True})
+
+    async def disconnected():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    # The stream ends when the client goes away; cancelling it unsubscribes
+    streaming = asyncio.ensure_future(stream())
+    watching = asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait([streaming, watching], return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (streaming, watching):
+            task.cancel()
+        await asyncio.gather(streaming, watching, return_exceptions=True)
+        live_hub.unsubscribe(subscriber)
+
+
+def live_streams(django_application):
+    """ASGI application serving stream URLs directly and everything else through Django"""
+    async def application(scope, receive, send):
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            try:
+                match = resolve(scope['path'])
+            except Resolver404:
+                match = None
+            if match is not None and match.view_name in STREAM_VIEWS:
+                return await serve_stream(scope, receive, send, match.view_name, match.kwargs)
+        return await django_application(scope, receive, send)
+    return application
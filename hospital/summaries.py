@@ -0,0 +1,217 @@
+"""
+AI medical summaries of a patient's issues, cached in the database.
+
+A summary is stored with a digest of the ids, update times and statuses of the issues
+it covers, and is reused until that digest changes; saving or deleting an issue also
+marks the patient's summary stale through a signal. With
+MEDICAL_SUMMARY_STALE_WHILE_REVALIDATE on, a stale summary is served straight away and
+regenerated in a background thread, so only a patient's very first summary waits on
+Gemini, and pages fetch that one after rendering. Summaries that fell back to
+default_medical_summary are not stored.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .llm import LLMUnavailable, llm_client
+from .models import Issue, MedicalSummary
+
+
+def medical_summary_prompt(patient_issues):
+    """Gemini prompt summarizing a patient's issues"""
+    # Format patient issues for the prompt
+    issue_texts = []
+    for issue in patient_issues:
+        disease = issue.disease_type.name if issue.disease_type else issue.custom_disease_type
+        symptoms = issue.symptoms if issue.symptoms else "No symptoms reported"
+        description = issue.description if issue.description else "No description provided"
+        date = issue.created_at.strftime('%Y-%m-%d')
+        severity = issue.get_severity_display()
+        status = issue.get_status_display()
+
+        issue_text = f"""
+        Issue: {disease}
+        Date: {date}
+        Severity: {severity}
+        Status: {status}
+        Symptoms: {symptoms}
+        Description: {description}
+        """
+        issue_texts.append(issue_text)
+
+    # Build the prompt for Gemini
+    return f"""
+    You are a medical assistant tasked with summarizing a patient's medical history.
+    Below are the patient's medical issues in chronological order.
+    Please provide a concise, professional summary of their medical history that would be useful for a doctor.
+
+    Patient Medical Issues:
+
+    {" ".join(issue_texts)}
+
+    Create a comprehensive yet concise summary (maximum 200 words) that:
+    1. Highlights key medical conditions and their progression
+    2. Notes any patterns or recurring issues
+    3. Identifies significant symptoms that might require attention
+    4. Makes connections between related issues where appropriate
+
+    Format your response as a professional medical summary without any preamble or meta-text.
+    """
+
+def request_medical_summary(patient_issues):
+    """Summarize patient issues with the Gemini API; returns None if it is unavailable"""
+    try:
+        return llm_client.generate(medical_summary_prompt(patient_issues)) or None
+    except LLMUnavailable as e:
+        print(f"Error generating medical summary with Gemini API: {e}. Falling back to default summary.")
+        return None
+
+def generate_medical_summary(patient_issues):
+    """Generate a medical summary for a patient using Gemini API"""
+    if not patient_issues:
+        return "No previous medical history found."
+
+    # Fall back to default summary
+    return request_medical_summary(patient_issues) or default_medical_summary(patient_issues)
+
+def default_medical_summary(patient_issues):
+    """Generate a default medical summary when API is unavailable"""
+    if not patient_issues:
+        return "No previous medical history found."
+
+    # Create a basic summary of recent issues
+    recent_issues = [i.disease_type.name if i.disease_type else i.custom_disease_type for i in patient_issues[:3]]
+    recent_issues = [name for name in recent_issues if name]
+    recent_issues_str = ", ".join(recent_issues) if recent_issues else "no specific conditions"
+
+    return f"Patient has a history of {len(patient_issues)} medical issues. Most recent issues include {recent_issues_str}. Detailed medical records are available in the history section below."
+
+
+def issues_digest(patient_id):
+    """SHA-256 of the ids, update times and statuses of a patient's issues"""
+    digest = hashlib.sha256()
+    for issue_id, updated_at, status in Issue.objects.filter(patient_id=patient_id).order_by('id').values_list(
+            'id', 'updated_at', 'status'):
+        digest.update(f"{issue_id}|{updated_at.isoformat()}|{status}\n".encode())
+    return digest.hexdigest()
+
+
+class MedicalSummaryCache:
+    """Lookups of stored summaries, background refreshes and their counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Patients whose summary is being regenerated, and when a refresh last failed
+        self._refreshing = set()
+        self._failed_at = {}
+        self.counters = {
+            'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0,
+            'llm_calls': 0, 'llm_failures': 0, 'llm_seconds': 0.0, 'llm_seconds_max': 0.0,
+        }
+
+    def get(self, patient):
+        """The summary to show for a patient: stored if current, else stale or freshly generated"""
+        summary, digest = self._lookup(patient)
+        if summary is not None:
+            return summary
+        self.counters['misses'] += 1
+        return self.refresh(patient.id, digest)
+
+    def peek(self, patient):
+        """The stored summary to show for a patient, or None if one has to be generated first"""
+        summary, _ = self._lookup(patient)
+        return summary
+
+    def _lookup(self, patient):
+        digest = issues_digest(patient.id)
+        cached = MedicalSummary.objects.filter(patient=patient).first()
+        if cached is not None and cached.digest == digest and not cached.stale:
+            self.counters['hits'] += 1
+            return cached.summary, digest
+
+        if cached is not None and getattr(settings, 'MEDICAL_SUMMARY_STALE_WHILE_REVALIDATE', True):
+            self.counters['stale_hits'] += 1
+            self.refresh_in_background(patient.id)
+            return cached.summary, digest
+        return None, digest
+
+    def refresh(self, patient_id, digest=None):
+        """Generate and store a patient's summary; returns it, or the default summary on failure"""
+        # Digest first: if an issue changes while Gemini runs, the next view sees a new digest
+        digest = digest or issues_digest(patient_id)
+        issues = list(Issue.objects.filter(patient_id=patient_id).select_related('disease_type').order_by('-created_at'))
+        if not issues:
+            MedicalSummary.objects.filter(patient_id=patient_id).delete()
+            return generate_medical_summary(issues)
+
+        started = time.perf_counter()
+        summary = request_medical_summary(issues)
+        seconds = time.perf_counter() - started
+        self.counters['llm_calls'] += 1
+        self.counters['llm_seconds'] += seconds
+        self.counters['llm_seconds_max'] = max(self.counters['llm_seconds_max'], seconds)
+        if summary is None:
+            self.counters['llm_failures'] += 1
+            with self._lock:
+                self._failed_at[patient_id] = time.monotonic()
+            return default_medical_summary(issues)
+
+        print(f"Generated medical summary for patient {patient_id} in {seconds:.2f}s")
+        with self._lock:
+            self._failed_at.pop(patient_id, None)
+        MedicalSummary.objects.update_or_create(patient_id=patient_id, defaults={
+            'digest': digest,
+            'summary': summary,
+            'stale': False,
+            'generation_seconds': round(seconds, 3),
+            'generated_at': timezone.now(),
+        })
+        return summary
+
+    def refresh_in_background(self, patient_id):
+        """Regenerate a summary on a thread, once at a time per patient and not soon after a failure"""
+        retry_seconds = getattr(settings, 'MEDICAL_SUMMARY_RETRY_SECONDS', 60)
+        with self._lock:
+            if patient_id in self._refreshing:
+                return
+            if time.monotonic() - self._failed_at.get(patient_id, float('-inf')) < retry_seconds:
+                return
+            self._refreshing.add(patient_id)
+        self.counters['refreshes'] += 1
+        threading.Thread(target=self._refresh_worker, args=(patient_id,), daemon=True).start()
+
+    def _refresh_worker(self, patient_id):
+        try:
+            self.refresh(patient_id)
+        except Exception as e:
+            print(f"Error refreshing medical summary for patient {patient_id}: {e}")
+            with self._lock:
+                self._failed_at[patient_id] = time.monotonic()
+        finally:
+            with self._lock:
+                self._refreshing.discard(patient_id)
+            close_old_connections()
+
+    def stats(self):
+        lookups = self.counters['hits'] + self.counters['stale_hits'] + self.counters['misses']
+        calls = self.counters['llm_calls']
+        return dict(
+            self.counters,
+            llm_seconds=round(self.counters['llm_seconds'], 3),
+            llm_seconds_max=round(self.counters['llm_seconds_max'], 3),
+            llm_seconds_mean=round(self.counters['llm_seconds'] / calls, 3) if calls else None,
+            hit_rate=round((self.counters['hits'] + self.counters['stale_hits']) / lookups, 3) if lookups else None,
+            refreshing=len(self._refreshing),
+        )
+
+
+summary_cache = MedicalSummaryCache()
+
+
+def mark_summary_stale(patient_id):
+    """Flag a patient's stored summary as out of date"""
+    MedicalSummary.objects.filter(patient_id=patient_id, stale=False).update(stale=True)
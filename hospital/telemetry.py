@@ -0,0 +1,324 @@
+"""
+Live vital signs telemetry.
+
+Bedside monitors POST batches of readings for an issue as NDJSON or CSV. Each process
+buffers them per issue, and one background thread works through the buffer in
+micro-batches: every VITALS_TELEMETRY_FLUSH_SECONDS, or as soon as an issue has
+VITALS_TELEMETRY_BATCH_ROWS waiting, the batch is scored with the risk model and its
+alerts are raised, with the alert state carried from batch to batch as
+process_vital_signs_data carries it from chunk to chunk.
+
+Scored readings are appended to the issue's vitals dataset every
+VITALS_TELEMETRY_PERSIST_SECONDS, as one part, and the issue's ingestion ledger is moved
+past them in the same step, so the store isn't split into a part per batch and a later
+process_vital_signs_data run carries on where live scoring stopped. The last readings of
+each issue are kept in memory for the live dashboard.
+
+Appends to a dataset aren't coordinated between processes, so all telemetry for an
+issue has to reach the same process.
+"""
+import atexit
+import io
+import os
+import threading
+import time
+import traceback
+from collections import deque
+
+import pandas as pd
+from django.conf import settings
+from django.db import close_old_connections
+
+from .live_events import publish_readings
+from .ingestion import DatasetStream, get_ingestion_ledger, record_ingestion, reset_ingestion_ledger
+from .models import Doctor, Issue
+from .utils import AlertScanState, create_alerts, load_alert_rules, process_vital_signs_data, score_vital_signs
+from .vitals_store import (
+    MANIFEST_NAME, ROLLUP_VITALS, append_vitals, convert_csv_to_dataset, dataset_path_for_issue,
+    is_vitals_dataset, iter_vitals_chunks, normalize_vitals_frame, read_manifest,
+)
+
+# Request media types accepted by the ingestion endpoint
+TELEMETRY_FORMATS = {
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'text/csv': 'csv',
+}
+
+# Columns sent to the live dashboard
+LIVE_COLUMNS = ['Timestamp'] + ROLLUP_VITALS + ['Risk Category']
+
+
+def parse_telemetry(body, content_type):
+    """
+    Readings in an NDJSON or CSV request body, in the store's column types.
+
+    Timestamps may be ISO strings or epoch milliseconds and are kept as naive UTC;
+    readings without one are stamped with the time they arrived. Raises ValueError
+    with a message for the client if the body can't be used.
+    """
+    if not body.strip():
+        return pd.DataFrame()
+    payload_format = TELEMETRY_FORMATS.get((content_type or '').split(';')[0].strip().lower())
+    if payload_format is None:
+        raise ValueError('Send readings as application/x-ndjson or text/csv')
+
+    try:
+        if payload_format == 'csv':
+            df = pd.read_csv(io.BytesIO(body))
+        else:
+            df = pd.read_json(io.BytesIO(body), lines=True, convert_dates=False, dtype=False)
+    except ValueError as e:
+        raise ValueError(f"Could not parse {payload_format} body: {e}")
+
+    missing = [column for column in ROLLUP_VITALS if column not in df.columns]
+    if missing:
+        raise ValueError(f"Readings are missing {', '.join(missing)}")
+    for column in ROLLUP_VITALS:
+        values = pd.to_numeric(df[column], errors='coerce')
+        if values.isna().any():
+            raise ValueError(f"{column} must be a number in every reading")
+        df[column] = values
+
+    arrived = pd.Timestamp.now(tz='UTC')
+    if 'Timestamp' not in df.columns:
+        df['Timestamp'] = None
+    sent = df['Timestamp'].notna()
+    if pd.api.types.is_numeric_dtype(df['Timestamp']):
+        timestamps = pd.to_datetime(df['Timestamp'], unit='ms', utc=True)
+    else:
+        timestamps = pd.to_datetime(df['Timestamp'], utc=True, errors='coerce', format='ISO8601')
+    if timestamps[sent].isna().any():
+        raise ValueError('Timestamp must be an ISO date or epoch milliseconds')
+    df['Timestamp'] = timestamps.fillna(arrived).dt.tz_localize(None)
+    return normalize_vitals_frame(df)
+
+
+def telemetry_dataset(issue):
+    """The issue's vitals dataset, created (or converted from its uploaded CSV) on first use"""
+    device_path = os.path.join(settings.BASE_DIR, issue.device_data) if issue.device_data else None
+    if is_vitals_dataset(device_path):
+        return device_path
+
+    dataset_path = dataset_path_for_issue(issue.id)
+    if device_path and os.path.isfile(device_path):
+        convert_csv_to_dataset(device_path, dataset_path, default_patient_id=issue.patient_id)
+    else:
+        append_vitals(dataset_path, pd.DataFrame())
+    Issue.objects.filter(id=issue.id).update(device_data=os.path.relpath(dataset_path, settings.BASE_DIR))
+    return dataset_path
+
+
+def telemetry_issue_for_patient(patient):
+    """The issue a patient's monitor streams to: their latest open issue, else their latest"""
+    issues = Issue.objects.filter(patient=patient).order_by('-created_at')
+    return issues.exclude(status__in=['resolved', 'closed']).first() or issues.first()
+
+
+def live_records(df, first_row):
+    """Readings as dashboard records, numbered by their row in the issue's dataset"""
+    columns = [column for column in LIVE_COLUMNS if column in df.columns]
+    records = df[columns].copy()
+    records['Timestamp'] = records['Timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
+    records = records.astype(object).where(records.notna(), None)
+    records.insert(0, 'row', range(first_row, first_row + len(df)))
+    return records.to_dict('records')
+
+
+def stored_readings(issue, after=None, limit=None):
+    """The last readings stored in an issue's dataset, after row `after` if given"""
+    limit = limit or getattr(settings, 'VITALS_LIVE_READINGS', 300)
+    dataset_path = os.path.join(settings.BASE_DIR, issue.device_data) if issue.device_data else None
+    if not is_vitals_dataset(dataset_path):
+        return []
+    manifest = read_manifest(dataset_path)
+    first = max(manifest['rows'] - limit, 0 if after is None else after + 1)
+    if first >= manifest['rows']:
+        return []
+    columns = [column for column in LIVE_COLUMNS if column in manifest['columns']]
+    for chunk in iter_vitals_chunks(dataset_path, manifest['rows'] - first, first, columns=columns):
+        return live_records(chunk, first)
+    return []
+
+
+def ledger_current(ledger, manifest):
+    """Whether an ingestion ledger has scored exactly the rows a dataset holds"""
+    if ledger.rows_processed != manifest['rows']:
+        return False
+    return manifest['rows'] == 0 or ledger.content_hash == manifest['content_hash']
+
+
+class IssueTelemetry:
+    """One issue's live readings: waiting to be scored, scored but not yet stored, and recent"""
+
+    def __init__(self, issue_id, recent_readings):
+        self.issue_id = issue_id
+        self.pending = []
+        self.pending_rows = 0
+        self.unsaved = []
+        self.unsaved_rows = 0
+        self.recent = deque(maxlen=recent_readings)
+        self.persisted_at = time.monotonic()
+        # Loaded by the flusher thread when the first batch arrives
+        self.issue = None
+
+    def open(self, first_timestamp):
+        """Load the issue, its dataset and the alert state to continue from"""
+        issue = Issue.objects.select_related('patient__user').get(id=self.issue_id)
+        self.dataset_path = telemetry_dataset(issue)
+        self.ledger = get_ingestion_ledger(issue, self.dataset_path, first_timestamp.tz_localize('UTC').to_pydatetime())
+
+        manifest = read_manifest(self.dataset_path)
+        if not ledger_current(self.ledger, manifest):
+            # Readings already in the dataset, such as a converted upload, are scored the usual way first
+            process_vital_signs_data(issue.id, self.dataset_path)
+            self.ledger.refresh_from_db()
+        if not ledger_current(self.ledger, manifest):
+            print(f"Alert state for {self.dataset_path} is behind the dataset; live scoring starts after row {manifest['rows']}")
+            reset_ingestion_ledger(self.ledger)
+            self.ledger.rows_processed = manifest['rows']
+
+        self.scan_state = AlertScanState.from_ledger(self.ledger)
+        self.model_version = self.ledger.model_version
+        self.doctors = list(Doctor.objects.filter(appointments__patient=issue.patient).distinct())
+        self.rule_set = load_alert_rules()
+        self.issue = issue
+
+    def score(self, df):
+        """Score a batch and raise its alerts; returns its dashboard records"""
+        if self.issue is None:
+            self.open(df['Timestamp'].iloc[0])
+
+        # Live readings are always scored, even if the monitor sent a label
+        scored = df.drop(columns='Risk Category', errors='ignore')
+        self.model_version = score_vital_signs(scored, self.issue.patient, self.scan_state.heart_rate_tail) or self.model_version
+        alert_rows, run_lengths = self.scan_state.detect(scored)
+        rule_alerts = self.scan_state.detect_rules(scored, self.rule_set, self.issue.patient)
+        if self.doctors:
+            # Live alerts are timed by the readings' timestamps, not by their row in the dataset
+            create_alerts(self.issue, self.doctors, scored, alert_rows, run_lengths, None,
+                          self.model_version, rule_alerts=rule_alerts)
+        first_row = self.scan_state.rows_processed
+        self.scan_state.advance(scored, alert_rows)
+
+        self.unsaved.append(df)
+        self.unsaved_rows += len(df)
+        return live_records(scored.tail(self.recent.maxlen), first_row + max(len(scored) - self.recent.maxlen, 0))
+
+    def persist(self):
+        """Append the scored readings to the dataset as one part and move the ledger past them"""
+        df = pd.concat(self.unsaved, ignore_index=True)
+        manifest = append_vitals(self.dataset_path, df, default_patient_id=self.issue.patient_id)
+        file_mtime = os.stat(os.path.join(self.dataset_path, MANIFEST_NAME)).st_mtime
+        stream = DatasetStream(self.dataset_path, manifest, self.ledger.rows_processed, file_mtime, len(df))
+        record_ingestion(self.ledger, stream, self.scan_state, self.model_version)
+
+        self.unsaved, self.unsaved_rows = [], 0
+        self.persisted_at = time.monotonic()
+        # Doctors assigned and rules changed since the last write apply to the next alerts
+        self.doctors = list(Doctor.objects.filter(appointments__patient=self.issue.patient).distinct())
+        self.rule_set = load_alert_rules()
+
+
+class TelemetryBuffer:
+    """Live readings of every issue streaming to this process, drained by one background thread"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._issues = {}
+        self._buffered_rows = 0
+        self._thread = None
+        self._flush_lock = threading.Lock()
+        self.stats = {'received': 0, 'scored': 0, 'stored': 0, 'rejected': 0, 'dropped': 0}
+
+    def submit(self, issue_id, df):
+        """Queue readings for an issue; returns False, queueing nothing, if the buffer is full"""
+        max_rows = getattr(settings, 'VITALS_TELEMETRY_MAX_BUFFERED_ROWS', 200000)
+        with self._lock:
+            if self._buffered_rows + len(df) > max_rows:
+                self.stats['rejected'] += len(df)
+                return False
+            stream = self._issues.get(issue_id)
+            if stream is None:
+                stream = self._issues[issue_id] = IssueTelemetry(
+                    issue_id, getattr(settings, 'VITALS_LIVE_READINGS', 300))
+            stream.pending.append(df)
+            stream.pending_rows += len(df)
+            self._buffered_rows += len(df)
+            self.stats['received'] += len(df)
+            if stream.pending_rows >= getattr(settings, 'VITALS_TELEMETRY_BATCH_ROWS', 5000):
+                self._wake.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='vitals-telemetry', daemon=True)
+                self._thread.start()
+        return True
+
+    def recent(self, issue_id, after=None):
+        """Readings of an issue scored by this process, after row `after` if given"""
+        with self._lock:
+            stream = self._issues.get(issue_id)
+            if stream is None:
+                return []
+            return [record for record in stream.recent if after is None or record['row'] > after]
+
+    def flush(self, persist=False):
+        """Score every issue's waiting readings, and store them if due (or if `persist`)"""
+        persist_seconds = getattr(settings, 'VITALS_TELEMETRY_PERSIST_SECONDS', 10.0)
+        with self._flush_lock:
+            with self._lock:
+                streams = list(self._issues.values())
+
+            for stream in streams:
+                with self._lock:
+                    frames, stream.pending, stream.pending_rows = stream.pending, [], 0
+                    self._buffered_rows -= sum(len(frame) for frame in frames)
+
+                if frames:
+                    df = pd.concat(frames, ignore_index=True)
+                    try:
+                        records = stream.score(df)
+                    except Exception as e:
+                        print(f"Error scoring live readings for issue {stream.issue_id}: {str(e)}")
+                        traceback.print_exc()
+                        with self._lock:
+                            self.stats['dropped'] += len(df)
+                        continue
+                    with self._lock:
+                        stream.recent.extend(records)
+                        self.stats['scored'] += len(df)
+                    publish_readings(stream.issue_id, records)
+
+                due = time.monotonic() - stream.persisted_at >= persist_seconds
+                if stream.unsaved_rows and (persist or due):
+                    rows = stream.unsaved_rows
+                    try:
+                        stream.persist()
+                    except Exception as e:
+                        # The readings stay in memory and are written with the next batch
+                        print(f"Error storing live readings for issue {stream.issue_id}: {str(e)}")
+                        traceback.print_exc()
+                        continue
+                    with self._lock:
+                        self.stats['stored'] += rows
+
+    def _run(self):
+        while True:
+            self._wake.wait(getattr(settings, 'VITALS_TELEMETRY_FLUSH_SECONDS', 1.0))
+            self._wake.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                traceback.print_exc()
+            close_old_connections()
+
+
+telemetry_buffer = TelemetryBuffer()
+
+
+@atexit.register
+def _store_unsaved_readings():
+    """Write readings scored since the last persist before the process exits"""
+    if telemetry_buffer._thread is not None:
+        telemetry_buffer.flush(persist=True)
@@ -1,3 +1,570 @@
-from django.test import TestCase
+import os
+import tempfile
+import time
+from datetime import datetime, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+import numpy as np
+import pandas as pd
+
+from .alert_rules import RuleExpressionError, RuleSet, compile_expression
+from .compiled_model import TREE_LEAF, CompiledVitalsModel, compile_pipeline
+from .jobs import MAX_ATTEMPTS, claim_jobs, enqueue_vitals_job, finish_job, heartbeat
+from .management.commands.run_vitals_worker import Command as VitalsWorkerCommand
+from .model_registry import model_registry
+from .models import Alert, AlertRule, Appointment, Issue, VitalSignsJob
+from .utils import detect_alerts, process_vital_signs_data, trailing_run_length, urgency_for_run_lengths
+from users.models import User
+from .population import CORRELATION_COLUMNS, correlation_matrix, merge_population_stats, population_stats
+from .streams import can_view_issue_vitals
+from .telemetry import IssueTelemetry, parse_telemetry
+from .visualization import create_radar_chart, load_vital_signs_data
+
+
+class AlertRuleExpressionTests(SimpleTestCase):
+    """Rule expressions are checked when saved, so evaluating them cannot fail"""
+
+    def test_operands_of_boolean_operators_must_be_conditions(self):
+        for expression in ['not hr', 'not 1', 'hr < 100 and 1', 'spo2 < 90 or map', 'hr']:
+            with self.subTest(expression=expression):
+                with self.assertRaises(RuleExpressionError):
+                    compile_expression(expression)
+
+    def test_operands_of_comparisons_and_arithmetic_must_be_numbers(self):
+        for expression in ['(hr > 100) > 0', '(hr < 1) + 2 > 1', '-(hr < 3) > 1']:
+            with self.subTest(expression=expression):
+                with self.assertRaises(RuleExpressionError):
+                    compile_expression(expression)
+
+    def test_valid_expressions_evaluate_to_masks(self):
+        df = pd.DataFrame({'Heart Rate': [90.0, 140.0, 70.0], 'Derived_MAP': [80.0, 60.0, 70.0]})
+        rules = [
+            FakeRule(1, 'hr > 130'),
+            FakeRule(2, 'not (60 < hr < 100)'),
+            FakeRule(3, 'map < 65 or (hr > 130 and map < 90)'),
+            FakeRule(4, '-hr < -100'),
+        ]
+        masks = {rule.id: mask.tolist() for rule, mask in RuleSet(rules).masks(df)}
+        self.assertEqual(masks, {
+            1: [False, True, False],
+            2: [False, True, False],
+            3: [False, True, False],
+            4: [False, True, False],
+        })
+
+    def test_failing_rule_is_skipped(self):
+        rule_set = RuleSet([FakeRule(1, 'hr > 100'), FakeRule(2, 'hr > 50')])
+        rule_set.rules[1].evaluate = lambda columns, memo: 1 / 0
+        masks = rule_set.masks(pd.DataFrame({'Heart Rate': [90.0, 120.0]}))
+        self.assertEqual([(rule.id, mask.tolist()) for rule, mask in masks], [(1, [False, True])])
+
+
+class FakeRule:
+    """The AlertRule fields RuleSet reads"""
+
+    def __init__(self, rule_id, expression):
+        self.id = rule_id
+        self.name = f'rule {rule_id}'
+        self.expression = expression
+        self.urgency = 'high'
+        self.sustained_readings = 1
+        self.cooldown_seconds = 100
+
+
+def sample_readings(rows, seed=0):
+    """Readings of one patient: varying vitals, constant demographics and some gaps"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'Heart Rate': rng.normal(80, 12, rows),
+        'Respiratory Rate': rng.normal(16, 3, rows),
+        'Body Temperature': rng.normal(36.8, 0.4, rows),
+        'Oxygen Saturation': rng.normal(97, 1.5, rows),
+        'Systolic Blood Pressure': rng.normal(120, 15, rows),
+        'Diastolic Blood Pressure': rng.normal(80, 10, rows),
+        'Age': 37.0,
+        'Weight (kg)': 81.3,
+        'Height (m)': 1.77,
+        'Derived_HRV': 0.1,
+    })
+    df['Derived_Pulse_Pressure'] = df['Systolic Blood Pressure'] - df['Diastolic Blood Pressure']
+    df['Derived_BMI'] = df['Weight (kg)'] / df['Height (m)'] ** 2
+    df['Derived_MAP'] = df['Diastolic Blood Pressure'] + df['Derived_Pulse_Pressure'] / 3
+    df.loc[rng.random(rows) < 0.05, 'Heart Rate'] = np.nan
+    df.loc[rng.random(rows) < 0.05, 'Oxygen Saturation'] = np.nan
+    return df
+
+
+class CorrelationMatrixTests(SimpleTestCase):
+    """The stored aggregates give the same correlations as DataFrame.corr()"""
+
+    def assertMatchesCorr(self, corr, df):
+        expected = df[CORRELATION_COLUMNS].corr()
+        pd.testing.assert_frame_equal(corr.loc[CORRELATION_COLUMNS, CORRELATION_COLUMNS], expected,
+                                      check_exact=False, atol=1e-9)
+
+    def test_whole_frame(self):
+        df = sample_readings(5000)
+        self.assertMatchesCorr(correlation_matrix(population_stats(df)), df)
+
+    def test_merged_chunks(self):
+        df = sample_readings(5000, seed=1)
+        stats = population_stats(df.iloc[:1])
+        for start in range(1, len(df), 777):
+            stats = merge_population_stats(stats, population_stats(df.iloc[start:start + 777]))
+        self.assertMatchesCorr(correlation_matrix(stats), df)
+
+    def test_constant_columns_have_no_correlation(self):
+        df = sample_readings(20000, seed=2)
+        corr = correlation_matrix(population_stats(df))
+        for column in ['Age', 'Weight (kg)', 'Height (m)', 'Derived_BMI', 'Derived_HRV']:
+            with self.subTest(column=column):
+                self.assertTrue(corr[column].isna().all())
+                self.assertTrue(corr.loc[column].isna().all())
+
+
+def legacy_alerts(risk_categories):
+    """(row, urgency, run length) of each alert, decided row by row as the original loop did"""
+    start_time = datetime(2024, 1, 1)
+    alerts = []
+    last_alert_time = None
+    anomaly_count = 0
+    for i, category in enumerate(risk_categories):
+        timestamp = start_time + timedelta(seconds=i)
+        if category == 'High Risk':
+            anomaly_count += 1
+            if anomaly_count >= 3 and (not last_alert_time or (timestamp - last_alert_time).seconds > 100):
+                if anomaly_count >= 10:
+                    urgency = 'critical'
+                elif anomaly_count >= 7:
+                    urgency = 'high'
+                elif anomaly_count >= 5:
+                    urgency = 'medium'
+                else:
+                    urgency = 'low'
+                alerts.append((i, urgency, anomaly_count))
+                last_alert_time = timestamp
+        else:
+            anomaly_count = 0
+    return alerts
+
+
+def risk_bursts(rows, seed, mean_low=40, mean_high=8):
+    """Risk labels alternating between low and high stretches of random length"""
+    rng = np.random.default_rng(seed)
+    segments = rng.geometric([1 / mean_low, 1 / mean_high] * (rows // 4 + 2))
+    labels = np.tile(np.array(['Low Risk', 'High Risk'], dtype=object), len(segments) // 2)
+    return np.repeat(labels, segments)[:rows]
+
+
+def vectorized_alerts(risk_categories):
+    alert_rows, run_lengths = detect_alerts(risk_categories)
+    return list(zip(alert_rows.tolist(), urgency_for_run_lengths(run_lengths), run_lengths.tolist()))
+
+
+class DetectAlertsTests(SimpleTestCase):
+    """detect_alerts raises exactly the alerts of the row-by-row loop it replaced"""
+
+    def test_random_bursts(self):
+        for seed in range(20):
+            risk = risk_bursts(5000, seed)
+            with self.subTest(seed=seed):
+                self.assertEqual(vectorized_alerts(risk), legacy_alerts(risk))
+
+    def test_long_bursts_cross_the_cooldown(self):
+        for seed in range(5):
+            risk = risk_bursts(20000, seed, mean_low=60, mean_high=150)
+            with self.subTest(seed=seed):
+                self.assertEqual(vectorized_alerts(risk), legacy_alerts(risk))
+
+    def test_one_run_longer_than_the_cooldown(self):
+        risk = np.array(['Low Risk'] + ['High Risk'] * 350 + ['Low Risk'], dtype=object)
+        self.assertEqual(vectorized_alerts(risk), [(3, 'low', 3), (104, 'critical', 104), (205, 'critical', 205),
+                                                   (306, 'critical', 306)])
+        self.assertEqual(vectorized_alerts(risk), legacy_alerts(risk))
+
+    def test_cooldown_wraps_at_one_day(self):
+        # timedelta.seconds ignores whole days: a run exactly a day (plus up to 100s)
+        # after an alert is still inside the cooldown, one 101s later is not
+        risk = np.full(2 * 86400 + 400, 'Low Risk', dtype=object)
+        risk[0:3] = 'High Risk'
+        risk[86400:86400 + 5] = 'High Risk'
+        risk[86400 + 50:86400 + 200] = 'High Risk'
+        risk[2 * 86400 + 2:2 * 86400 + 300] = 'High Risk'
+        alerts = vectorized_alerts(risk)
+        self.assertEqual(alerts, legacy_alerts(risk))
+        self.assertNotIn(86402, [row for row, _, _ in alerts])
+        self.assertIn(86400 + 103, [row for row, _, _ in alerts])
+
+    def test_chunks_continue_the_scan(self):
+        risk = risk_bursts(30000, 7, mean_low=30, mean_high=40)
+        expected = vectorized_alerts(risk)
+        for chunk_rows in (1, 7, 100, 101, 4096):
+            alerts = []
+            run_length, last_alert_row = 0, None
+            for start in range(0, len(risk), chunk_rows):
+                chunk = risk[start:start + chunk_rows]
+                alert_rows, run_lengths = detect_alerts(
+                    chunk, initial_run_length=run_length,
+                    last_alert_row=None if last_alert_row is None else last_alert_row - start)
+                alerts += [(start + row, urgency, length) for row, urgency, length
+                           in zip(alert_rows.tolist(), urgency_for_run_lengths(run_lengths), run_lengths.tolist())]
+                if len(alert_rows):
+                    last_alert_row = start + int(alert_rows[-1])
+                run_length = trailing_run_length(chunk, run_length)
+            with self.subTest(chunk_rows=chunk_rows):
+                self.assertEqual(alerts, expected)
+
+    def test_trailing_run_length(self):
+        for risk, initial, expected in [
+            ([], 4, 4),
+            (['High Risk'] * 3, 0, 3),
+            (['High Risk'] * 3, 5, 8),
+            (['High Risk', 'Low Risk', 'High Risk', 'High Risk'], 5, 2),
+            (['High Risk', 'Low Risk'], 5, 0),
+        ]:
+            with self.subTest(risk=risk, initial=initial):
+                self.assertEqual(trailing_run_length(np.array(risk, dtype=object), initial), expected)
+
+    def test_urgency_for_run_lengths(self):
+        expected = ['low'] * 5 + ['medium'] * 2 + ['high'] * 3 + ['critical'] * 6
+        self.assertEqual(urgency_for_run_lengths(np.arange(16)), expected)
+
+
+@override_settings(VITALS_ALERT_BATCH_SIZE=50)
+class ChunkedProcessingTests(TestCase):
+    """Scoring a file in chunks raises the same alerts as scoring it whole"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user('chunk-doctor', user_type='doctor').doctor
+        cls.patient = User.objects.create_user('chunk-patient', user_type='patient').patient
+        AlertRule.objects.create(name='Tachycardia', expression='hr > 120', sustained_readings=5)
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write_readings(self, name, rows, labelled):
+        rng = np.random.default_rng(3)
+        high = np.repeat(rng.random(rows // 20) < 0.3, 20)[:rows]
+        df = pd.DataFrame({
+            'Heart Rate': np.where(high, rng.normal(135, 8, rows), rng.normal(75, 6, rows)),
+            'Respiratory Rate': np.where(high, rng.normal(28, 3, rows), rng.normal(15, 2, rows)),
+            'Body Temperature': np.where(high, rng.normal(39.2, 0.4, rows), rng.normal(36.8, 0.3, rows)),
+            'Oxygen Saturation': np.where(high, rng.normal(87, 2, rows), rng.normal(97, 1, rows)),
+            'Systolic Blood Pressure': np.where(high, rng.normal(165, 10, rows), rng.normal(118, 8, rows)),
+            'Diastolic Blood Pressure': np.where(high, rng.normal(100, 6, rows), rng.normal(78, 5, rows)),
+        })
+        if labelled:
+            # Labelled files skip scoring, so they carry their own derived columns
+            df['Derived_MAP'] = (df['Systolic Blood Pressure'] + 2 * df['Diastolic Blood Pressure']) / 3
+            df['Risk Category'] = risk_bursts(rows, 11, mean_low=50, mean_high=30)
+        path = os.path.join(self.directory.name, name)
+        df.to_csv(path, index=False)
+        return path
+
+    def alerts_for(self, file_path, chunk_rows):
+        issue = Issue.objects.create(patient=self.patient, description='Chunked processing')
+        Appointment.objects.create(doctor=self.doctor, patient=self.patient, issue=issue,
+                                   appointment_date=datetime(2024, 1, 1).date(), appointment_time='10:00')
+        start_time = timezone.make_aware(datetime(2024, 1, 1))
+        with self.settings(VITALS_CSV_CHUNK_ROWS=chunk_rows):
+            self.assertTrue(process_vital_signs_data(issue.id, file_path, start_time=start_time))
+        return list(Alert.objects.filter(issue=issue).order_by('alert_time', 'rule_id').values_list(
+            'alert_time', 'urgency', 'rule_id', 'message'))
+
+    def assertSameAlertsInChunks(self, file_path):
+        whole = self.alerts_for(file_path, 1_000_000)
+        self.assertTrue(whole)
+        # Both the model and the rule raise alerts
+        self.assertTrue(any(rule_id is None for _, _, rule_id, _ in whole))
+        self.assertTrue(any(rule_id for _, _, rule_id, _ in whole))
+        for chunk_rows in (1000, 333, 97):
+            with self.subTest(chunk_rows=chunk_rows):
+                self.assertEqual(self.alerts_for(file_path, chunk_rows), whole)
+
+    def test_labelled_file(self):
+        self.assertSameAlertsInChunks(self.write_readings('labelled.csv', 3000, labelled=True))
+
+    def test_scored_file(self):
+        self.assertSameAlertsInChunks(self.write_readings('scored.csv', 3000, labelled=False))
+
+
+class TelemetryAlertTimeTests(TestCase):
+    """Live alerts are timed by the readings that raised them"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(self.settings(VITALS_STORE_ROOT=directory.name))
+        doctor = User.objects.create_user('live-doctor', user_type='doctor').doctor
+        patient = User.objects.create_user('live-patient', user_type='patient').patient
+        self.issue = Issue.objects.create(patient=patient, description='Live telemetry')
+        Appointment.objects.create(doctor=doctor, patient=patient, issue=self.issue,
+                                   appointment_date=datetime(2024, 1, 1).date(), appointment_time='10:00')
+        self.rule = AlertRule.objects.create(name='Tachycardia', expression='hr > 120', cooldown_seconds=0)
+
+    def readings(self, timestamps, heart_rates):
+        lines = [
+            f'{{"Timestamp": "{timestamp}", "Heart Rate": {heart_rate}, "Respiratory Rate": 16, '
+            f'"Body Temperature": 36.8, "Oxygen Saturation": 97, '
+            f'"Systolic Blood Pressure": 120, "Diastolic Blood Pressure": 80}}'
+            for timestamp, heart_rate in zip(timestamps, heart_rates)
+        ]
+        return parse_telemetry('\n'.join(lines).encode(), 'application/x-ndjson')
+
+    def test_alert_times_are_reading_timestamps(self):
+        telemetry = IssueTelemetry(self.issue.id, 10)
+        # Readings a few minutes apart, in two batches
+        telemetry.score(self.readings(['2024-03-01T08:00:00Z', '2024-03-01T08:05:00Z', '2024-03-01T08:07:30Z'],
+                                      [80, 140, 80]))
+        telemetry.score(self.readings(['2024-03-01T09:00:00Z', '2024-03-01T09:12:00Z'], [150, 80]))
+
+        alert_times = list(Alert.objects.filter(issue=self.issue, rule_id=self.rule.id).order_by(
+            'alert_time').values_list('alert_time', flat=True))
+        self.assertEqual(alert_times, [timezone.make_aware(datetime(2024, 3, 1, 8, 5)),
+                                       timezone.make_aware(datetime(2024, 3, 1, 9, 0))])
+
+
+class LiveVitalsAccessTests(TestCase):
+    """Live readings are shown to the patient, their doctors and staff only"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = User.objects.create_user('live-own-doctor', user_type='doctor')
+        cls.other_doctor = User.objects.create_user('live-other-doctor', user_type='doctor')
+        cls.patient = User.objects.create_user('live-own-patient', user_type='patient')
+        cls.issue = Issue.objects.create(patient=cls.patient.patient, description='Live access')
+        Appointment.objects.create(doctor=cls.doctor.doctor, patient=cls.patient.patient, issue=cls.issue,
+                                   appointment_date=datetime(2024, 1, 1).date(), appointment_time='10:00')
+
+    def live_status(self, user):
+        self.client.force_login(user)
+        return self.client.get(reverse('hospital:vital_signs_live', args=[self.issue.id])).status_code
+
+    def test_patient_and_their_doctor(self):
+        self.assertEqual(self.live_status(self.patient), 200)
+        self.assertEqual(self.live_status(self.doctor), 200)
+
+    def test_unrelated_doctor_is_refused(self):
+        self.assertEqual(self.live_status(self.other_doctor), 403)
+        self.assertFalse(can_view_issue_vitals(self.other_doctor, self.issue))
+
+
+class RadarChartTests(SimpleTestCase):
+    """The radar chart shows a patient's first reading in the upload"""
+
+    def test_first_row_of_the_file(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'readings.csv')
+        # Patient 7's first row is not their earliest reading
+        pd.DataFrame({
+            'Patient ID': [7, 3, 7],
+            'Timestamp': ['2024-01-01 10:00:00', '2024-01-01 08:00:00', '2024-01-01 09:00:00'],
+            'Heart Rate': [100, 70, 80],
+            'Respiratory Rate': 16,
+            'Body Temperature': 37.0,
+            'Oxygen Saturation': 97,
+            'Systolic Blood Pressure': 110,
+            'Diastolic Blood Pressure': 70,
+        }).to_csv(path, index=False)
+
+        data = load_vital_signs_data(path, patient_id=7)
+        self.assertEqual(data['Timestamp'].tolist(), sorted(data['Timestamp']))
+        patient_trace = create_radar_chart(data, 7).data[1]
+        self.assertEqual(patient_trace.r[0], 1.0)
+
+
+class CompiledModelParityTests(SimpleTestCase):
+    """The NumPy export predicts exactly what the sklearn pipeline does"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.model, version = model_registry.get()
+        cls.compiled = CompiledVitalsModel(compile_pipeline(cls.model, source_version=version))
+
+    def random_inputs(self, rows, seed):
+        rng = np.random.default_rng(seed)
+        compiled = self.compiled
+        data = {column: rng.normal(mean, scale * 1.5, rows)
+                for column, mean, scale in zip(compiled.numeric_columns, compiled.means, compiled.scales)}
+        for i, column in enumerate(compiled.categorical_columns):
+            data[column] = rng.choice(compiled.category_values[compiled.category_column == i], rows)
+        return pd.DataFrame(data)
+
+    def assertSamePredictions(self, df):
+        expected = self.model.predict(df)
+        actual = self.compiled.predict(df)
+        mismatches = np.flatnonzero(expected != actual)
+        self.assertEqual(len(mismatches), 0, f"{len(mismatches)} of {len(df)} rows differ, first {mismatches[:5]}")
+
+    def test_random_rows_with_missing_readings(self):
+        df = self.random_inputs(20000, seed=1)
+        df.iloc[::97, 0] = np.nan
+        df.iloc[::89, 3] = np.nan
+        self.assertSamePredictions(df)
+
+    def test_rows_on_split_thresholds(self):
+        compiled = self.compiled
+        n_numeric = len(compiled.numeric_columns)
+        splits = np.flatnonzero((compiled.children_left != TREE_LEAF) & (compiled.feature < n_numeric))
+        # Scaled values around each split: the float64 threshold, its float32 rounding
+        # (which can land above the threshold) and the float32 neighbours of that
+        threshold32 = compiled.threshold[splits].astype(np.float32)
+        self.assertTrue((threshold32.astype(np.float64) > compiled.threshold[splits]).any())
+        scaled = np.concatenate([
+            compiled.threshold[splits],
+            threshold32.astype(np.float64),
+            np.nextafter(threshold32, np.float32(np.inf)).astype(np.float64),
+            np.nextafter(threshold32, np.float32(-np.inf)).astype(np.float64),
+        ])
+        features = np.tile(compiled.feature[splits], 4)
+
+        df = self.random_inputs(len(scaled), seed=2)
+        for column_index, column in enumerate(compiled.numeric_columns):
+            rows = np.flatnonzero(features == column_index)
+            raw = scaled[rows] * compiled.scales[column_index] + compiled.means[column_index]
+            df.loc[rows, column] = raw
+        # Raw values scale back onto the float32 values they were built from. The float64
+        # thresholds are often midway between two float32 values, so they are left out.
+        on_threshold = compiled.transform(df)[np.arange(len(df)), features]
+        exact = slice(len(splits), None)
+        np.testing.assert_array_equal(on_threshold[exact], scaled[exact].astype(np.float32))
+        self.assertSamePredictions(df)
+
+
+class VitalsJobQueueTests(TestCase):
+    """Claiming, leasing and finishing queued vital signs jobs"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.patient = User.objects.create_user('queue-patient', user_type='patient')
+        cls.issue = Issue.objects.create(patient=cls.patient.patient, description='Queued upload')
+
+    def enqueue(self, count):
+        return [enqueue_vitals_job(self.issue, f'upload-{i}.csv') for i in range(count)]
+
+    def expire(self, job):
+        VitalSignsJob.objects.filter(id=job.id).update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_claims_in_enqueue_order(self):
+        jobs = self.enqueue(3)
+        claimed = claim_jobs('worker-a', 2)
+        self.assertEqual([job.id for job in claimed], [job.id for job in jobs[:2]])
+        self.assertEqual({(job.status, job.worker_id, job.attempts) for job in claimed}, {('running', 'worker-a', 1)})
+        self.assertEqual([job.id for job in claim_jobs('worker-b', 2)], [jobs[2].id])
+
+    def test_two_claimers_never_get_the_same_job(self):
+        jobs = self.enqueue(3)
+        claimed_first = []
+
+        def claim_in_between(execute, sql, params, many, context):
+            # Worker b claims right after worker a has read the claimable jobs, before a's first update
+            if not claimed_first and sql.lstrip().upper().startswith('UPDATE'):
+                claimed_first.append(None)  # worker b's own updates pass straight through
+                claimed_first[0] = claim_jobs('worker-b', 2)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(claim_in_between):
+            claimed_second = claim_jobs('worker-a', 2)
+
+        self.assertEqual([job.id for job in claimed_first[0]], [job.id for job in jobs[:2]])
+        self.assertEqual([job.id for job in claimed_second], [jobs[2].id])
+        owners = dict(VitalSignsJob.objects.values_list('id', 'worker_id'))
+        self.assertEqual([owners[job.id] for job in jobs], ['worker-b', 'worker-b', 'worker-a'])
+
+    def test_live_lease_is_not_reclaimed(self):
+        self.enqueue(1)
+        claim_jobs('worker-a', 1)
+        self.assertEqual(claim_jobs('worker-b', 1), [])
+
+    def test_expired_lease_is_reclaimed(self):
+        job, = self.enqueue(1)
+        claim_jobs('worker-a', 1)
+        self.expire(job)
+        reclaimed, = claim_jobs('worker-b', 1)
+        self.assertEqual((reclaimed.id, reclaimed.worker_id, reclaimed.attempts), (job.id, 'worker-b', 2))
+        self.assertGreater(reclaimed.lease_expires_at, timezone.now())
+
+    def test_heartbeat_only_renews_own_leases(self):
+        job, = self.enqueue(1)
+        claim_jobs('worker-a', 1, lease_seconds=10)
+        self.assertEqual(heartbeat('worker-b', [job.id], lease_seconds=600), 0)
+        self.assertEqual(heartbeat('worker-a', [job.id], lease_seconds=600), 1)
+        job.refresh_from_db()
+        self.assertGreater(job.lease_expires_at, timezone.now() + timedelta(seconds=500))
+
+    def test_finish_job_refuses_a_worker_that_lost_its_lease(self):
+        job, = self.enqueue(1)
+        claim_jobs('worker-a', 1)
+        self.expire(job)
+        claim_jobs('worker-b', 1)
+
+        self.assertEqual(finish_job('worker-a', job.id, {'success': False, 'timings': {}, 'error': 'late'}), 0)
+        self.assertEqual(finish_job('worker-b', job.id, {'success': True, 'timings': {'total': 1.0}}), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker_id, job.error, job.lease_expires_at), ('succeeded', 'worker-b', '', None))
+        # A finished job is never handed out again
+        self.assertEqual(claim_jobs('worker-c', 1), [])
+
+    def test_gives_up_after_max_attempts(self):
+        job, = self.enqueue(1)
+        for attempt in range(MAX_ATTEMPTS):
+            claim_jobs(f'worker-{attempt}', 1)
+            self.expire(job)
+        self.assertEqual(claim_jobs('worker-last', 1), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', MAX_ATTEMPTS))
+
+    def test_create_issue_enqueues_the_upload(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        self.client.force_login(self.patient)
+        upload = SimpleUploadedFile('vitals.csv', b'Heart Rate\n72\n', content_type='text/csv')
+        with self.settings(MEDIA_ROOT=media_root.name):
+            response = self.client.post(reverse('hospital:create_issue'), {
+                'custom_disease_type': 'Palpitations', 'description': 'Racing heart at night', 'severity': 'medium',
+                'device_data': upload,
+            })
+
+        issue = Issue.objects.exclude(id=self.issue.id).get(patient=self.patient.patient)
+        self.assertRedirects(response, reverse('hospital:doctor_recommendations', args=[issue.id]),
+                             fetch_redirect_response=False)
+        job = VitalSignsJob.objects.get(issue=issue)
+        self.assertEqual(job.status, 'queued')
+        with open(job.file_path, 'rb') as f:
+            self.assertEqual(f.read(), b'Heart Rate\n72\n')
+
+
+@override_settings(VITALS_MODEL_WARM_ON_STARTUP=False)
+class InlineWorkerLeaseTests(TransactionTestCase):
+    """A job run in the worker's own process keeps its lease however long it takes"""
+
+    def test_lease_is_renewed_while_the_job_runs(self):
+        patient = User.objects.create_user('inline-patient', user_type='patient').patient
+        job = enqueue_vitals_job(Issue.objects.create(patient=patient, description='Slow upload'), 'slow.csv')
+        seen = {}
+
+        def slow_job(job_id):
+            # Outlast the lease a few times over, then see whether another worker could take the job
+            time.sleep(3.5)
+            seen['lease_expires_at'] = VitalSignsJob.objects.get(id=job_id).lease_expires_at
+            seen['claimed_elsewhere'] = claim_jobs('other-worker', 1, lease_seconds=3)
+            return {'success': True, 'timings': {'total': 3.5}}
+
+        worker = VitalsWorkerCommand()
+        with mock.patch('hospital.management.commands.run_vitals_worker.run_vitals_job', slow_job):
+            worker.run_inline('inline-worker', 3, {'once': True, 'poll_interval': 0})
+
+        self.assertGreater(seen['lease_expires_at'], timezone.now())
+        self.assertEqual(seen['claimed_elsewhere'], [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.worker_id, job.attempts), ('succeeded', 'inline-worker', 1))
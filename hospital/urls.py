@@ -11,6 +11,8 @@ urlpatterns = [
     # Patient-facing views
     path('issue/create/', views.create_issue, name='create_issue'),
     path('issue/<int:issue_id>/recommendations/', views.doctor_recommendations, name='doctor_recommendations'),
+    path('issue/<int:issue_id>/processing-status/', views.vital_signs_job_status, name='vital_signs_job_status'),
+    path('issue/<int:issue_id>/ai-recommendations/', views.ai_doctor_recommendations, name='ai_doctor_recommendations'),
     
     # Legacy URL redirect - for compatibility with old links
     path('issue/<int:issue_id>/doctors/', RedirectView.as_view(pattern_name='hospital:doctor_recommendations'), name='old_doctor_recommendations'),
@@ -27,6 +29,7 @@ urlpatterns = [
     
     # Shared views
     path('appointment/<int:appointment_id>/', views.appointment_detail, name='appointment_detail'),
+    path('patient/<int:patient_id>/medical-summary/', views.medical_summary_data, name='medical_summary_data'),
     
     # Add this new URL pattern for doctor_patients
     path('doctor/patients/', views.doctor_patients, name='doctor_patients'),
@@ -34,7 +37,18 @@ urlpatterns = [
     # Vital signs visualization
     path('vital-signs/', views.vital_signs_dashboard, name='vital_signs_dashboard'),
     path('vital-signs/<int:issue_id>/', views.vital_signs_dashboard, name='vital_signs_dashboard_for_issue'),
+    path('vital-signs/visualize/', views.visualize_vital_signs, name='visualize_vital_signs'),
+    path('vital-signs/visualize/<int:issue_id>/', views.visualize_vital_signs, name='visualize_vital_signs_for_issue'),
+    path('vital-signs/data/', views.vital_signs_data, name='vital_signs_data'),
+    path('vital-signs/data/<str:figure>/', views.vital_signs_figure, name='vital_signs_figure'),
+    path('vital-signs/timestamps/', views.vital_signs_timestamps, name='vital_signs_timestamps'),
+    path('vital-signs/cache-stats/', views.vital_signs_cache_stats, name='vital_signs_cache_stats'),
+    path('vital-signs/ingest/<int:issue_id>/', views.ingest_vital_signs, name='ingest_vital_signs'),
+    path('vital-signs/ingest/patient/<int:patient_id>/', views.ingest_vital_signs, name='ingest_patient_vital_signs'),
+    path('vital-signs/live/<int:issue_id>/', views.vital_signs_live, name='vital_signs_live'),
+    path('vital-signs/stream/<int:issue_id>/', views.vital_signs_stream, name='vital_signs_stream'),
     
     # Add this new URL pattern for doctor alerts
     path('alerts/', views.doctor_alerts, name='doctor_alerts'),
+    path('alerts/stream/', views.doctor_alerts_stream, name='doctor_alerts_stream'),
 ] 
\ No newline at end of file
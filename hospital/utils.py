@@ -4,149 +4,461 @@ import joblib
 from datetime import datetime, timedelta
 from django.utils import timezone
 from django.conf import settings
+from django.db import IntegrityError, transaction
 import os
-import pickle
+import time
+from functools import partial
 
-from .models import Alert, Issue, Doctor, Patient
+from .models import Alert, AlertRule, Issue, Doctor, Patient
+from .alert_rules import RuleSet
+from .model_registry import get_scoring_model, model_registry
+from .ingestion import get_ingestion_ledger, open_dataset_stream, open_device_stream, record_ingestion
+from .vitals_store import is_vitals_dataset
+from .live_events import publish_alerts
 
-def process_vital_signs_data(issue_id, file_path, start_time=None):
-    """Process vital signs data and create alerts for anomalies"""
+# Consecutive 'High Risk' readings needed before an alert is raised
+ALERT_THRESHOLD = 3
+
+# Minimum gap between two alerts for the same file, in seconds (one reading per second)
+ALERT_COOLDOWN_SECONDS = 100
+
+# Urgency tiers as (minimum consecutive readings, urgency), highest first
+URGENCY_TIERS = [
+    (10, 'critical'),
+    (7, 'high'),
+    (5, 'medium'),
+]
+
+# Vital signs stored with each alert, keyed by their label in the alert message
+ALERT_VITAL_COLUMNS = {
+    'Heart Rate': 'Heart Rate',
+    'Respiratory Rate': 'Respiratory Rate',
+    'Body Temperature': 'Body Temperature',
+    'Oxygen Saturation': 'Oxygen Saturation',
+    'Systolic BP': 'Systolic Blood Pressure',
+    'Diastolic BP': 'Diastolic Blood Pressure',
+    'MAP': 'Derived_MAP',
+}
+
+SECONDS_PER_DAY = 86400
+
+def alert_mask(risk_categories):
+    """Readings that count towards an alert: 'High Risk' labels, or a rule's boolean mask"""
+    values = np.asarray(risk_categories)
+    return values if values.dtype == bool else values == 'High Risk'
+
+def detect_alerts(risk_categories, threshold=ALERT_THRESHOLD, cooldown=ALERT_COOLDOWN_SECONDS,
+                  initial_run_length=0, last_alert_row=None):
+    """
+    Find the rows that raise an alert using run-length encoding of 'High Risk' readings.
+    
+    A row qualifies once it is at least `threshold` readings into a run of consecutive
+    'High Risk' rows and more than `cooldown` seconds have passed since the previous alert.
+    Rows are one second apart, so row offsets double as seconds. Returns the alert row
+    indices and the length of the high-risk run at each of them. A boolean mask can be
+    passed instead of labels, as for threshold rules.
+    
+    To continue a scan from earlier readings, pass the length of the high-risk run that
+    was still open (`initial_run_length`) and the row of the previous alert relative to
+    the first row here (`last_alert_row`, zero or negative).
+    """
+    high_risk = alert_mask(risk_categories)
+    no_alerts = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    if len(high_risk) == 0:
+        return no_alerts
+    
+    # Run-length encode the high-risk mask: each run is [starts[k], ends[k])
+    padded = np.concatenate(([False], high_risk, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    starts, ends = edges[0::2], edges[1::2]
+    if initial_run_length and len(starts) and starts[0] == 0:
+        starts[0] = -initial_run_length
+    
+    # Every row at or past the threshold inside a run is a candidate
+    eligible_starts = np.maximum(starts + threshold - 1, 0)
+    keep = eligible_starts < ends
+    eligible_starts, run_starts, ends = eligible_starts[keep], starts[keep], ends[keep]
+    if len(eligible_starts) == 0:
+        return no_alerts
+    
+    sizes = ends - eligible_starts
+    run_offsets = np.repeat(np.cumsum(sizes) - sizes, sizes)
+    candidates = np.repeat(eligible_starts, sizes) + (np.arange(sizes.sum()) - run_offsets)
+    candidate_run_starts = np.repeat(run_starts, sizes)
+    
+    # For each candidate, the first candidate far enough away to raise the next alert
+    next_candidate = np.searchsorted(candidates, candidates + cooldown + 1)
+    
+    # Walk the alert chain: the cost is proportional to the number of alerts, not rows
+    selected = []
+    total = len(candidates)
+    row = last_alert_row
+    k = 0 if row is None else np.searchsorted(candidates, row + cooldown + 1)
+    while True:
+        # The legacy check used timedelta.seconds, which wraps at one day, so a gap of
+        # exactly N days plus up to `cooldown` seconds does not count as cooled down.
+        while row is not None and k < total and (candidates[k] - row) % SECONDS_PER_DAY <= cooldown:
+            gap = candidates[k] - row
+            k = np.searchsorted(candidates, row + gap - gap % SECONDS_PER_DAY + cooldown + 1)
+        if k >= total:
+            break
+        selected.append(k)
+        row = candidates[k]
+        k = next_candidate[k]
+    
+    selected = np.asarray(selected, dtype=np.int64)
+    alert_rows = candidates[selected]
+    run_lengths = alert_rows - candidate_run_starts[selected] + 1
+    return alert_rows, run_lengths
+
+def trailing_run_length(risk_categories, initial_run_length=0):
+    """Length of the high-risk run still open after the last reading"""
+    high_risk = alert_mask(risk_categories)
+    not_high = np.flatnonzero(~high_risk)
+    if len(not_high) == 0:
+        return initial_run_length + len(high_risk)
+    return int(len(high_risk) - 1 - not_high[-1])
+
+def urgency_for_run_lengths(run_lengths):
+    """Map consecutive high-risk counts to alert urgency levels"""
+    run_lengths = np.asarray(run_lengths)
+    conditions = [run_lengths >= minimum for minimum, _ in URGENCY_TIERS]
+    choices = [urgency for _, urgency in URGENCY_TIERS]
+    return np.select(conditions, choices, default='low').tolist()
+
+# Features the risk model was trained on, plus the derived ones kept for reference
+REQUIRED_FEATURES = [
+    'Heart Rate', 'Respiratory Rate', 'Body Temperature', 'Oxygen Saturation',
+    'Systolic Blood Pressure', 'Diastolic Blood Pressure', 'Age', 'Gender',
+    'Weight (kg)', 'Height (m)', 'Derived_HRV', 'Derived_Pulse_Pressure',
+    'Derived_BMI', 'Derived_MAP'
+]
+
+# Heart rate readings in each Derived_HRV rolling window
+HRV_WINDOW = 5
+
+def derived_hrv(heart_rate, previous_heart_rates=()):
+    """
+    Rolling standard deviation of heart rate over HRV_WINDOW readings.
+    
+    Each window is computed on its own, so passing the readings that precede
+    `heart_rate` in `previous_heart_rates` gives the same values as scoring the
+    whole recording at once. Incomplete windows are 0, as with the old fillna(0).
+    """
+    previous = np.asarray(previous_heart_rates, dtype=float)[-(HRV_WINDOW - 1):]
+    values = np.concatenate([previous, np.asarray(heart_rate, dtype=float)])
+    hrv = np.zeros(len(values))
+    if len(values) >= HRV_WINDOW:
+        windows = np.lib.stride_tricks.sliding_window_view(values, HRV_WINDOW)
+        hrv[HRV_WINDOW - 1:] = windows.std(axis=1, ddof=1)
+    return np.nan_to_num(hrv[len(previous):], nan=0.0)
+
+def prepare_model_features(df, patient, previous_heart_rates=()):
+    """Fill in demographics and derived features the model expects, in place"""
+    # Add patient demographic data if not in CSV
+    if 'Age' not in df.columns:
+        df['Age'] = getattr(patient.user, 'age', 30)  # default to 30 if not set
+    if 'Gender' not in df.columns:
+        df['Gender'] = getattr(patient.user, 'gender', 'Male')  # default to 'Male', as the model spells it
+    if 'Weight (kg)' not in df.columns:
+        df['Weight (kg)'] = getattr(patient, 'weight', 70)  # default to 70 if not set
+    if 'Height (m)' not in df.columns:
+        df['Height (m)'] = getattr(patient, 'height', 1.7)  # default to 1.7 if not set
+    
+    # Calculate derived features if not present
+    if 'Derived_MAP' not in df.columns:
+        df['Derived_MAP'] = (df['Systolic Blood Pressure'] + 2 * df['Diastolic Blood Pressure']) / 3
+    if 'Derived_Pulse_Pressure' not in df.columns:
+        df['Derived_Pulse_Pressure'] = df['Systolic Blood Pressure'] - df['Diastolic Blood Pressure']
+    if 'Derived_BMI' not in df.columns:
+        df['Derived_BMI'] = df['Weight (kg)'] / (df['Height (m)'] ** 2)
+    if 'Derived_HRV' not in df.columns:
+        df['Derived_HRV'] = derived_hrv(df['Heart Rate'], previous_heart_rates)
+    return df
+
+def score_vital_signs(df, patient, previous_heart_rates=()):
+    """
+    Add a 'Risk Category' column if the readings don't already have one.
+    
+    Returns the version of the model that scored them, or '' if the file was
+    already labelled.
+    """
+    if 'Risk Category' in df.columns:
+        return ''
+    
+    prepare_model_features(df, patient, previous_heart_rates)
+    
+    try:
+        model, model_version = get_scoring_model()
+        predictions = model.predict(df[REQUIRED_FEATURES])
+        df['Risk Category'] = predictions
+        print(f"Made predictions: {pd.Series(predictions).value_counts().to_dict()}")
+    except Exception as pred_error:
+        print(f"Error making predictions: {str(pred_error)}")
+        raise
+    return model_version
+
+class AlertScanState:
+    """
+    Where an alert scan of a device file stopped.
+    
+    Holds the rows scored so far, the high-risk run still open at the end, the row of
+    the last alert, the same two for each threshold rule and the last heart rate readings
+    for the HRV window, so the next chunk (or the next run over an appended file)
+    continues exactly where this one ended.
+    """
+    
+    def __init__(self, rows_processed=0, run_length=0, last_alert_row=None, heart_rate_tail=(), rule_state=None):
+        self.rows_processed = rows_processed
+        self.run_length = run_length
+        self.last_alert_row = last_alert_row
+        self.heart_rate_tail = list(heart_rate_tail)
+        # {rule id: [open run length, row of the last alert]}; rules start fresh when first seen
+        self.rule_state = dict(rule_state or {})
+    
+    @classmethod
+    def from_ledger(cls, ledger):
+        return cls(ledger.rows_processed, ledger.run_length, ledger.last_alert_row, ledger.heart_rate_tail,
+                   ledger.rule_state)
+    
+    def detect(self, df):
+        """Alert rows of a scored chunk, relative to its first row, and their run lengths"""
+        last_alert_row = None
+        if self.last_alert_row is not None:
+            last_alert_row = self.last_alert_row - self.rows_processed
+        return detect_alerts(
+            df['Risk Category'].to_numpy(),
+            initial_run_length=self.run_length,
+            last_alert_row=last_alert_row,
+        )
+    
+    def detect_rules(self, df, rule_set, patient):
+        """
+        (rule, alert rows, run lengths) for every rule that fires on a scored chunk.
+        
+        Updates each rule's carried state, so call it once per chunk, before advance().
+        """
+        if rule_set.columns - set(df.columns):
+            prepare_model_features(df, patient, self.heart_rate_tail)
+        # A disabled rule's run is not followed, so it starts over if enabled again
+        self.rule_state = {key: self.rule_state[key] for key in map(str, rule_set.ids) if key in self.rule_state}
+        fired = []
+        for rule, mask in rule_set.masks(df):
+            run_length, last_alert_row = self.rule_state.get(str(rule.id), (0, None))
+            alert_rows, run_lengths = detect_alerts(
+                mask,
+                threshold=rule.threshold,
+                cooldown=rule.cooldown,
+                initial_run_length=run_length,
+                last_alert_row=None if last_alert_row is None else last_alert_row - self.rows_processed,
+            )
+            if len(alert_rows):
+                last_alert_row = self.rows_processed + int(alert_rows[-1])
+                fired.append((rule, alert_rows, run_lengths))
+            self.rule_state[str(rule.id)] = [trailing_run_length(mask, run_length), last_alert_row]
+        return fired
+    
+    def advance(self, df, alert_rows):
+        """Move past a chunk once its alerts have been created"""
+        self.run_length = trailing_run_length(df['Risk Category'].to_numpy(), self.run_length)
+        if len(alert_rows):
+            self.last_alert_row = self.rows_processed + int(alert_rows[-1])
+        if 'Heart Rate' in df.columns:
+            tail = self.heart_rate_tail + df['Heart Rate'].tail(HRV_WINDOW - 1).tolist()
+            self.heart_rate_tail = [None if pd.isna(value) else float(value) for value in tail[-(HRV_WINDOW - 1):]]
+        self.rows_processed += len(df)
+
+def build_alerts(issue, doctors, df, alert_rows, run_lengths, start_time, model_version, row_offset=0, rule=None):
+    """
+    Unsaved alerts, one per doctor for each alert row of `df`.
+    
+    Alerts raised by a threshold `rule` (a CompiledRule) take its urgency and name;
+    the others are the risk model's, with urgency set by the length of the run.
+    Alert times are `start_time` plus a second per row, or each reading's own
+    Timestamp (naive UTC) if `start_time` is None.
+    """
+    patient = issue.patient
+    current_time = timezone.now()
+    alert_data = df.iloc[alert_rows]
+    vital_values = alert_data[list(ALERT_VITAL_COLUMNS.values())].to_numpy(dtype=float) if len(alert_data) else []
+    if rule is None:
+        title = f"High-Risk Vital Signs - {patient.user.get_full_name()}"
+        urgencies = urgency_for_run_lengths(run_lengths)
+    else:
+        title = f"{rule.name} - {patient.user.get_full_name()}"[:200]
+        urgencies = [rule.urgency] * len(alert_rows)
+        model_version = ''
+    if start_time is None:
+        alert_times = alert_data['Timestamp'].dt.tz_localize('UTC').dt.to_pydatetime().tolist()
+    else:
+        alert_times = [start_time + timedelta(seconds=row_offset + row) for row in alert_rows.tolist()]
+    alerts = []
+    
+    for timestamp, values, urgency, run_length in zip(alert_times, vital_values, urgencies, run_lengths.tolist()):
+        vital_signs = dict(zip(ALERT_VITAL_COLUMNS.keys(), values.tolist()))
+        
+        message_parts = [f"{key}: {value:.1f}" for key, value in vital_signs.items()]
+        if rule is None:
+            message = "High-risk vital signs detected:\n" + "\n".join(message_parts)
+        else:
+            message = f"Rule '{rule.name}' ({rule.expression}) held for {run_length} readings:\n" + "\n".join(message_parts)
+        
+        for doctor in doctors:
+            alerts.append(Alert(
+                issue=issue,
+                doctor=doctor,
+                patient=patient,
+                alert_time=timestamp,
+                timestamp=current_time,
+                urgency=urgency,
+                title=title,
+                message=message,
+                vital_signs_data=vital_signs,
+                model_version=model_version,
+                rule_id=rule.id if rule is not None else None,
+            ))
+    
+    return alerts
+
+def save_alerts(alerts, batch_size=None):
+    """
+    Insert the alerts that don't exist yet and return them.
+    
+    Alerts are deduplicated on their natural key (issue, doctor, alert time, rule), among
+    themselves and against existing rows in one query, so processing the same readings
+    twice does not create duplicates. The new ones are written with bulk_create in
+    batches of VITALS_ALERT_BATCH_SIZE, all in one transaction.
+    """
+    if not alerts:
+        return []
+    batch_size = batch_size or getattr(settings, 'VITALS_ALERT_BATCH_SIZE', 500)
+    
+    by_key = {}
+    for alert in alerts:
+        by_key.setdefault((alert.issue_id, alert.doctor_id, alert.alert_time, alert.rule_id), alert)
+    alert_times = [key[2] for key in by_key]
+    
+    for attempt in range(2):
+        existing = set(Alert.objects.filter(
+            issue_id__in={key[0] for key in by_key},
+            alert_time__gte=min(alert_times),
+            alert_time__lte=max(alert_times),
+        ).values_list('issue_id', 'doctor_id', 'alert_time', 'rule_id'))
+        new_alerts = [alert for key, alert in by_key.items() if key not in existing]
+        try:
+            with transaction.atomic():
+                Alert.objects.bulk_create(new_alerts, batch_size=batch_size)
+            break
+        except IntegrityError:
+            # Another process saved some of the same alerts since the check; check again
+            if attempt:
+                raise
+    
+    print(f"Created {len(new_alerts)} alerts, {len(alerts) - len(new_alerts)} already existed")
+    # Streams open in this process see the new alerts once they are committed
+    transaction.on_commit(partial(publish_alerts, new_alerts))
+    return new_alerts
+
+def create_alerts(issue, doctors, df, alert_rows, run_lengths, start_time, model_version, row_offset=0,
+                  rule_alerts=()):
+    """
+    Create one alert per doctor for each alert row of `df`, and for each rule that fired
+    in `rule_alerts` (as returned by AlertScanState.detect_rules); returns the number created.
+    """
+    alerts = build_alerts(issue, doctors, df, alert_rows, run_lengths, start_time, model_version, row_offset)
+    for rule, rule_rows, rule_run_lengths in rule_alerts:
+        alerts += build_alerts(issue, doctors, df, rule_rows, rule_run_lengths, start_time, model_version,
+                               row_offset, rule=rule)
+    return len(save_alerts(alerts))
+
+def load_alert_rules():
+    """The enabled threshold rules, compiled"""
+    return RuleSet(AlertRule.objects.filter(enabled=True).order_by('id'))
+
+def process_vital_signs_data(issue_id, file_path, start_time=None, timings=None):
+    """
+    Process vital signs data and create alerts for anomalies.
+    
+    Progress is recorded in the file's VitalSignsIngestion ledger entry, so an
+    unchanged file is skipped and a file that only grew is scored from where the
+    last run stopped. `start_time` only applies the first time a file is seen.
+    If a `timings` dict is given, the seconds spent in each step are stored in it.
+    """
+    if timings is None:
+        timings = {}
+    step_started = time.perf_counter()
+    
+    def finish_step(name):
+        nonlocal step_started
+        now = time.perf_counter()
+        timings[name] = round(timings.get(name, 0.0) + now - step_started, 4)
+        step_started = now
+    
     try:
-        # Load the model with correct filename
-        model_path = os.path.join(settings.BASE_DIR, 'hospital', 'ml_models', 'vitals-model.pkl')
+        # The model itself is loaded once per process by the registry
+        model_path = model_registry.path
         if not os.path.exists(model_path):
             print(f"Model not found at {model_path}")
             return False
-
-        with open(model_path, 'rb') as f:
-            model = pickle.load(f)
-        print(f"Successfully loaded model from {model_path}")
         
         # Get the issue and related objects
         issue = Issue.objects.get(id=issue_id)
         patient = issue.patient
-        doctors = Doctor.objects.filter(appointments__patient=patient).distinct()
+        doctors = list(Doctor.objects.filter(appointments__patient=patient).distinct())
         
-        if not doctors.exists():
+        if not doctors:
             print(f"No doctors found for patient {patient.id}")
             return False
         
-        # Read and preprocess the data
-        df = pd.read_csv(file_path)
-        print(f"Loaded data with {len(df)} rows and columns: {df.columns.tolist()}")
+        ledger = get_ingestion_ledger(issue, file_path, start_time)
+        chunk_rows = getattr(settings, 'VITALS_CSV_CHUNK_ROWS', 100000)
+        if is_vitals_dataset(file_path):
+            stream = open_dataset_stream(ledger, file_path, chunk_rows)
+        else:
+            stream = open_device_stream(ledger, file_path, chunk_rows)
+        if stream is None:
+            print(f"No new readings in {file_path} for issue {issue_id}")
+            return True
         
-        # If start_time is not provided, use current time
-        current_time = timezone.now()
-        if not start_time:
-            start_time = current_time
+        # Score the new readings a chunk at a time, carrying the alert state across chunks
+        scan_state = AlertScanState.from_ledger(ledger)
+        rule_set = load_alert_rules()
+        model_version = ''
+        alerts = []
+        for key in ('read', 'score', 'detect', 'rules', 'alerts'):
+            timings[key] = 0.0
+        print(f"Streaming {file_path} from row {scan_state.rows_processed} in chunks of {chunk_rows} rows"
+              f" with {len(rule_set)} alert rules")
+        step_started = time.perf_counter()
         
-        # Make predictions if Risk Category column doesn't exist
-        if 'Risk Category' not in df.columns:
-            # Prepare features for the model - match the exact names from the notebook
-            required_features = [
-                'Heart Rate', 'Respiratory Rate', 'Body Temperature', 'Oxygen Saturation',
-                'Systolic Blood Pressure', 'Diastolic Blood Pressure', 'Age', 'Gender',
-                'Weight (kg)', 'Height (m)', 'Derived_HRV', 'Derived_Pulse_Pressure',
-                'Derived_BMI', 'Derived_MAP'
-            ]
-            
-            # Print current columns for debugging
-            print(f"Current columns in CSV: {df.columns.tolist()}")
-            
-            # Add patient demographic data if not in CSV
-            if 'Age' not in df.columns:
-                df['Age'] = getattr(patient.user, 'age', 30)  # default to 30 if not set
-            if 'Gender' not in df.columns:
-                df['Gender'] = getattr(patient.user, 'gender', 'M')  # default to 'M' if not set
-            if 'Weight (kg)' not in df.columns:
-                df['Weight (kg)'] = getattr(patient, 'weight', 70)  # default to 70 if not set
-            if 'Height (m)' not in df.columns:
-                df['Height (m)'] = getattr(patient, 'height', 1.7)  # default to 1.7 if not set
-            
-            # Calculate derived features if not present
-            if 'Derived_MAP' not in df.columns:
-                df['Derived_MAP'] = (df['Systolic Blood Pressure'] + 2 * df['Diastolic Blood Pressure']) / 3
-            if 'Derived_Pulse_Pressure' not in df.columns:
-                df['Derived_Pulse_Pressure'] = df['Systolic Blood Pressure'] - df['Diastolic Blood Pressure']
-            if 'Derived_BMI' not in df.columns:
-                df['Derived_BMI'] = df['Weight (kg)'] / (df['Height (m)'] ** 2)
-            if 'Derived_HRV' not in df.columns:
-                df['Derived_HRV'] = df['Heart Rate'].rolling(window=5).std().fillna(0)
+        for df in stream.chunks():
+            finish_step('read')
+            model_version = score_vital_signs(df, patient, scan_state.heart_rate_tail) or model_version
+            finish_step('score')
             
-            print("Features prepared for prediction")
-            print(f"Final columns: {df.columns.tolist()}")
+            # Find the rows that qualify for an alert in one vectorized pass
+            alert_rows, run_lengths = scan_state.detect(df)
+            finish_step('detect')
+            rule_alerts = scan_state.detect_rules(df, rule_set, patient)
+            finish_step('rules')
             
-            try:
-                X = df[required_features]
-                predictions = model.predict(X)
-                df['Risk Category'] = predictions
-                print(f"Made predictions: {pd.Series(predictions).value_counts().to_dict()}")
-            except Exception as pred_error:
-                print(f"Error making predictions: {str(pred_error)}")
-                raise
+            # Alerts are collected for the whole file and written together below
+            alerts += build_alerts(issue, doctors, df, alert_rows, run_lengths, ledger.start_time,
+                                   model_version, row_offset=scan_state.rows_processed)
+            for rule, rule_rows, rule_run_lengths in rule_alerts:
+                alerts += build_alerts(issue, doctors, df, rule_rows, rule_run_lengths, ledger.start_time,
+                                       model_version, row_offset=scan_state.rows_processed, rule=rule)
+            scan_state.advance(df, alert_rows)
+            finish_step('alerts')
         
-        # Initialize alert tracking
-        last_alert_time = None
-        anomaly_count = 0
-        ALERT_THRESHOLD = 3
+        timings['rows'] = scan_state.rows_processed - ledger.rows_processed
+        print(f"Detected {len(alerts) // len(doctors)} alert points, model and rules, in {timings['rows']} new rows")
         
-        # Process each row
-        for i in range(len(df)):
-            timestamp = start_time + timedelta(seconds=i)
-            is_high_risk = df.iloc[i]['Risk Category'] == 'High Risk'  # Adjust if your categories are different
-            
-            if is_high_risk:
-                anomaly_count += 1
-                print(f"Found high risk at row {i}, count: {anomaly_count}")
-                
-                should_create_alert = (
-                    anomaly_count >= ALERT_THRESHOLD and
-                    (not last_alert_time or (timestamp - last_alert_time).seconds > 100)
-                )
-                
-                if should_create_alert:
-                    vital_signs = {
-                        'Heart Rate': float(df.iloc[i]['Heart Rate']),
-                        'Respiratory Rate': float(df.iloc[i]['Respiratory Rate']),
-                        'Body Temperature': float(df.iloc[i]['Body Temperature']),
-                        'Oxygen Saturation': float(df.iloc[i]['Oxygen Saturation']),
-                        'Systolic BP': float(df.iloc[i]['Systolic Blood Pressure']),
-                        'Diastolic BP': float(df.iloc[i]['Diastolic Blood Pressure']),
-                        'MAP': float(df.iloc[i]['Derived_MAP'])
-                    }
-                    
-                    # Determine urgency based on consecutive high-risk readings
-                    if anomaly_count >= 10:
-                        urgency = 'critical'
-                    elif anomaly_count >= 7:
-                        urgency = 'high'
-                    elif anomaly_count >= 5:
-                        urgency = 'medium'
-                    else:
-                        urgency = 'low'
-                    
-                    message_parts = [f"{key}: {value:.1f}" for key, value in vital_signs.items()]
-                    message = "High-risk vital signs detected:\n" + "\n".join(message_parts)
-                    
-                    print(f"Creating alerts for {len(doctors)} doctors at {timestamp}")
-                    
-                    for doctor in doctors:
-                        Alert.objects.create(
-                            patient=patient,
-                            doctor=doctor,
-                            issue=issue,
-                            timestamp=current_time,
-                            alert_time=timestamp,
-                            urgency=urgency,
-                            title=f"High-Risk Vital Signs - {patient.user.get_full_name()}",
-                            message=message,
-                            vital_signs_data=vital_signs
-                        )
-                    
-                    last_alert_time = timestamp
-                    print(f"Created alert with urgency: {urgency}")
-            else:
-                anomaly_count = 0
+        # The alerts and the ledger entry that covers them are saved together
+        with transaction.atomic():
+            save_alerts(alerts)
+            record_ingestion(ledger, stream, scan_state, model_version)
+        finish_step('alerts')
         
         print(f"Finished processing file for issue {issue_id}")
         return True
@@ -158,7 +470,12 @@ def process_vital_signs_data(issue_id, file_path, start_time=None):
         return False
 
 def reprocess_vital_signs_files():
-    """Reprocess all existing vital signs files to generate alerts"""
+    """
+    Bring alerts up to date for every issue with vital signs data.
+    
+    Files whose ledger entry shows they are unchanged are skipped without being
+    parsed. Run from `manage.py process_vital_signs` rather than a request.
+    """
     issues = Issue.objects.filter(device_data__isnull=False).exclude(device_data='')
     print(f"Found {issues.count()} issues with vital signs data to process")
     
@@ -168,4 +485,4 @@ def reprocess_vital_signs_files():
             print(f"Processing file for issue {issue.id}: {file_path}")
             process_vital_signs_data(issue.id, file_path)
         else:
-            print(f"File not found for issue {issue.id}: {file_path}") 
\ No newline at end of file
+            print(f"File not found for issue {issue.id}: {file_path}")
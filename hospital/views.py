@@ -4,21 +4,34 @@ from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse_lazy, reverse
 from django.http import HttpResponseRedirect, JsonResponse, Http404
+from django.views.decorators.csrf import csrf_exempt
 from django.contrib import messages
-from django.db.models import Q
+from django.db.models import Case, IntegerField, Q, Value, When
 from django.utils import timezone
 from datetime import timedelta
 
-from .models import Issue, Appointment, DiseaseType, Doctor, Patient, Issue, Alert
+from .models import Issue, Appointment, DiseaseType, Doctor, DoctorCandidate, Patient, Issue, Alert, VitalSignsJob
 from .forms import IssueForm, AppointmentForm, DoctorFilterForm
 from users.models import User, DoctorProfile, PatientProfile
-from .visualization import generate_vital_signs_plots
+from .visualization import PATIENT_FIGURES, POPULATION_FIGURES, generate_vital_signs_plots, load_timestamps_page
+from .vitals_store import store_root
+from .frame_cache import frame_cache
+from .plot_cache import plot_cache
+from .plot_payload import PAYLOAD_FORMATS, compressed_json_response, response_body, timestamps_payload
+from .jobs import enqueue_vitals_job
+from .live_events import live_hub
+from .streams import can_view_issue_vitals
+from .telemetry import parse_telemetry, stored_readings, telemetry_buffer, telemetry_issue_for_patient
+from .summaries import summary_cache
+from .llm import LLMUnavailable, estimate_tokens, llm_client
+from .doctor_index import doctor_entry, doctor_index, keyword_specializations
+from .doctor_candidates import RECOMMENDED_MATCH
 
+import hmac
 import json
 import requests
 import os
 from django.conf import settings
-from dotenv import load_dotenv
 import subprocess
 import threading
 import webbrowser
@@ -38,96 +51,6 @@ def get_doctor_profile(user):
         return None
     return DoctorProfile.objects.get(user=user)
 
-def generate_medical_summary(patient_issues):
-    """Generate a medical summary for a patient using Gemini API"""
-    if not patient_issues:
-        return "No previous medical history found."
-    
-    try:
-        # Import the Gemini API library
-        import google.generativeai as genai
-        import json
-        import os
-        from dotenv import load_dotenv
-        
-        # Load environment variables from .env file
-        load_dotenv()
-        
-        # Format patient issues for the prompt
-        issue_texts = []
-        for issue in patient_issues:
-            disease = issue.disease_type.name if issue.disease_type else issue.custom_disease_type
-            symptoms = issue.symptoms if issue.symptoms else "No symptoms reported"
-            description = issue.description if issue.description else "No description provided"
-            date = issue.created_at.strftime('%Y-%m-%d')
-            severity = issue.get_severity_display()
-            status = issue.get_status_display()
-            
-            issue_text = f"""
-            Issue: {disease}
-            Date: {date}
-            Severity: {severity}
-            Status: {status}
-            Symptoms: {symptoms}
-            Description: {description}
-            """
-            issue_texts.append(issue_text)
-        
-        # Get API key from .env file using dotenv
-        api_key = os.getenv('GEMINI_API_KEY')
-        
-        # If no API key, fall back to default summary
-        if not api_key:
-            print("No Gemini API key found in .env file. Falling back to default summary.")
-            return default_medical_summary(patient_issues)
-        
-        # Configure the Gemini API
-        genai.configure(api_key=api_key)
-        
-        # Select the model
-        model = genai.GenerativeModel('gemini-2.0-pro-exp-02-05')
-        
-        # Build the prompt for Gemini
-        prompt = f"""
-        You are a medical assistant tasked with summarizing a patient's medical history. 
-        Below are the patient's medical issues in chronological order. 
-        Please provide a concise, professional summary of their medical history that would be useful for a doctor.
-        
-        Patient Medical Issues:
-        
-        {" ".join(issue_texts)}
-        
-        Create a comprehensive yet concise summary (maximum 200 words) that:
-        1. Highlights key medical conditions and their progression
-        2. Notes any patterns or recurring issues
-        3. Identifies significant symptoms that might require attention
-        4. Makes connections between related issues where appropriate
-        
-        Format your response as a professional medical summary without any preamble or meta-text.
-        """
-        
-        # Generate the response
-        response = model.generate_content(prompt)
-        
-        # Return the summary
-        return response.text.strip()
-        
-    except Exception as e:
-        print(f"Error generating medical summary with Gemini API: {e}")
-        # Fall back to default summary
-        return default_medical_summary(patient_issues)
-
-def default_medical_summary(patient_issues):
-    """Generate a default medical summary when API is unavailable"""
-    if not patient_issues:
-        return "No previous medical history found."
-    
-    # Create a basic summary of recent issues
-    recent_issues = [i.disease_type.name if i.disease_type else i.custom_disease_type for i in patient_issues[:3]]
-    recent_issues_str = ", ".join(recent_issues) if recent_issues else "no specific conditions"
-    
-    return f"Patient has a history of {len(patient_issues)} medical issues. Most recent issues include {recent_issues_str}. Detailed medical records are available in the history section below."
-
 
 # Issue Views
 @login_required
@@ -308,12 +231,10 @@ def create_issue(request):
             
             issue.save()
             
-            # Process vital signs data if available
+            # Queue the vital signs data for the background worker
             if issue.device_data:
-                from .utils import process_vital_signs_data
-                success = process_vital_signs_data(issue.id, file_path)
-                if not success:
-                    messages.warning(request, "Your health issue was reported, but there was an error processing the vital signs data.")
+                enqueue_vitals_job(issue, file_path)
+                messages.info(request, "Your vital signs data is being processed in the background.")
             
             messages.success(request, "Your health issue has been reported successfully.")
             return redirect('hospital:doctor_recommendations', issue_id=issue.id)
@@ -339,240 +260,261 @@ def doctor_recommendations(request, issue_id):
         messages.error(request, "Your patient profile is not set up correctly. Please contact support.")
         return redirect('dashboard')
     
-    issue = get_object_or_404(Issue, id=issue_id, patient=patient)
+    issue = get_object_or_404(Issue.objects.select_related('disease_type'), id=issue_id, patient=patient)
     
     # Get filter parameters
     search_query = request.GET.get('q', None)
     specialization = request.GET.get('specialization', None)
     min_experience = request.GET.get('min_experience', None)
     
-    # Base query - find doctors that match the disease type's specialization
-    doctors = Doctor.objects.all()
+    min_exp_years = int(min_experience) if min_experience and min_experience.isdigit() else None
     
-    # Apply search if provided
-    if search_query:
-        doctors = doctors.filter(
-            Q(user__first_name__icontains=search_query) | 
-            Q(user__last_name__icontains=search_query)
-        )
-    # Otherwise, if the issue has a disease type with recommended specialization
-    elif issue.disease_type and issue.disease_type.recommended_specialization:
-        doctors = doctors.filter(specialization=issue.disease_type.recommended_specialization)
-    
-    # Apply additional filters
-    if specialization:
-        doctors = doctors.filter(specialization=specialization)
-    
-    if min_experience and min_experience.isdigit():
-        min_exp_years = int(min_experience)
-        doctors = doctors.filter(years_of_experience__gte=min_exp_years)
+    # Searches, and issues without a recommended specialization, look through every doctor
+    recommended = issue.disease_type.recommended_specialization if issue.disease_type else None
+    if search_query or not recommended:
+        doctors = Doctor.objects.select_related('user')
+        
+        # Apply search if provided
+        if search_query:
+            doctors = doctors.filter(
+                Q(user__first_name__icontains=search_query) | 
+                Q(user__last_name__icontains=search_query)
+            )
+        
+        # Apply additional filters
+        if specialization:
+            doctors = doctors.filter(specialization=specialization)
+        if min_exp_years is not None:
+            doctors = doctors.filter(years_of_experience__gte=min_exp_years)
+        doctors = list(doctors)
+    else:
+        # Doctors with the recommended specialization, ranked, from one range of the DoctorCandidate index
+        candidates = DoctorCandidate.objects.filter(disease_type=issue.disease_type,
+                                                    specialization_match=RECOMMENDED_MATCH)
+        if specialization:
+            candidates = candidates.filter(specialization=specialization)
+        if min_exp_years is not None:
+            candidates = candidates.filter(years_of_experience__gte=min_exp_years)
+        doctors = [candidate.doctor for candidate in candidates.select_related('doctor__user')]
     
     # Get all distinct specializations for the filter
-    all_specializations = Doctor.objects.values_list('specialization', flat=True).distinct()
+    all_specializations = doctor_index.specializations()
     
-    # If no doctors are found or AI recommendation is explicitly requested, use Gemini API
-    ai_recommendations = None
-    if (not doctors.exists() or request.GET.get('ai_recommend', False)) and not search_query:
-        ai_recommendations = get_ai_doctor_recommendations(issue, Doctor.objects.all())
-        # If we have AI recommendations but no filtered doctors, show all doctors
-        if ai_recommendations and not doctors.exists():
-            doctors = Doctor.objects.all()
+    # If no doctors are found or AI recommendation is explicitly requested, use Gemini API.
+    # The page renders straight away and fetches them from ai_doctor_recommendations.
+    ai_recommendations_pending = False
+    if (not doctors or request.GET.get('ai_recommend', False)) and not search_query:
+        ai_recommendations_pending = bool(len(doctor_index))
+        # There will be AI recommendations, so with no filtered doctors, show all doctors
+        if ai_recommendations_pending and not doctors:
+            doctors = Doctor.objects.select_related('user')
     
     return render(request, 'hospital/doctor_recommendations.html', {
         'issue': issue,
         'doctors': doctors,
         'all_specializations': all_specializations,
-        'ai_recommendations': ai_recommendations,
+        'ai_recommendations_pending': ai_recommendations_pending,
         'search_query': search_query
     })
 
+@login_required
+def ai_doctor_recommendations(request, issue_id):
+    """API view with the AI doctor recommendations for a patient's issue"""
+    issue = get_object_or_404(Issue, id=issue_id, patient__user=request.user)
+    
+    ai_recommendations = get_ai_doctor_recommendations(issue, Doctor.objects.select_related('user'))
+    if ai_recommendations is None:
+        return JsonResponse({'recommendations': [], 'source': None})
+    
+    recommendations = []
+    for recommendation in ai_recommendations.get('recommendations', []):
+        try:
+            doctor_id = int(recommendation['id'])
+        except (KeyError, TypeError, ValueError):
+            continue
+        recommendations.append({
+            'id': doctor_id,
+            'name': str(recommendation.get('name', '')),
+            'explanation': str(recommendation.get('explanation', '')),
+            'book_url': reverse('hospital:book_appointment', args=[doctor_id, issue.id]),
+        })
+    return JsonResponse({'recommendations': recommendations, 'source': ai_recommendations.get('source')})
+
+@login_required
+def vital_signs_job_status(request, issue_id):
+    """API view reporting the processing status of an issue's vital signs uploads"""
+    if request.user.is_patient():
+        issue = get_object_or_404(Issue, id=issue_id, patient__user=request.user)
+    elif request.user.is_doctor():
+        issue = get_object_or_404(Issue.objects.distinct(), id=issue_id, patient__appointments__doctor__user=request.user)
+    elif request.user.is_staff:
+        issue = get_object_or_404(Issue, id=issue_id)
+    else:
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    
+    jobs = []
+    for job in VitalSignsJob.objects.filter(issue=issue).order_by('-enqueued_at')[:5]:
+        jobs.append({
+            'id': job.id,
+            'status': job.status,
+            'attempts': job.attempts,
+            'enqueued_at': job.enqueued_at.isoformat(),
+            'started_at': job.started_at.isoformat() if job.started_at else None,
+            'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+            'duration_seconds': job.duration_seconds,
+            'timings': job.timings,
+        })
+    
+    pending = any(job['status'] in ('queued', 'running') for job in jobs)
+    return JsonResponse({'issue_id': issue.id, 'pending': pending, 'jobs': jobs})
+
+def rank_doctor_candidates(issue, doctors, limit):
+    """
+    The `limit` doctors best suited to an issue, in one query.
+    
+    Doctors with the disease type's recommended specialization come first, then those
+    whose specialization matches a keyword of the issue, each group by experience.
+    A `limit` of 0 keeps every doctor, in the same order.
+    """
+    issue_type = issue.disease_type.name if issue.disease_type else issue.custom_disease_type
+    keyword_matches = keyword_specializations(issue_type, issue.description)
+    recommended = issue.disease_type.recommended_specialization if issue.disease_type else None
+    
+    ranked = doctors.annotate(specialization_match=Case(
+        When(specialization=recommended or '', then=Value(2)),
+        When(specialization__in=keyword_matches, then=Value(1)),
+        default=Value(0),
+        output_field=IntegerField(),
+    )).order_by('-specialization_match', '-years_of_experience', 'id')
+    return list(ranked[:limit] if limit else ranked)
+
 def get_ai_doctor_recommendations(issue, available_doctors):
     """
     Use Google Gemini API to analyze the health issue and recommend doctors
+    
+    Only the AI_RECOMMENDATION_CANDIDATES best candidates from rank_doctor_candidates
+    go into the prompt. Falls back to simulate_ai_recommendations when there is no API
+    key, the call misses its deadline or the answer isn't valid JSON. The result's
+    'source' says which.
     """
+    started = time.perf_counter()
+    doctors_data = []
+    prompt = ''
+    
+    # Prepare issue data
+    issue_data = {
+        'type': issue.disease_type.name if issue.disease_type else issue.custom_disease_type,
+        'description': issue.description,
+        'symptoms': issue.symptoms if issue.symptoms else "",
+        'severity': issue.get_severity_display()
+    }
+    
+    def finish(recommendations, source):
+        if recommendations is not None:
+            recommendations['source'] = source
+        print(f"AI recommendations for issue {issue.id} from {source}: {len(doctors_data)} candidates, "
+              f"{len(prompt)} prompt characters (~{estimate_tokens(prompt)} tokens), "
+              f"{time.perf_counter() - started:.2f}s")
+        return recommendations
+    
+    def simulated():
+        return finish(simulate_ai_recommendations(issue_data), 'simulated')
+    
+    # Without an API key there is no prompt to rank candidates for
+    if not llm_client.available:
+        return simulated()
+    
+    # Prepare doctor data
+    candidates = rank_doctor_candidates(issue, available_doctors.select_related('user'),
+                                        getattr(settings, 'AI_RECOMMENDATION_CANDIDATES', 10))
+    doctors_data = [doctor_entry(doctor) for doctor in candidates]
+    if not doctors_data:
+        return None
+    
+    # Build the prompt for Gemini
+    prompt = f"""
+    You are a medical advisor AI. You need to analyze a patient's health issue and recommend 
+    the most suitable doctors from a list of available doctors.
+    
+    Patient health issue:
+    Type: {issue_data['type']}
+    Description: {issue_data['description']}
+    Symptoms: {issue_data['symptoms']}
+    Severity: {issue_data['severity']}
+    
+    Available doctors:
+    {json.dumps(doctors_data, separators=(',', ':'))}
+    
+    Please analyze the health issue and provide a list of the top 3 most suitable doctors for this 
+    patient, ranked by suitability. For each doctor, provide a brief explanation of why they are 
+    recommended. Return the response in the following JSON format:
+    {{"recommendations": [
+      {{"id": doctor_id, "name": "doctor name", "explanation": "reason for recommendation"}},
+      ...
+    ]}}
+    
+    IMPORTANT: Return ONLY valid JSON with no additional text. Make sure the doctor_id is an integer, not a string.
+    """
+    
     try:
-        # Import the Gemini API library
-        import google.generativeai as genai
-        import json
-        import os
-        from dotenv import load_dotenv
-        
-        # Load environment variables from .env file
-        load_dotenv()
-        
-        # Prepare doctor data
-        doctors_data = []
-        for doctor in available_doctors:
-            doctors_data.append({
-                'id': doctor.id,
-                'name': f"Dr. {doctor.user.get_full_name()}",
-                'specialization': doctor.specialization,
-                'years_of_experience': doctor.years_of_experience,
-                'bio': doctor.bio if doctor.bio else ""
-            })
-        
-        # Prepare issue data
-        issue_data = {
-            'type': issue.disease_type.name if issue.disease_type else issue.custom_disease_type,
-            'description': issue.description,
-            'symptoms': issue.symptoms if issue.symptoms else "",
-            'severity': issue.get_severity_display()
-        }
-        
-        # Get API key from .env file using dotenv
-        api_key = os.getenv('GEMINI_API_KEY')
-        
-        # If no API key, fall back to simulation
-        if not api_key:
-            print("No Gemini API key found in .env file. Falling back to simulated recommendations.")
-            return simulate_ai_recommendations(issue_data, doctors_data)
-        
-        # Configure the Gemini API
-        genai.configure(api_key=api_key)
-        
-        # Select the model
-        model = genai.GenerativeModel('gemini-2.0-pro-exp-02-05')
-        
-        # Build the prompt for Gemini
-        prompt = f"""
-        You are a medical advisor AI. You need to analyze a patient's health issue and recommend 
-        the most suitable doctors from a list of available doctors.
-        
-        Patient health issue:
-        Type: {issue_data['type']}
-        Description: {issue_data['description']}
-        Symptoms: {issue_data['symptoms']}
-        Severity: {issue_data['severity']}
-        
-        Available doctors:
-        {json.dumps(doctors_data, indent=2)}
-        
-        Please analyze the health issue and provide a list of the top 3 most suitable doctors for this 
-        patient, ranked by suitability. For each doctor, provide a brief explanation of why they are 
-        recommended. Return the response in the following JSON format:
-        {{"recommendations": [
-          {{"id": doctor_id, "name": "doctor name", "explanation": "reason for recommendation"}},
-          ...
-        ]}}
-        
-        IMPORTANT: Return ONLY valid JSON with no additional text. Make sure the doctor_id is an integer, not a string.
-        """
-        
-        # Generate the response
-        response = model.generate_content(prompt)
-        
-        # Extract and parse the JSON from the response
-        response_text = response.text
-        
-        # Find the JSON part in the response in case there's any additional text
+        response_text = llm_client.generate(prompt)
+    except LLMUnavailable as e:
+        print(f"Error getting AI recommendations: {e}. Falling back to simulated recommendations.")
+        return simulated()
+    
+    # Find the JSON part in the response in case there's any additional text
+    try:
+        # First try to parse the entire response as JSON
+        recommendations = json.loads(response_text)
+    except json.JSONDecodeError:
+        # If that fails, try to extract JSON from the text
         try:
-            # First try to parse the entire response as JSON
-            recommendations = json.loads(response_text)
-            return recommendations
-        except json.JSONDecodeError:
-            # If that fails, try to extract JSON from the text
-            try:
-                start_idx = response_text.find('{')
-                end_idx = response_text.rfind('}') + 1
-                if start_idx >= 0 and end_idx > start_idx:
-                    json_str = response_text[start_idx:end_idx]
-                    recommendations = json.loads(json_str)
-                    return recommendations
-                else:
-                    raise ValueError("No JSON found in response")
-            except (json.JSONDecodeError, ValueError) as e:
-                print(f"Error parsing Gemini response: {e}")
-                print(f"Response text: {response_text}")
-                # Fall back to simulation
-                return simulate_ai_recommendations(issue_data, doctors_data)
-                
-    except Exception as e:
-        print(f"Error getting AI recommendations: {e}")
-        # Fall back to simulation if there's any error
-        return simulate_ai_recommendations(issue_data, doctors_data)
+            start_idx = response_text.find('{')
+            end_idx = response_text.rfind('}') + 1
+            if start_idx >= 0 and end_idx > start_idx:
+                recommendations = json.loads(response_text[start_idx:end_idx])
+            else:
+                raise ValueError("No JSON found in response")
+        except (json.JSONDecodeError, ValueError) as e:
+            print(f"Error parsing Gemini response: {e}")
+            print(f"Response text: {response_text}")
+            # Fall back to simulation
+            return simulated()
+    
+    if not isinstance(recommendations, dict):
+        print(f"Unexpected Gemini response: {response_text}")
+        return simulated()
+    return finish(recommendations, 'gemini')
 
-def simulate_ai_recommendations(issue_data, doctors_data):
+def simulate_ai_recommendations(issue_data):
     """
     Simulate AI recommendations for demo purposes
+    
+    Doctors come from doctor_index, so this reads a few index entries rather than
+    going through every doctor.
     """
-    if not doctors_data:
+    if not len(doctor_index):
         return None
     
     # Create a simulated response based on the issue and available doctors
     recommendations = []
     
-    # Sort doctors by experience
-    sorted_doctors = sorted(doctors_data, key=lambda x: x['years_of_experience'], reverse=True)
-    
     # Simple matching logic based on disease type and specialization
-    issue_type = issue_data['type'].lower()
-    
-    # Map common health issues to likely specializations
-    specialization_map = {
-        'fever': ['General Medicine', 'Internal Medicine'],
-        'cold': ['General Medicine', 'ENT'],
-        'flu': ['General Medicine', 'Internal Medicine'],
-        'headache': ['Neurology', 'General Medicine'],
-        'migraine': ['Neurology'],
-        'back pain': ['Orthopedics', 'Neurology', 'Physical Therapy'],
-        'skin': ['Dermatology'],
-        'rash': ['Dermatology', 'Allergy'],
-        'stomach': ['Gastroenterology', 'General Medicine'],
-        'digestive': ['Gastroenterology'],
-        'heart': ['Cardiology'],
-        'blood pressure': ['Cardiology', 'Internal Medicine'],
-        'breathing': ['Pulmonology', 'Respiratory Medicine'],
-        'respiratory': ['Pulmonology', 'Respiratory Medicine'],
-        'eye': ['Ophthalmology'],
-        'ear': ['ENT', 'Otolaryngology'],
-        'throat': ['ENT', 'Otolaryngology'],
-        'joint': ['Orthopedics', 'Rheumatology'],
-        'bone': ['Orthopedics'],
-        'diabetes': ['Endocrinology', 'Internal Medicine'],
-        'thyroid': ['Endocrinology'],
-        'anxiety': ['Psychiatry', 'Psychology'],
-        'depression': ['Psychiatry', 'Psychology'],
-        'sleep': ['Neurology', 'Psychiatry', 'Sleep Medicine'],
-        'insomnia': ['Neurology', 'Psychiatry', 'Sleep Medicine'],
-        'kidney': ['Nephrology', 'Urology'],
-        'urinary': ['Urology', 'Nephrology'],
-        'pregnancy': ['Obstetrics', 'Gynecology', 'OB/GYN'],
-        'women': ['Gynecology', 'OB/GYN'],
-        'child': ['Pediatrics'],
-        'cancer': ['Oncology'],
-        'surgery': ['General Surgery'],
-        'allergy': ['Allergy and Immunology', 'Dermatology'],
-        'dental': ['Dentistry'],
-        'teeth': ['Dentistry'],
-        'checkup': ['General Medicine', 'Family Medicine'],
-        'general': ['General Medicine', 'Family Medicine']
-    }
+    issue_type = issue_data['type'] or ''
     
     # Find matching specializations based on issue type
-    matching_specializations = []
-    for key, specializations in specialization_map.items():
-        if key in issue_type or key in issue_data['description'].lower():
-            matching_specializations.extend(specializations)
-    
-    # Make matching specializations unique
-    matching_specializations = list(set(matching_specializations))
+    matching_specializations = keyword_specializations(issue_type, issue_data['description'])
     
     # If no matching specialization found, default to General Medicine
     if not matching_specializations:
         matching_specializations = ['General Medicine']
     
-    # Find doctors with matching specializations
-    matching_doctors = []
-    for doctor in sorted_doctors:
-        if doctor['specialization'] in matching_specializations:
-            matching_doctors.append(doctor)
-    
-    # If no matching doctors, use all doctors sorted by experience
-    if not matching_doctors:
-        matching_doctors = sorted_doctors
+    # Take up to the top 3 doctors with matching specializations, by experience
+    top_doctors = doctor_index.top(matching_specializations, 3)
     
-    # Take up to top 3 doctors
-    top_doctors = matching_doctors[:3]
+    # If no matching doctors, use the most experienced doctors
+    if not top_doctors:
+        top_doctors = doctor_index.top(None, 3)
     
     # Create recommendations with explanations
     for doctor in top_doctors:
@@ -754,8 +696,8 @@ def appointment_detail(request, appointment_id):
     # Get medical summary for doctors
     medical_summary = None
     if request.user.is_doctor() and appointment.patient:
-        patient_issues = Issue.objects.filter(patient=appointment.patient).order_by('-created_at')
-        medical_summary = generate_medical_summary(patient_issues)
+        # Stored summaries are reused until the patient's issues change; a new one is fetched by the page
+        medical_summary = summary_cache.peek(appointment.patient)
     
     return render(request, 'hospital/appointment_detail.html', {
         'appointment': appointment,
@@ -791,8 +733,8 @@ def patient_medical_history(request, patient_id=None):
         # Get all patient issues for the AI summary
         issues = Issue.objects.filter(patient=patient).order_by('-created_at')
         
-        # Generate the AI medical summary using Gemini
-        medical_summary = generate_medical_summary(issues)
+        # Reuse the stored AI medical summary; a new one is fetched by the page
+        medical_summary = summary_cache.peek(patient)
         
     else:
         # Patient viewing their own history
@@ -811,7 +753,7 @@ def patient_medical_history(request, patient_id=None):
         
         # Get issues and generate AI summary for patient's self-view
         issues = Issue.objects.filter(patient=patient).order_by('-created_at')
-        medical_summary = generate_medical_summary(issues) if issues.exists() else None
+        medical_summary = summary_cache.peek(patient) if issues.exists() else None
     
     return render(request, 'hospital/patient_medical_history.html', {
         'patient': patient,
@@ -820,6 +762,20 @@ def patient_medical_history(request, patient_id=None):
         'medical_summary': medical_summary
     })
 
+@login_required
+def medical_summary_data(request, patient_id):
+    """API view with a patient's AI medical summary, generated if there is no stored one"""
+    patient = get_object_or_404(Patient, id=patient_id)
+    
+    # The patient themselves, staff, or a doctor who has treated them
+    allowed = patient.user_id == request.user.id or request.user.is_staff
+    if not allowed and request.user.is_doctor():
+        allowed = Appointment.objects.filter(doctor__user=request.user, patient=patient).exists()
+    if not allowed:
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    
+    return JsonResponse({'summary': summary_cache.get(patient)})
+
 @login_required
 def doctor_patients(request):
     """View for doctors to see their patients"""
@@ -1074,35 +1030,230 @@ def visualize_vital_signs(request, issue_id=None):
         'active_tab': active_tab
     })
 
-@login_required
-def vital_signs_data(request):
-    """API view to get vital signs plots as JSON"""
+def vital_signs_plot_args(request):
+    """
+    Validated arguments of a vital signs plot request, as (kwargs, None) or (None, error response).
+    
+    The dataset must be a file or vitals store directory inside the project.
+    """
     # Check if user is a doctor or patient
     if not (request.user.is_doctor() or request.user.is_patient() or request.user.is_staff):
-        return JsonResponse({'error': 'Permission denied'}, status=403)
+        return None, JsonResponse({'error': 'Permission denied'}, status=403)
     
     # Get patient ID and dataset path from request
-    patient_id = request.GET.get('patient_id')
+    patient_id = request.GET.get('patient_id') or None
     dataset_path = request.GET.get('dataset_path')
+    if patient_id is not None and not patient_id.isdigit():
+        return None, JsonResponse({'error': 'patient_id must be a number'}, status=400)
+    
+    # Roughly how many points the time series plot should have (usually its width in pixels)
+    try:
+        target_points = max(int(request.GET.get('points', 0)), 0) or None
+    except ValueError:
+        return None, JsonResponse({'error': 'points must be a number'}, status=400)
     
-    # Get time range filter parameters
-    start_time = request.GET.get('start_time')
-    end_time = request.GET.get('end_time')
+    # 'rollup' (pre-aggregated buckets), 'lttb' (raw readings, downsampled) or 'none'
+    downsample = request.GET.get('downsample')
+    if downsample not in (None, 'rollup', 'lttb', 'none'):
+        return None, JsonResponse({'error': 'downsample must be rollup, lttb or none'}, status=400)
+    
+    # 'json' (plotly JSON strings) or 'binary' (figure objects with base64 typed arrays)
+    payload_format = request.GET.get('format') or getattr(settings, 'VITALS_PLOT_PAYLOAD_FORMAT', 'json')
+    if payload_format not in PAYLOAD_FORMATS:
+        return None, JsonResponse({'error': 'format must be json or binary'}, status=400)
     
     if not dataset_path:
-        return JsonResponse({'error': 'Dataset path not provided'}, status=400)
+        return None, JsonResponse({'error': 'Dataset path not provided'}, status=400)
     
-    # Check if file exists
+    # Check if file exists, without letting the path point outside the project
+    dataset_path = os.path.realpath(os.path.join(settings.BASE_DIR, dataset_path))
+    allowed_roots = [os.path.realpath(settings.BASE_DIR), os.path.realpath(store_root())]
+    if not any(os.path.commonpath([root, dataset_path]) == root for root in allowed_roots):
+        return None, JsonResponse({'error': 'Dataset file not found'}, status=404)
     if not os.path.exists(dataset_path):
-        return JsonResponse({'error': 'Dataset file not found'}, status=404)
+        return None, JsonResponse({'error': 'Dataset file not found'}, status=404)
+    
+    return {
+        'file_path': dataset_path,
+        'patient_id': patient_id,
+        # Get time range filter parameters
+        'start_time': request.GET.get('start_time'),
+        'end_time': request.GET.get('end_time'),
+        'target_points': target_points,
+        'downsample': downsample,
+        'payload_format': payload_format,
+    }, None
+
+@login_required
+def vital_signs_data(request):
+    """API view to get all vital signs plots as JSON"""
+    args, error = vital_signs_plot_args(request)
+    if error:
+        return error
     
     # Generate plots with optional time filtering
-    plot_data = generate_vital_signs_plots(dataset_path, patient_id, start_time, end_time)
+    plot_data = generate_vital_signs_plots(**args)
     
     if plot_data is None:
         return JsonResponse({'error': 'Error generating plots'}, status=500)
     
-    return JsonResponse(plot_data)
+    return compressed_json_response(request, response_body(plot_data, args['payload_format']))
+
+@login_required
+def vital_signs_figure(request, figure):
+    """
+    API view to get one vital signs figure as JSON, so the page can load each tab on its own.
+    
+    `figure` is one of PATIENT_FIGURES (which need a patient_id) or POPULATION_FIGURES.
+    """
+    if figure not in PATIENT_FIGURES + POPULATION_FIGURES:
+        return JsonResponse({'error': f'Unknown figure {figure}'}, status=404)
+    
+    args, error = vital_signs_plot_args(request)
+    if error:
+        return error
+    if figure in PATIENT_FIGURES and not args['patient_id']:
+        return JsonResponse({'error': f'{figure} needs a patient_id'}, status=400)
+    
+    plot_data = generate_vital_signs_plots(**args, kinds=[figure])
+    
+    if plot_data is None:
+        return JsonResponse({'error': 'Error generating plots'}, status=500)
+    
+    return compressed_json_response(request, response_body(plot_data, args['payload_format']))
+
+@login_required
+def vital_signs_timestamps(request):
+    """
+    API view to page through a patient's exact reading times.
+    
+    Takes the same arguments as vital_signs_data plus `offset` and `limit`; times come
+    as ISO strings, or as epoch milliseconds with format=binary.
+    """
+    args, error = vital_signs_plot_args(request)
+    if error:
+        return error
+    if not args['patient_id']:
+        return JsonResponse({'error': 'patient_id not provided'}, status=400)
+    
+    max_limit = getattr(settings, 'VITALS_TIMESTAMPS_PAGE_MAX', 10000)
+    try:
+        offset = max(int(request.GET.get('offset', 0)), 0)
+        limit = min(max(int(request.GET.get('limit', 1000)), 1), max_limit)
+    except ValueError:
+        return JsonResponse({'error': 'offset and limit must be numbers'}, status=400)
+    
+    page = load_timestamps_page(args['file_path'], args['patient_id'], args['start_time'], args['end_time'],
+                                offset, limit)
+    if page is None:
+        return JsonResponse({'error': 'Error loading timestamps'}, status=500)
+    count, timestamps = page
+    
+    next_offset = offset + len(timestamps)
+    body = {
+        'count': count,
+        'offset': offset,
+        'limit': limit,
+        'next_offset': next_offset if next_offset < count else None,
+        'timestamps': timestamps_payload(timestamps, args['payload_format']),
+    }
+    return compressed_json_response(request, json.dumps(body))
+
+@login_required
+def vital_signs_cache_stats(request):
+    """Hit rates of the vital signs frame, plot and medical summary caches in this process (staff only)"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    
+    return JsonResponse({
+        'frames': frame_cache.stats(),
+        'plots': plot_cache.stats(),
+        'telemetry': dict(telemetry_buffer.stats),
+        'streams': dict(live_hub.stats),
+        'summaries': summary_cache.stats(),
+        'llm': dict(llm_client.stats),
+    })
+
+def telemetry_token_valid(request):
+    """Whether the request carries one of the monitor tokens in VITALS_TELEMETRY_TOKENS"""
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme.lower() != 'bearer' or not token:
+        return False
+    return any(hmac.compare_digest(token.strip(), expected) for expected in getattr(settings, 'VITALS_TELEMETRY_TOKENS', []))
+
+@csrf_exempt
+def ingest_vital_signs(request, issue_id=None, patient_id=None):
+    """
+    API view for monitors to push a batch of live readings for an issue, or for a
+    patient's current issue, as NDJSON or CSV.
+    
+    Monitors authenticate with a bearer token rather than a session. Readings are
+    queued for scoring and answered with 202; 503 means the buffer is full and the
+    batch should be sent again later.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    if not telemetry_token_valid(request):
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    
+    if issue_id is not None:
+        issue = Issue.objects.filter(id=issue_id).only('id').first()
+    else:
+        patient = Patient.objects.filter(id=patient_id).first()
+        issue = telemetry_issue_for_patient(patient) if patient else None
+    if issue is None:
+        return JsonResponse({'error': 'Issue not found'}, status=404)
+    
+    try:
+        readings = parse_telemetry(request.body, request.content_type)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    
+    if readings.empty:
+        return JsonResponse({'issue_id': issue.id, 'accepted': 0}, status=202)
+    if not telemetry_buffer.submit(issue.id, readings):
+        response = JsonResponse({'error': 'Telemetry buffer is full, try again shortly'}, status=503)
+        response['Retry-After'] = '1'
+        return response
+    return JsonResponse({'issue_id': issue.id, 'accepted': len(readings)}, status=202)
+
+@login_required
+def vital_signs_live(request, issue_id):
+    """
+    API view for the live dashboard: an issue's latest readings, after row `after` if given.
+    
+    Readings come from the telemetry this process is scoring, or from the issue's
+    dataset when none is streaming here.
+    """
+    issue = get_object_or_404(Issue.objects.select_related('patient'), id=issue_id)
+    if not can_view_issue_vitals(request.user, issue):
+        return JsonResponse({'error': 'Permission denied'}, status=403)
+    
+    after = request.GET.get('after')
+    if after is not None and not after.lstrip('-').isdigit():
+        return JsonResponse({'error': 'after must be a number'}, status=400)
+    after = int(after) if after is not None else None
+    
+    readings = telemetry_buffer.recent(issue.id, after)
+    if not readings:
+        readings = stored_readings(issue, after)
+    return JsonResponse({'issue_id': issue.id, 'readings': readings})
+
+@login_required
+def vital_signs_stream(request, issue_id):
+    """
+    Server-sent events with an issue's live readings and new alerts.
+    
+    Under ASGI the stream is served by hospital.streams before reaching this view.
+    WSGI can't hold streams open without a thread each, so here the page is told to
+    poll vital_signs_live instead.
+    """
+    return JsonResponse({'error': 'Live streams need the ASGI server'}, status=501)
+
+@login_required
+def doctor_alerts_stream(request):
+    """Server-sent events with a doctor's new alerts; served under ASGI only, as vital_signs_stream"""
+    return JsonResponse({'error': 'Live streams need the ASGI server'}, status=501)
 
 @login_required
 def vital_signs_dashboard(request, issue_id=None):
@@ -1132,6 +1283,8 @@ def vital_signs_dashboard(request, issue_id=None):
         except Http404:
             messages.error(request, "Your patient profile is not set up correctly.")
             return redirect('dashboard')
+        # Patients see the issue their monitor streams to
+        issue = telemetry_issue_for_patient(patient)
     
     context.update({
         'issue': issue if 'issue' in locals() else None,
@@ -1144,8 +1297,7 @@ def vital_signs_dashboard(request, issue_id=None):
 @login_required
 def doctor_alerts(request):
     """View for doctors to see their alerts"""
-    from hospital.utils import reprocess_vital_signs_files
-    reprocess_vital_signs_files()
+    # Alerts are produced on upload and by `manage.py process_vital_signs`, not here
     if not request.user.is_doctor():
         messages.error(request, "This page is only for doctors.")
         return redirect('dashboard')
@@ -1157,7 +1309,7 @@ def doctor_alerts(request):
         return redirect('dashboard')
     
     # Get alerts for this doctor
-    alerts = Alert.objects.filter(doctor=doctor).select_related('patient__user', 'issue')
+    alerts = Alert.objects.filter(doctor=doctor).select_related('patient__user', 'issue', 'rule')
     
     # Filter by status if provided
     status = request.GET.get('status')
@@ -1184,13 +1336,10 @@ def doctor_alerts(request):
     # Update any unviewed alerts to viewed status
     alerts.filter(status='new').update(status='viewed')
     
-    # Group alerts by urgency for the template
-    grouped_alerts = {
-        'critical': alerts.filter(urgency='critical'),
-        'high': alerts.filter(urgency='high'),
-        'medium': alerts.filter(urgency='medium'),
-        'low': alerts.filter(urgency='low')
-    }
+    # Group alerts by urgency for the template with a single query
+    grouped_alerts = {'critical': [], 'high': [], 'medium': [], 'low': []}
+    for alert in alerts:
+        grouped_alerts.setdefault(alert.urgency, []).append(alert)
     
     return render(request, 'hospital/doctor_alerts.html', {
         'grouped_alerts': grouped_alerts,
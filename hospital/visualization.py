@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
@@ -6,28 +7,208 @@ import json
 import os
 from pathlib import Path
 from datetime import datetime
+from django.conf import settings
 
-def load_vital_signs_data(file_path, start_time=None, end_time=None):
-    """Load vital signs data from a CSV file with optional time filtering"""
+from .downsample import lttb_series
+from .frame_cache import estimated_frame_bytes, frame_cache, source_key
+from .patient_index import index_vitals_frame
+from .plot_cache import plot_cache
+from .plot_payload import figure_payload
+from .population import (
+    correlation_matrix, histogram_bars, population_stats, read_population_stats, risk_counts,
+    risk_group_means, write_population_stats
+)
+from .vitals_store import (
+    as_naive_timestamp, has_rollups, is_vitals_dataset, pick_resolution, read_manifest, read_rollups, read_vitals,
+    rollup_frame
+)
+
+# Columns the time series plot reads
+TIMESERIES_COLUMNS = [
+    'Patient ID', 'Timestamp', 'Heart Rate', 'Respiratory Rate', 'Body Temperature',
+    'Oxygen Saturation', 'Systolic Blood Pressure', 'Diastolic Blood Pressure',
+]
+
+# Above this many points per trace, markers are dropped and only lines are drawn
+MARKER_MAX_POINTS = 500
+
+# A pause of this many sampling intervals between readings is reported as a gap
+TIME_AXIS_GAP_FACTOR = 5
+# Only the longest gaps are reported, so the time axis stays the same size
+TIME_AXIS_MAX_GAPS = 50
+
+# Figures drawn for one patient, and for everyone in the time window
+PATIENT_FIGURES = ['time_axis', 'timeseries', 'radar', 'gauges']
+POPULATION_FIGURES = ['distribution', 'correlation', 'risk_analysis']
+
+def parsed_vital_signs_frame(file_path):
+    """
+    All readings of a source, parsed and indexed by patient and time, from the frame cache.
+    
+    Returns a PatientIndexedFrame, or None if the source is too big for the cache's
+    memory budget or has no Patient ID and Timestamp to index on.
+    """
+    key = source_key(file_path)
+    indexed = frame_cache.get(key)
+    if indexed is not None:
+        return indexed
+    if estimated_frame_bytes(file_path) > frame_cache.max_bytes:
+        return None
+    
+    content_hash = read_manifest(file_path)['content_hash'] if is_vitals_dataset(file_path) else None
+    data = read_vitals(file_path)
+    if 'Timestamp' in data.columns:
+        data['Timestamp'] = pd.to_datetime(data['Timestamp'])
+    indexed = index_vitals_frame(data, file_path if content_hash else None, content_hash)
+    if indexed is not None:
+        frame_cache.put(key, indexed)
+    return indexed
+
+def slice_vital_signs_frame(indexed, start_time=None, end_time=None, patient_id=None, columns=None):
+    """Copy of the indexed readings within a window, patient and column list"""
+    data = indexed.select(patient_id, start_time, end_time)
+    if columns is not None:
+        data = data[[name for name in columns if name in data.columns]]
+    # Callers may modify what they get back; the cached frame must stay intact
+    return data.copy()
+
+def load_vital_signs_data(file_path, start_time=None, end_time=None, patient_id=None, columns=None):
+    """
+    Load vital signs data from the vitals store (or a legacy CSV) with optional filtering.
+    
+    Sources that fit the frame cache are parsed once and later requests only slice the
+    cached frame. Bigger ones are read with the time window, patient and column list
+    pushed down to the storage layer.
+    """
     try:
-        data = pd.read_csv(file_path)
+        if not (start_time and end_time):
+            start_time = end_time = None
         
-        # Convert timestamp to datetime for filtering
-        data['Timestamp'] = pd.to_datetime(data['Timestamp'])
+        cached = parsed_vital_signs_frame(file_path)
+        if cached is not None:
+            return slice_vital_signs_frame(cached, start_time, end_time, patient_id, columns)
+        
+        data = read_vitals(file_path, columns=columns, patient_id=patient_id,
+                           start_time=start_time, end_time=end_time)
         
-        # Apply time filtering if provided
-        if start_time and end_time:
-            start_dt = pd.to_datetime(start_time)
-            end_dt = pd.to_datetime(end_time)
-            data = data[(data['Timestamp'] >= start_dt) & (data['Timestamp'] <= end_dt)]
+        # Convert timestamp to datetime for filtering
+        if 'Timestamp' in data.columns:
+            data['Timestamp'] = pd.to_datetime(data['Timestamp'])
         
         return data
     except Exception as e:
         print(f"Error loading vital signs data: {e}")
         return None
 
-def create_timeseries_plot(data, patient_id=None):
-    """Create an interactive time series plot of vital signs"""
+def load_timeseries_data(file_path, patient_id, start_time=None, end_time=None, target_points=None,
+                         downsample=None):
+    """
+    Load a patient's readings for the time series plot.
+    
+    With `downsample='rollup'` (the default) they come at the coarsest rollup that still
+    gives about `target_points` points over the window, or raw for short windows. 'lttb'
+    and 'none' always load raw readings. Returns (data, resolution), where resolution is
+    a rollup name ('1min', '15min', '1h') or 'raw'. Stored rollups are used for datasets;
+    other sources are rolled up on the fly.
+    """
+    target_points = target_points or getattr(settings, 'VITALS_PLOT_TARGET_POINTS', 1000)
+    downsample = downsample or getattr(settings, 'VITALS_PLOT_DOWNSAMPLE', 'rollup')
+    if not (start_time and end_time):
+        start_time = end_time = None
+    
+    if downsample != 'rollup':
+        return load_vital_signs_data(file_path, start_time, end_time, patient_id=patient_id,
+                                     columns=TIMESERIES_COLUMNS), 'raw'
+    
+    if has_rollups(file_path):
+        # The hourly rollup is small and gives the patient's time range when no window is set
+        hourly = read_rollups(file_path, '1h', patient_id, start_time, end_time)
+        if hourly.empty:
+            return hourly, '1h'
+        first = as_naive_timestamp(start_time) if start_time else hourly['Timestamp'].min()
+        last = as_naive_timestamp(end_time) if end_time else hourly['Timestamp'].max() + pd.Timedelta(hours=1)
+        resolution = pick_resolution((last - first).total_seconds(), target_points)
+        if resolution:
+            return read_rollups(file_path, resolution, patient_id, start_time, end_time), resolution
+        return load_vital_signs_data(file_path, start_time, end_time, patient_id=patient_id,
+                                     columns=TIMESERIES_COLUMNS), 'raw'
+    
+    data = load_vital_signs_data(file_path, start_time, end_time, patient_id=patient_id,
+                                 columns=TIMESERIES_COLUMNS)
+    if data is None or data.empty:
+        return data, 'raw'
+    span = (data['Timestamp'].max() - data['Timestamp'].min()).total_seconds()
+    resolution = pick_resolution(span, target_points)
+    if resolution:
+        return rollup_frame(data, resolution), resolution
+    return data, 'raw'
+
+def add_vital_trace(fig, data, column, name, color, row, dash=None, max_points=None, point_counts=None):
+    """
+    Add one vital to the time series plot.
+    
+    Raw readings are drawn as lines with markers, reduced to `max_points` with LTTB when
+    given. Rolled-up data (with '<column> min' and '<column> max' columns) is drawn as the
+    bucket mean over a min-max band. Readings in and points out are added to `point_counts`.
+    """
+    timestamps, values = data['Timestamp'], data[column]
+    if f'{column} min' in data.columns:
+        original = int(data[f'{column} count'].sum())
+        fig.add_trace(
+            go.Scatter(
+                x=timestamps,
+                y=data[f'{column} min'],
+                mode='lines',
+                line=dict(width=0),
+                hoverinfo='skip',
+                showlegend=False
+            ),
+            row=row, col=1
+        )
+        fig.add_trace(
+            go.Scatter(
+                x=timestamps,
+                y=data[f'{column} max'],
+                mode='lines',
+                line=dict(width=0),
+                fill='tonexty',
+                fillcolor=f'rgba({color}, 0.15)',
+                name=f'{name} range',
+                hoverinfo='skip',
+                showlegend=False
+            ),
+            row=row, col=1
+        )
+        mode = 'lines'
+    else:
+        original = int(values.notna().sum())
+        if max_points and original > max_points:
+            timestamps, values = lttb_series(timestamps.to_numpy(), values.to_numpy(), max_points)
+        mode = 'lines+markers' if len(values) <= MARKER_MAX_POINTS else 'lines'
+    
+    if point_counts is not None:
+        point_counts['original'] = point_counts.get('original', 0) + original
+        point_counts['returned'] = point_counts.get('returned', 0) + len(values)
+    
+    fig.add_trace(
+        go.Scatter(
+            x=timestamps, 
+            y=values,
+            mode=mode,
+            name=name,
+            line=dict(color=f'rgba({color}, 0.8)', width=2, dash=dash),
+            marker=dict(size=6, color=f'rgba({color}, 1.0)')
+        ),
+        row=row, col=1
+    )
+
+def create_timeseries_plot(data, patient_id=None, resolution='raw', max_points=None, point_counts=None):
+    """
+    Create an interactive time series plot of vital signs.
+    
+    Raw traces longer than `max_points` are downsampled with LTTB; the readings in and
+    points out across all traces are added to `point_counts` if given.
+    """
     if patient_id:
         data = data[data['Patient ID'] == patient_id].copy()
     
@@ -50,70 +231,12 @@ def create_timeseries_plot(data, patient_id=None):
         )
     )
     
-    # Add heart rate trace
-    fig.add_trace(
-        go.Scatter(
-            x=data['Timestamp'], 
-            y=data['Heart Rate'],
-            mode='lines+markers',
-            name='Heart Rate',
-            line=dict(color='rgba(220, 20, 60, 0.8)', width=2),
-            marker=dict(size=6, color='rgba(220, 20, 60, 1.0)')
-        ),
-        row=1, col=1
-    )
-    
-    # Add respiratory rate trace
-    fig.add_trace(
-        go.Scatter(
-            x=data['Timestamp'], 
-            y=data['Respiratory Rate'],
-            mode='lines+markers',
-            name='Respiratory Rate',
-            line=dict(color='rgba(30, 144, 255, 0.8)', width=2, dash='dot'),
-            marker=dict(size=6, color='rgba(30, 144, 255, 1.0)')
-        ),
-        row=1, col=1
-    )
-    
-    # Add systolic blood pressure trace
-    fig.add_trace(
-        go.Scatter(
-            x=data['Timestamp'], 
-            y=data['Systolic Blood Pressure'],
-            mode='lines+markers',
-            name='Systolic BP',
-            line=dict(color='rgba(178, 34, 34, 0.8)', width=2),
-            marker=dict(size=6, color='rgba(178, 34, 34, 1.0)')
-        ),
-        row=2, col=1
-    )
-    
-    # Add diastolic blood pressure trace
-    fig.add_trace(
-        go.Scatter(
-            x=data['Timestamp'], 
-            y=data['Diastolic Blood Pressure'],
-            mode='lines+markers',
-            name='Diastolic BP',
-            line=dict(color='rgba(255, 140, 0, 0.8)', width=2),
-            marker=dict(size=6, color='rgba(255, 140, 0, 1.0)')
-        ),
-        row=2, col=1
-    )
-    
-    # Add body temperature trace
-    fig.add_trace(
-        go.Scatter(
-            x=data['Timestamp'], 
-            y=data['Body Temperature'],
-            mode='lines+markers',
-            name='Body Temperature',
-            line=dict(color='rgba(75, 0, 130, 0.8)', width=2),
-            marker=dict(size=6, color='rgba(75, 0, 130, 1.0)')
-        ),
-        row=3, col=1
-    )
+    trace_options = dict(max_points=max_points, point_counts=point_counts)
+    add_vital_trace(fig, data, 'Heart Rate', 'Heart Rate', '220, 20, 60', row=1, **trace_options)
+    add_vital_trace(fig, data, 'Respiratory Rate', 'Respiratory Rate', '30, 144, 255', row=1, dash='dot', **trace_options)
+    add_vital_trace(fig, data, 'Systolic Blood Pressure', 'Systolic BP', '178, 34, 34', row=2, **trace_options)
+    add_vital_trace(fig, data, 'Diastolic Blood Pressure', 'Diastolic BP', '255, 140, 0', row=2, **trace_options)
+    add_vital_trace(fig, data, 'Body Temperature', 'Body Temperature', '75, 0, 130', row=3, **trace_options)
     
     # Add reference range for temperature
     fig.add_trace(
@@ -128,18 +251,7 @@ def create_timeseries_plot(data, patient_id=None):
         row=3, col=1
     )
     
-    # Add oxygen saturation trace
-    fig.add_trace(
-        go.Scatter(
-            x=data['Timestamp'], 
-            y=data['Oxygen Saturation'],
-            mode='lines+markers',
-            name='Oxygen Saturation',
-            line=dict(color='rgba(60, 179, 113, 0.8)', width=2),
-            marker=dict(size=6, color='rgba(60, 179, 113, 1.0)')
-        ),
-        row=4, col=1
-    )
+    add_vital_trace(fig, data, 'Oxygen Saturation', 'Oxygen Saturation', '60, 179, 113', row=4, **trace_options)
     
     # Add reference line for oxygen saturation
     fig.add_trace(
@@ -157,7 +269,9 @@ def create_timeseries_plot(data, patient_id=None):
     # Update layout
     fig.update_layout(
         height=800,
-        title_text=f"Patient Vital Signs Monitoring" + (f" - Patient #{patient_id}" if patient_id else ""),
+        title_text=f"Patient Vital Signs Monitoring" + (f" - Patient #{patient_id}" if patient_id else "")
+            + (f" ({resolution} averages)" if resolution != 'raw' else "")
+            + (" (downsampled)" if point_counts and point_counts['returned'] < point_counts['original'] else ""),
         title_font=dict(size=24),
         legend=dict(
             orientation="h",
@@ -189,19 +303,12 @@ def create_timeseries_plot(data, patient_id=None):
     
     return fig
 
-def create_correlation_heatmap(data):
+def create_correlation_heatmap(population):
     """Create a correlation heatmap of vital signs data"""
-    # Select numeric columns
-    numeric_cols = [
-        'Heart Rate', 'Respiratory Rate', 'Body Temperature', 
-        'Oxygen Saturation', 'Systolic Blood Pressure', 
-        'Diastolic Blood Pressure', 'Age', 'Weight (kg)', 
-        'Height (m)', 'Derived_HRV', 'Derived_Pulse_Pressure', 
-        'Derived_BMI', 'Derived_MAP'
-    ]
-    
-    # Calculate correlation matrix
-    corr = data[numeric_cols].corr()
+    # Correlation matrix of the numeric columns, from the precomputed pairwise sums
+    corr = correlation_matrix(population)
+    if corr is None:
+        return None
     
     # Create heatmap
     fig = px.imshow(
@@ -222,7 +329,9 @@ def create_correlation_heatmap(data):
 
 def create_radar_chart(data, patient_id):
     """Create a radar chart showing the patient's vital signs compared to normal ranges"""
-    patient_data = data[data['Patient ID'] == patient_id].iloc[0]
+    patient_rows = data[data['Patient ID'] == patient_id]
+    # The patient's first reading in the upload; cached frames are sorted by time but keep upload row labels
+    patient_data = patient_rows.iloc[patient_rows.index.argmin()]
     
     # Define normal ranges
     normal_ranges = {
@@ -292,7 +401,8 @@ def create_radar_chart(data, patient_id):
 def create_gauge_charts(data, patient_id):
     """Create gauge charts for key vital signs"""
     # For time-filtered data, use average values
-    patient_data = data[data['Patient ID'] == patient_id].mean()
+    patient_rows = data[data['Patient ID'] == patient_id]
+    patient_data = patient_rows.mean(numeric_only=True)
     
     # Create a subplot with 6 gauge charts
     fig = make_subplots(
@@ -454,9 +564,9 @@ def create_gauge_charts(data, patient_id):
     
     # Calculate time period for title
     time_period = ""
-    if len(data[data['Patient ID'] == patient_id]) > 1:
-        min_time = data[data['Patient ID'] == patient_id]['Timestamp'].min()
-        max_time = data[data['Patient ID'] == patient_id]['Timestamp'].max()
+    if len(patient_rows) > 1:
+        min_time = patient_rows['Timestamp'].min()
+        max_time = patient_rows['Timestamp'].max()
         time_period = f" (Average: {min_time.strftime('%b %d')} - {max_time.strftime('%b %d, %Y')})"
     
     # Update layout
@@ -470,8 +580,8 @@ def create_gauge_charts(data, patient_id):
     
     return fig
 
-def create_distribution_plots(data):
-    """Create distribution plots for vital signs"""
+def create_distribution_plots(population):
+    """Create distribution plots for vital signs from precomputed histogram bin counts"""
     # Create a subplot with 6 histogram plots
     fig = make_subplots(
         rows=3, cols=2,
@@ -482,71 +592,30 @@ def create_distribution_plots(data):
         )
     )
     
-    # Heart Rate
-    fig.add_trace(
-        go.Histogram(
-            x=data['Heart Rate'],
-            marker_color='rgba(220, 20, 60, 0.7)',
-            nbinsx=30,
-            name='Heart Rate'
-        ),
-        row=1, col=1
-    )
-    
-    # Respiratory Rate
-    fig.add_trace(
-        go.Histogram(
-            x=data['Respiratory Rate'],
-            marker_color='rgba(30, 144, 255, 0.7)',
-            nbinsx=20,
-            name='Respiratory Rate'
-        ),
-        row=1, col=2
-    )
-    
-    # Body Temperature
-    fig.add_trace(
-        go.Histogram(
-            x=data['Body Temperature'],
-            marker_color='rgba(75, 0, 130, 0.7)',
-            nbinsx=25,
-            name='Body Temperature'
-        ),
-        row=2, col=1
-    )
-    
-    # Oxygen Saturation
-    fig.add_trace(
-        go.Histogram(
-            x=data['Oxygen Saturation'],
-            marker_color='rgba(60, 179, 113, 0.7)',
-            nbinsx=20,
-            name='Oxygen Saturation'
-        ),
-        row=2, col=2
-    )
-    
-    # Systolic BP
-    fig.add_trace(
-        go.Histogram(
-            x=data['Systolic Blood Pressure'],
-            marker_color='rgba(178, 34, 34, 0.7)',
-            nbinsx=30,
-            name='Systolic BP'
-        ),
-        row=3, col=1
-    )
-    
-    # Diastolic BP
-    fig.add_trace(
-        go.Histogram(
-            x=data['Diastolic Blood Pressure'],
-            marker_color='rgba(255, 140, 0, 0.7)',
-            nbinsx=30,
-            name='Diastolic BP'
-        ),
-        row=3, col=2
-    )
+    histograms = [
+        ('Heart Rate', 'Heart Rate', 'rgba(220, 20, 60, 0.7)', 30, 1, 1),
+        ('Respiratory Rate', 'Respiratory Rate', 'rgba(30, 144, 255, 0.7)', 20, 1, 2),
+        ('Body Temperature', 'Body Temperature', 'rgba(75, 0, 130, 0.7)', 25, 2, 1),
+        ('Oxygen Saturation', 'Oxygen Saturation', 'rgba(60, 179, 113, 0.7)', 20, 2, 2),
+        ('Systolic Blood Pressure', 'Systolic BP', 'rgba(178, 34, 34, 0.7)', 30, 3, 1),
+        ('Diastolic Blood Pressure', 'Diastolic BP', 'rgba(255, 140, 0, 0.7)', 30, 3, 2),
+    ]
+    for column, name, color, nbins, row, col in histograms:
+        bars = histogram_bars(population, column, nbins)
+        if bars is None:
+            continue
+        centers, counts, width = bars
+        fig.add_trace(
+            go.Bar(
+                x=centers,
+                y=counts,
+                width=width,
+                marker_color=color,
+                marker_line_width=0,
+                name=name
+            ),
+            row=row, col=col
+        )
     
     # Update layout
     fig.update_layout(
@@ -556,6 +625,7 @@ def create_distribution_plots(data):
         title_font=dict(size=24),
         showlegend=False,
         template="plotly_white",
+        bargap=0,
         margin=dict(l=60, r=40, t=100, b=40),
     )
     
@@ -574,11 +644,12 @@ def create_distribution_plots(data):
     
     return fig
 
-def create_risk_analysis_charts(data):
+def create_risk_analysis_charts(population):
     """Create charts analyzing the relationship between vital signs and risk categories"""
     # Count risk categories
-    risk_counts = data['Risk Category'].value_counts().reset_index()
-    risk_counts.columns = ['Risk Category', 'Count']
+    risk_counts_by_category = risk_counts(population)
+    if risk_counts_by_category.empty:
+        return None
     
     # Create subplot with 2 charts
     fig = make_subplots(
@@ -590,8 +661,8 @@ def create_risk_analysis_charts(data):
     # Add pie chart for risk distribution
     fig.add_trace(
         go.Pie(
-            labels=risk_counts['Risk Category'],
-            values=risk_counts['Count'],
+            labels=risk_counts_by_category.index.tolist(),
+            values=risk_counts_by_category.tolist(),
             hole=0.4,
             marker=dict(
                 colors=['rgba(255, 0, 0, 0.7)', 'rgba(255, 165, 0, 0.7)', 'rgba(0, 128, 0, 0.7)']
@@ -603,23 +674,15 @@ def create_risk_analysis_charts(data):
         row=1, col=1
     )
     
-    # Calculate average vital signs by risk category
-    risk_avg = data.groupby('Risk Category')[
-        ['Heart Rate', 'Respiratory Rate', 'Body Temperature', 
-         'Oxygen Saturation', 'Systolic Blood Pressure', 'Diastolic Blood Pressure']
-    ].mean().reset_index()
+    # Average vital signs by risk category
+    vitals = ['Heart Rate', 'Respiratory Rate', 'Body Temperature', 
+              'Oxygen Saturation', 'Systolic Blood Pressure', 'Diastolic Blood Pressure']
+    risk_avg = risk_group_means(population).reindex(columns=vitals).rename_axis('Risk Category').reset_index()
     
-    # Normalize the data for better visualization
-    # Get min and max values for each vital sign
-    min_vals = data[['Heart Rate', 'Respiratory Rate', 'Body Temperature', 
-                     'Oxygen Saturation', 'Systolic Blood Pressure', 'Diastolic Blood Pressure']].min()
-    max_vals = data[['Heart Rate', 'Respiratory Rate', 'Body Temperature', 
-                     'Oxygen Saturation', 'Systolic Blood Pressure', 'Diastolic Blood Pressure']].max()
-    
-    # Normalize the values
-    for col in ['Heart Rate', 'Respiratory Rate', 'Body Temperature', 
-                'Oxygen Saturation', 'Systolic Blood Pressure', 'Diastolic Blood Pressure']:
-        risk_avg[f'{col}_norm'] = (risk_avg[col] - min_vals[col]) / (max_vals[col] - min_vals[col])
+    # Normalize the values with each vital sign's population min and max
+    for col in vitals:
+        min_val, max_val = population['ranges'].get(col, (np.nan, np.nan))
+        risk_avg[f'{col}_norm'] = (risk_avg[col] - min_val) / (max_val - min_val)
     
     # Add grouped bar chart for vital signs by risk
     for i, risk in enumerate(risk_avg['Risk Category']):
@@ -662,50 +725,179 @@ def create_risk_analysis_charts(data):
     
     return fig
 
-def generate_vital_signs_plots(file_path, patient_id=None, start_time=None, end_time=None):
-    """Generate all plots for a patient's vital signs data with optional time filtering"""
-    data = load_vital_signs_data(file_path, start_time, end_time)
-    
+def iso_timestamp(value):
+    return pd.Timestamp(value).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+
+def time_axis_descriptor(timestamps):
+    """
+    Fixed-size summary of reading times for the time range slider.
+    
+    Gives the first and last reading, the number of readings, the typical (median)
+    interval between them and the longest gaps, as ISO strings and milliseconds.
+    Returns None if there are no readings.
+    """
+    values = np.sort(timestamps.dropna().to_numpy(dtype='datetime64[ns]'))
+    if not len(values):
+        return None
+    steps = np.diff(values).astype(np.int64)
+    positive = steps[steps > 0]
+    interval = int(np.median(positive)) if len(positive) else 0
+    
+    gaps = np.flatnonzero(steps > TIME_AXIS_GAP_FACTOR * interval) if interval else np.arange(0)
+    truncated = len(gaps) > TIME_AXIS_MAX_GAPS
+    if truncated:
+        longest = np.argpartition(steps[gaps], -TIME_AXIS_MAX_GAPS)[-TIME_AXIS_MAX_GAPS:]
+        gaps = np.sort(gaps[longest])
+    return {
+        'start': iso_timestamp(values[0]),
+        'end': iso_timestamp(values[-1]),
+        'count': len(values),
+        'interval_ms': interval / 1e6,
+        'gaps': [[iso_timestamp(values[i]), iso_timestamp(values[i + 1])] for i in gaps.tolist()],
+        'gaps_truncated': truncated,
+    }
+
+def load_timestamps_page(file_path, patient_id, start_time=None, end_time=None, offset=0, limit=1000):
+    """
+    Exact reading times of a patient, `limit` at a time from `offset`.
+    
+    Returns (total readings in the window, Series of timestamps on the page), or
+    None if the source can't be read.
+    """
+    data = load_vital_signs_data(file_path, start_time, end_time, patient_id=patient_id, columns=['Timestamp'])
     if data is None:
         return None
+    timestamps = data['Timestamp'].dropna()
+    if not timestamps.is_monotonic_increasing:
+        # Sources read without the patient index come back in upload order
+        timestamps = timestamps.sort_values(ignore_index=True)
+    return len(timestamps), timestamps.iloc[offset:offset + limit]
+
+def build_figure(kind, data, population, file_path, patient_id, start_time, end_time, target_points, downsample,
+                 payload_format='json'):
+    """
+    Response fields for one figure kind, or {} if there is nothing to draw.
+    
+    Patient figures are drawn from the patient's readings in `data`, population
+    figures from the aggregates in `population`. Figures are encoded in `payload_format`.
+    """
+    if kind == 'time_axis':
+        # Extent of this patient's readings for the time range slider
+        time_axis = time_axis_descriptor(data['Timestamp'])
+        return {'time_axis': time_axis} if time_axis else {}
+    
+    if kind == 'timeseries':
+        series, resolution = load_timeseries_data(file_path, patient_id, start_time, end_time,
+                                                  target_points, downsample)
+        if series is None:
+            return {}
+        max_points = target_points if downsample != 'none' else None
+        point_counts = {}
+        fig = create_timeseries_plot(series, patient_id, resolution, max_points, point_counts)
+        if fig is None:
+            return {}
+        return {
+            'timeseries': figure_payload(fig, payload_format),
+            'timeseries_resolution': resolution,
+            'timeseries_points': point_counts,
+        }
+    
+    builders = {
+        'radar': lambda: create_radar_chart(data, patient_id),
+        'gauges': lambda: create_gauge_charts(data, patient_id),
+        'distribution': lambda: create_distribution_plots(population),
+        'correlation': lambda: create_correlation_heatmap(population),
+        'risk_analysis': lambda: create_risk_analysis_charts(population),
+    }
+    fig = builders[kind]()
+    return {kind: figure_payload(fig, payload_format)} if fig is not None else {}
+
+def figure_params(kind, patient_id, start_time, end_time, target_points, downsample, payload_format):
+    """Plot cache key for a figure; population figures are shared by every patient"""
+    if kind in POPULATION_FIGURES:
+        return plot_cache.params_key(kind, None, start_time, end_time, payload_format=payload_format)
+    if kind == 'timeseries':
+        return plot_cache.params_key(kind, patient_id, start_time, end_time, target_points=target_points,
+                                     downsample=downsample, payload_format=payload_format)
+    return plot_cache.params_key(kind, patient_id, start_time, end_time, payload_format=payload_format)
+
+def generate_vital_signs_plots(file_path, patient_id=None, start_time=None, end_time=None, target_points=None,
+                               downsample=None, payload_format=None, kinds=None):
+    """
+    Generate all plots for a patient's vital signs data with optional time filtering.
+    
+    The time series plot is sized to about `target_points` points per trace, using
+    rollups or LTTB depending on `downsample` ('rollup', 'lttb' or 'none'). Rendered
+    figures come from the plot cache when the same source version, patient and window
+    were drawn before; the readings are only loaded if some figure is missing, and
+    patient figures only read the patient's rows.
+    
+    `payload_format` is 'json' (plotly JSON strings) or 'binary' (figures as objects
+    with typed arrays, see plot_payload). `kinds` limits the figures to some of
+    PATIENT_FIGURES and POPULATION_FIGURES; each is cached on its own.
+    """
+    target_points = target_points or getattr(settings, 'VITALS_PLOT_TARGET_POINTS', 1000)
+    downsample = downsample or getattr(settings, 'VITALS_PLOT_DOWNSAMPLE', 'rollup')
+    payload_format = payload_format or getattr(settings, 'VITALS_PLOT_PAYLOAD_FORMAT', 'json')
+    if not (start_time and end_time):
+        start_time = end_time = None
+    # Make sure patient_id is numeric
+    patient_id = int(patient_id) if patient_id else None
     
-    plots = {}
-    timestamps = []
+    try:
+        version = plot_cache.source_version(file_path)
+    except OSError as e:
+        print(f"Error loading vital signs data: {e}")
+        return None
     
-    # Extract timestamps for the time range slider
-    if patient_id:
-        patient_data = data[data['Patient ID'] == int(patient_id)]
-        if not patient_data.empty:
-            # Get unique timestamps for this patient and convert to ISO format strings
-            timestamps = patient_data['Timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%S.%fZ').tolist()
+    kinds = [kind for kind in (PATIENT_FIGURES if patient_id else []) + POPULATION_FIGURES
+             if kinds is None or kind in kinds]
+    params = {kind: figure_params(kind, patient_id, start_time, end_time, target_points, downsample, payload_format)
+              for kind in kinds}
     
-    # If patient_id is specified, create patient-specific visualizations
-    if patient_id:
-        # Make sure patient_id is numeric
-        patient_id = int(patient_id)
+    plot_jsons = {}
+    missing = []
+    for kind in kinds:
+        payload = plot_cache.get(file_path, version, params[kind])
+        if payload is None:
+            missing.append(kind)
+        else:
+            plot_jsons.update(payload)
+    if not missing:
+        return plot_jsons
+    
+    # Population figures over a whole dataset come from its stored aggregates, so
+    # everyone's readings are only loaded for a time window or a CSV source
+    population = None
+    need_population = any(kind in POPULATION_FIGURES for kind in missing)
+    whole_dataset = is_vitals_dataset(file_path) and start_time is None
+    if need_population and whole_dataset:
+        population = read_population_stats(file_path, version)
+    
+    # Patient figures only need the patient's readings, found through the patient index
+    patient_data = None
+    if any(kind in PATIENT_FIGURES for kind in missing):
+        patient_data = load_vital_signs_data(file_path, start_time, end_time, patient_id=patient_id)
+        if patient_data is None:
+            return None
         
         # Check if patient exists in data
-        if patient_id not in data['Patient ID'].values:
+        if patient_data.empty:
             return None
-        
-        # Generate patient-specific plots
-        plots['timeseries'] = create_timeseries_plot(data, patient_id)
-        plots['radar'] = create_radar_chart(data, patient_id)
-        plots['gauges'] = create_gauge_charts(data, patient_id)
-    
-    # Generate population-level plots
-    plots['distribution'] = create_distribution_plots(data)
-    plots['correlation'] = create_correlation_heatmap(data)
-    plots['risk_analysis'] = create_risk_analysis_charts(data)
     
-    # Convert plots to JSON
-    plot_jsons = {}
-    for key, fig in plots.items():
-        if fig is not None:
-            plot_jsons[key] = fig.to_json()
-    
-    # Add timestamps to the response
-    if timestamps:
-        plot_jsons['timestamps'] = timestamps
-    
-    return plot_jsons 
\ No newline at end of file
+    if population is None and need_population:
+        data = load_vital_signs_data(file_path, start_time, end_time)
+        if data is None:
+            return None
+        population = population_stats(data)
+        if whole_dataset:
+            # Datasets written before the aggregates existed get them on first use
+            write_population_stats(file_path, population, version)
+    
+    for kind in missing:
+        payload = build_figure(kind, patient_data, population, file_path, patient_id, start_time, end_time,
+                               target_points, downsample, payload_format)
+        plot_cache.put(file_path, version, params[kind], payload)
+        plot_jsons.update(payload)
+    
+    return plot_jsons
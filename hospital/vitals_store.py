@@ -0,0 +1,322 @@
+"""
+Columnar store for device vital signs.
+
+Each upload is converted once into a Parquet dataset directory, hive-partitioned by
+patient and day (``patient_id=<id>/date=<YYYY-MM-DD>/part-*.parquet``), with typed
+columns. Readers go through read_vitals()/iter_vitals_chunks(), which project only the
+requested columns and push Patient ID and Timestamp filters down to partition pruning
+and Parquet row-group statistics. Plain CSV paths are still accepted so issues created
+before the store existed keep working.
+
+A ``_manifest.json`` next to the partitions lists the parts appended to the dataset, in
+order, with a content hash and row count for each. ``_rollups/`` and
+``_population.json`` hold aggregates that are kept current as parts are appended;
+``_patient_index.npz`` holds the (Patient ID, Timestamp) sort order used by readers.
+"""
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+from django.conf import settings
+
+from .population import update_population_stats
+
+MANIFEST_NAME = '_manifest.json'
+
+# Position of each reading in the original upload; readings are returned in this order
+ROW_NUMBER = 'row_number'
+
+# Hive partition keys derived from 'Patient ID' and 'Timestamp'
+PARTITION_SCHEMA = pa.schema([('patient_id', pa.int64()), ('date', pa.string())])
+PARTITIONING = ds.partitioning(PARTITION_SCHEMA, flavor='hive')
+HELPER_COLUMNS = [ROW_NUMBER, 'patient_id', 'date']
+
+# Columns kept as integers; every other numeric column is stored as float64
+INTEGER_COLUMNS = ['Patient ID']
+
+# Per-patient rollups kept next to the partitions, keyed by bucket size in seconds
+ROLLUP_DIR = '_rollups'
+ROLLUP_RESOLUTIONS = {'1min': 60, '15min': 900, '1h': 3600}
+ROLLUP_VITALS = [
+    'Heart Rate', 'Respiratory Rate', 'Body Temperature', 'Oxygen Saturation',
+    'Systolic Blood Pressure', 'Diastolic Blood Pressure',
+]
+# Partial aggregates stored per bucket, and how two partials of one bucket combine
+ROLLUP_STATS = {'min': 'min', 'max': 'max', 'sum': 'sum', 'count': 'sum'}
+
+def store_root():
+    """Directory holding one dataset per converted upload"""
+    return str(getattr(settings, 'VITALS_STORE_ROOT', os.path.join(settings.BASE_DIR, 'vitals_store')))
+
+def dataset_path_for_issue(issue_id):
+    """New dataset directory for an issue's upload"""
+    name = f"issue_{issue_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+    return os.path.join(store_root(), name)
+
+def is_vitals_dataset(path):
+    """Whether `path` is a Parquet dataset written by this module"""
+    return bool(path) and os.path.isfile(os.path.join(path, MANIFEST_NAME))
+
+def read_manifest(path):
+    with open(os.path.join(path, MANIFEST_NAME)) as f:
+        return json.load(f)
+
+def write_manifest(path, manifest):
+    """Replace the manifest atomically so readers never see a half-written file"""
+    target = os.path.join(path, MANIFEST_NAME)
+    temp = f"{target}.{uuid.uuid4().hex}.tmp"
+    with open(temp, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp, target)
+
+def manifest_hash(parts):
+    """Content hash of a dataset made of `parts`, in order"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part['sha256'].encode())
+    return digest.hexdigest()
+
+def normalize_vitals_frame(df):
+    """Give a chunk of readings the store's column types so every part shares one schema"""
+    df = df.copy()
+    for column in df.columns:
+        if column == 'Timestamp':
+            df[column] = pd.to_datetime(df[column])
+        elif column in INTEGER_COLUMNS and pd.api.types.is_integer_dtype(df[column]):
+            df[column] = df[column].astype('int64')
+        elif pd.api.types.is_numeric_dtype(df[column]) and not pd.api.types.is_bool_dtype(df[column]):
+            df[column] = df[column].astype('float64')
+    return df
+
+def append_vitals(path, df, default_patient_id=None):
+    """
+    Append a chunk of readings to the dataset at `path`, creating it if needed.
+
+    Rows without a 'Patient ID' column are filed under `default_patient_id`.
+    Returns the updated manifest.
+    """
+    os.makedirs(path, exist_ok=True)
+    manifest = read_manifest(path) if is_vitals_dataset(path) else {'rows': 0, 'parts': [], 'columns': []}
+    if df.empty:
+        if not is_vitals_dataset(path):
+            manifest['content_hash'] = manifest_hash(manifest['parts'])
+            write_manifest(path, manifest)
+        return manifest
+
+    df = normalize_vitals_frame(df).reset_index(drop=True)
+    part_hash = hashlib.sha256(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes()).hexdigest()
+
+    df[ROW_NUMBER] = pd.RangeIndex(manifest['rows'], manifest['rows'] + len(df), dtype='int64')
+    if 'Patient ID' in df.columns:
+        df['patient_id'] = df['Patient ID'].astype('Int64')
+    else:
+        df['patient_id'] = pd.array([default_patient_id] * len(df), dtype='Int64')
+    if 'Timestamp' in df.columns:
+        df['date'] = df['Timestamp'].dt.strftime('%Y-%m-%d').astype('string')
+    else:
+        df['date'] = pd.array([None] * len(df), dtype='string')
+
+    part_id = uuid.uuid4().hex
+    ds.write_dataset(
+        pa.Table.from_pandas(df, preserve_index=False),
+        path,
+        format='parquet',
+        partitioning=PARTITIONING,
+        basename_template=f"part-{part_id}-{{i}}.parquet",
+        existing_data_behavior='overwrite_or_ignore',
+    )
+
+    update_rollups(path, df)
+    previous_hash = manifest.get('content_hash') if manifest['rows'] else None
+    manifest['parts'].append({'id': part_id, 'sha256': part_hash, 'rows': len(df)})
+    manifest['rows'] += len(df)
+    manifest['columns'] = manifest['columns'] or [c for c in df.columns if c not in HELPER_COLUMNS]
+    manifest['content_hash'] = manifest_hash(manifest['parts'])
+    update_population_stats(path, df, previous_hash, manifest['content_hash'])
+    write_manifest(path, manifest)
+    return manifest
+
+def convert_csv_to_dataset(csv_path, path, default_patient_id=None, chunk_rows=None):
+    """Stream a device CSV into a new Parquet dataset and return its manifest"""
+    chunk_rows = chunk_rows or getattr(settings, 'VITALS_CSV_CHUNK_ROWS', 100000)
+    manifest = None
+    with pd.read_csv(csv_path, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            manifest = append_vitals(path, chunk, default_patient_id)
+    if manifest is None:
+        manifest = append_vitals(path, pd.DataFrame(), default_patient_id)
+    print(f"Converted {csv_path} to {path} ({manifest['rows']} rows)")
+    return manifest
+
+def rollup_path(path, resolution):
+    return os.path.join(path, ROLLUP_DIR, f'{resolution}.parquet')
+
+def rollup_buckets(df, resolution):
+    """Per-patient min/max/sum/count of each vital in `resolution` buckets of one chunk"""
+    vitals = [v for v in ROLLUP_VITALS if v in df.columns]
+    buckets = df['Timestamp'].dt.floor(pd.Timedelta(seconds=ROLLUP_RESOLUTIONS[resolution]))
+    grouped = df.groupby([df['patient_id'].rename('patient_id'), buckets.rename('Timestamp')])[vitals]
+    rollup = grouped.agg(list(ROLLUP_STATS))
+    rollup.columns = [f'{vital} {stat}' for vital, stat in rollup.columns]
+    return rollup.reset_index()
+
+def merge_rollups(frames):
+    """Combine partial rollups that may cover the same buckets"""
+    rollup = pd.concat(frames, ignore_index=True)
+    how = {column: ROLLUP_STATS[column.rsplit(' ', 1)[1]]
+           for column in rollup.columns if column not in ('patient_id', 'Timestamp')}
+    return rollup.groupby(['patient_id', 'Timestamp'], as_index=False).agg(how)
+
+def update_rollups(path, df):
+    """Fold a chunk being appended into the dataset's rollups"""
+    if 'Timestamp' not in df.columns or not any(v in df.columns for v in ROLLUP_VITALS):
+        return
+    os.makedirs(os.path.join(path, ROLLUP_DIR), exist_ok=True)
+    for resolution in ROLLUP_RESOLUTIONS:
+        target = rollup_path(path, resolution)
+        frames = [rollup_buckets(df, resolution)]
+        if os.path.exists(target):
+            frames.insert(0, pd.read_parquet(target))
+        temp = f"{target}.{uuid.uuid4().hex}.tmp"
+        merge_rollups(frames).to_parquet(temp, index=False)
+        os.replace(temp, target)
+
+def has_rollups(path):
+    return is_vitals_dataset(path) and os.path.exists(rollup_path(path, next(iter(ROLLUP_RESOLUTIONS))))
+
+def finish_rollups(rollup):
+    """Turn stored partial aggregates into 'Patient ID', 'Timestamp', '<vital>' (mean) and '<vital> min/max/count'"""
+    rollup = rollup.rename(columns={'patient_id': 'Patient ID'})
+    for vital in ROLLUP_VITALS:
+        if f'{vital} sum' in rollup.columns:
+            rollup[vital] = rollup[f'{vital} sum'] / rollup[f'{vital} count']
+            rollup = rollup.drop(columns=[f'{vital} sum'])
+    return rollup
+
+def read_rollups(path, resolution, patient_id=None, start_time=None, end_time=None):
+    """
+    Rollup buckets of a dataset overlapping the window, sorted by patient and time.
+
+    Each bucket's 'Timestamp' is its start; the mean of each vital is under the
+    vital's own name so rollups can be plotted like raw readings.
+    """
+    filters = []
+    if patient_id is not None:
+        filters.append(('patient_id', '==', int(patient_id)))
+    if start_time is not None:
+        start = as_naive_timestamp(start_time).floor(pd.Timedelta(seconds=ROLLUP_RESOLUTIONS[resolution]))
+        filters.append(('Timestamp', '>=', start))
+    if end_time is not None:
+        filters.append(('Timestamp', '<=', as_naive_timestamp(end_time)))
+    rollup = pd.read_parquet(rollup_path(path, resolution), filters=filters or None)
+    return finish_rollups(rollup.sort_values(['patient_id', 'Timestamp'], ignore_index=True))
+
+def rollup_frame(df, resolution):
+    """Rollups of raw readings computed on the fly, for sources without stored rollups"""
+    df = df.assign(patient_id=df['Patient ID'])
+    return finish_rollups(merge_rollups([rollup_buckets(df, resolution)]))
+
+def pick_resolution(span_seconds, target_points):
+    """
+    Coarsest rollup that still gives about `target_points` points over the span.
+
+    Returns None when even 1-minute buckets would give too few, meaning raw readings
+    should be used.
+    """
+    for resolution, seconds in sorted(ROLLUP_RESOLUTIONS.items(), key=lambda item: -item[1]):
+        if span_seconds / seconds >= target_points / 2:
+            return resolution
+    return None
+
+def open_vitals_dataset(path):
+    return ds.dataset(path, format='parquet', partitioning=PARTITIONING)
+
+def as_naive_timestamp(value):
+    """Timestamps are stored naive (as recorded by the device); compare aware bounds in UTC"""
+    value = pd.to_datetime(value)
+    if value.tzinfo is not None:
+        value = value.tz_convert('UTC').tz_localize(None)
+    return value
+
+def vitals_filter(patient_id=None, start_time=None, end_time=None):
+    """Arrow filter over partitions and columns for a patient and/or time window"""
+    expression = None
+
+    def combine(condition):
+        nonlocal expression
+        expression = condition if expression is None else expression & condition
+
+    if patient_id is not None:
+        combine(ds.field('patient_id') == int(patient_id))
+    if start_time is not None:
+        start = as_naive_timestamp(start_time)
+        combine(ds.field('date') >= start.strftime('%Y-%m-%d'))
+        combine(ds.field('Timestamp') >= pa.scalar(start))
+    if end_time is not None:
+        end = as_naive_timestamp(end_time)
+        combine(ds.field('date') <= end.strftime('%Y-%m-%d'))
+        combine(ds.field('Timestamp') <= pa.scalar(end))
+    return expression
+
+def _dataset_frame(dataset, columns, expression):
+    """Read matching rows in upload order, without the store's helper columns"""
+    if columns is None:
+        wanted = [name for name in dataset.schema.names if name not in HELPER_COLUMNS]
+    else:
+        wanted = [name for name in columns if name in dataset.schema.names]
+    table = dataset.to_table(columns=wanted + [ROW_NUMBER], filter=expression)
+    df = table.to_pandas()
+    df = df.sort_values(ROW_NUMBER, kind='stable').drop(columns=[ROW_NUMBER])
+    return df.set_index(pd.RangeIndex(len(df)))
+
+def _read_csv(path, columns, patient_id, start_time, end_time):
+    """Legacy CSV uploads: stream the file and keep only the matching rows"""
+    usecols = None
+    if columns is not None:
+        usecols = lambda name: name in set(columns) | {'Patient ID', 'Timestamp'}
+    chunk_rows = getattr(settings, 'VITALS_CSV_CHUNK_ROWS', 100000)
+
+    frames = []
+    with pd.read_csv(path, usecols=usecols, chunksize=chunk_rows) as reader:
+        for chunk in reader:
+            if 'Timestamp' in chunk.columns:
+                chunk['Timestamp'] = pd.to_datetime(chunk['Timestamp'])
+            if patient_id is not None:
+                chunk = chunk[chunk['Patient ID'] == int(patient_id)]
+            if start_time is not None:
+                chunk = chunk[chunk['Timestamp'] >= as_naive_timestamp(start_time)]
+            if end_time is not None:
+                chunk = chunk[chunk['Timestamp'] <= as_naive_timestamp(end_time)]
+            frames.append(chunk)
+
+    data = pd.concat(frames) if frames else pd.read_csv(path, nrows=0, usecols=usecols)
+    if columns is not None:
+        data = data[[name for name in columns if name in data.columns]]
+    return data
+
+def read_vitals(path, columns=None, patient_id=None, start_time=None, end_time=None):
+    """
+    Read vital signs from a dataset (or legacy CSV) as a DataFrame in upload order.
+
+    Only `columns` are read when given. `patient_id`, `start_time` and `end_time`
+    (inclusive) are applied at the storage level before rows reach pandas.
+    """
+    if not is_vitals_dataset(path):
+        return _read_csv(path, columns, patient_id, start_time, end_time)
+    dataset = open_vitals_dataset(path)
+    return _dataset_frame(dataset, columns, vitals_filter(patient_id, start_time, end_time))
+
+def iter_vitals_chunks(path, chunk_rows, start_row=0, columns=None):
+    """Yield the dataset's readings from `start_row` on, in upload order, `chunk_rows` at a time"""
+    total_rows = read_manifest(path)['rows']
+    dataset = open_vitals_dataset(path)
+    for first in range(start_row, total_rows, chunk_rows):
+        window = (ds.field(ROW_NUMBER) >= first) & (ds.field(ROW_NUMBER) < first + chunk_rows)
+        chunk = _dataset_frame(dataset, columns, window)
+        if len(chunk):
+            yield chunk.set_index(pd.RangeIndex(first, first + len(chunk)))
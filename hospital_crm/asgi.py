@@ -13,4 +13,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_crm.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Load the vitals model before the first upload
+from hospital.model_registry import warm_scoring_model_on_startup  # noqa: E402
+
+warm_scoring_model_on_startup()
+
+# Live event streams are served outside Django's per-request thread
+from hospital.streams import live_streams  # noqa: E402
+
+application = live_streams(django_application)
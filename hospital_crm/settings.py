@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -142,3 +143,69 @@ CSRF_COOKIE_SAMESITE = 'Lax'
 SESSION_COOKIE_SECURE = False  # Set to True in production with HTTPS
 SESSION_COOKIE_HTTPONLY = True
 SESSION_COOKIE_SAMESITE = 'Lax'
+
+# Vitals risk model
+VITALS_MODEL_PATH = BASE_DIR / 'hospital' / 'ml_models' / 'vitals-model.pkl'
+# NumPy export of the model (manage.py export_vitals_model), scored without sklearn
+VITALS_COMPILED_MODEL_PATH = BASE_DIR / 'hospital' / 'ml_models' / 'vitals-model.npz'
+# Load the model when the web server or a vitals worker starts, not on the first upload
+VITALS_MODEL_WARM_ON_STARTUP = True
+
+# Device CSVs are read this many rows at a time so memory does not grow with file length
+VITALS_CSV_CHUNK_ROWS = 100000
+
+# Uploaded device CSVs are converted into Parquet datasets under this directory
+VITALS_STORE_ROOT = BASE_DIR / 'vitals_store'
+
+# Time series plots use the coarsest rollup that still gives about this many points
+VITALS_PLOT_TARGET_POINTS = 1000
+# How long series are reduced: 'rollup' buckets, 'lttb' on raw readings, or 'none'
+VITALS_PLOT_DOWNSAMPLE = 'rollup'
+# Payload format when a request doesn't ask for one: 'json' strings or 'binary' typed arrays
+VITALS_PLOT_PAYLOAD_FORMAT = 'json'
+# Most reading times returned by one page of the timestamps endpoint
+VITALS_TIMESTAMPS_PAGE_MAX = 10000
+
+# Memory budget for parsed vital signs frames kept between visualization requests
+VITALS_FRAME_CACHE_BYTES = 256 * 1024 * 1024
+
+# Rendered plot JSON is cached in memory (up to this many bytes) and on disk
+VITALS_PLOT_CACHE_BYTES = 64 * 1024 * 1024
+VITALS_PLOT_CACHE_DIR = BASE_DIR / 'plot_cache'
+
+# Bearer tokens monitors use to push live readings (comma-separated in the environment)
+VITALS_TELEMETRY_TOKENS = [token for token in os.environ.get('VITALS_TELEMETRY_TOKENS', '').split(',') if token]
+# Live readings are scored every this many seconds, or once an issue has this many waiting
+VITALS_TELEMETRY_FLUSH_SECONDS = 1.0
+VITALS_TELEMETRY_BATCH_ROWS = 5000
+# Scored readings are appended to the issue's dataset this often, as one part
+VITALS_TELEMETRY_PERSIST_SECONDS = 10.0
+# Readings waiting to be scored before monitors are told to retry (503)
+VITALS_TELEMETRY_MAX_BUFFERED_ROWS = 200000
+# Readings per issue kept in memory for the live dashboard
+VITALS_LIVE_READINGS = 300
+# Events queued per live stream before further readings are sent as one rollup
+VITALS_STREAM_QUEUE_EVENTS = 100
+# Seconds between keepalive comments on an idle stream
+VITALS_STREAM_KEEPALIVE_SECONDS = 15
+# Alerts written per INSERT when a file's alerts are saved together
+VITALS_ALERT_BATCH_SIZE = 500
+
+# Serve a patient's last AI medical summary while a new one is generated in the background
+MEDICAL_SUMMARY_STALE_WHILE_REVALIDATE = True
+# Seconds before a failed background summary refresh is tried again
+MEDICAL_SUMMARY_RETRY_SECONDS = 60
+
+# Gemini calls; the API key comes from GEMINI_API_KEY in the environment or .env
+GEMINI_MODEL = 'gemini-2.0-pro-exp-02-05'
+# Point at `manage.py run_llm_stub` to test without the real API
+GEMINI_API_BASE_URL = os.environ.get('GEMINI_API_BASE_URL', 'https://generativelanguage.googleapis.com')
+# Seconds a page waits for Gemini before using its fallback
+LLM_TIMEOUT_SECONDS = 8.0
+# Gemini calls running at once, and waiting beyond those before new ones are refused
+LLM_MAX_WORKERS = 4
+LLM_MAX_PENDING = 16
+# Best-ranked doctors sent to Gemini for recommendations; 0 sends every doctor
+AI_RECOMMENDATION_CANDIDATES = 10
+# Seconds between full reloads of the in-memory doctor index used by simulated recommendations
+DOCTOR_INDEX_RELOAD_SECONDS = 300
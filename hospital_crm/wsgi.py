@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hospital_crm.settings')
 
 application = get_wsgi_application()
+
+# Load the vitals model before the first upload
+from hospital.model_registry import warm_scoring_model_on_startup  # noqa: E402
+
+warm_scoring_model_on_startup()